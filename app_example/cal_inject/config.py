@@ -5,12 +5,37 @@ class Config:
         try:
             with open(config_file, "r") as fd:
                 self.config = json.load(fd)
-                return self.config
-        except:
-            print("test case file parse failed")
+        except (OSError, ValueError) as e:
+            print(f"test case file parse failed: {e}")
             return None
+        if not isinstance(self.config, list):
+            print("test case file parse failed: expected a list of cases")
+            return None
+        self._build_index()
+        return self.config
+
+    def _build_index(self):
+        """
+        Build request bytes -> (response hex, response bytes) table
+        A malformed entry is reported and skipped, the others are still loaded.
+        """
+        self.case_table = {}
+        for index, case in enumerate(self.config):
+            try:
+                req = bytes.fromhex(case["req"])
+                if req not in self.case_table:  # First definition wins, same as the old linear scan
+                    self.case_table[req] = (case["res"], bytes.fromhex(case["res"]))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"test case {index} skipped: {e!r} in {case}")
+
     def find_case(self, req):
-        for case in self.config:
-            if case["req"].upper() == req:
-                return case["res"]
-        return None
+        try:
+            entry = self.case_table.get(bytes.fromhex(req))
+        except ValueError:
+            return None
+        return entry[0] if entry else None
+
+    def find_response(self, payload):
+        """Look up the pre-decoded response bytes for a raw request payload"""
+        entry = self.case_table.get(bytes(payload))
+        return entry[1] if entry else None
@@ -3,13 +3,88 @@ class Controller:
     ui: object
     task: Task
     cnt: int = 0
+    refresh_ms: int = 500
     def init(self, ui):
         self.ui = ui
         # TODO 组件初始化 赋值操作
         self.task = Task(self)
+        self.shown_snapshot = None
+        self.id_rows = {}
+        # Statistics are collected off the Tk thread and picked up here
+        self.ui.after(self.refresh_ms, self.refresh)
         
     def show_edit(self,evt):
         self.cnt += 1
     
     def set_spinbox(self,num):
         self.ui.spinbox.set(num)
+
+    def toggle_connect(self, evt):
+        if self.task.running:
+            self.task.stop()
+            self.ui.connect_button.configure(text="Connect")
+            self.ui.connect_status.configure(text="Disconnected")
+            return
+        try:
+            self.task.start(self.ui.interface_var.get(), self.ui.channel_var.get(), self.ui.bitrate_var.get())
+        except Exception as e:
+            self.ui.connect_status.configure(text=f"Failed: {e}")
+            return
+        self.shown_snapshot = None
+        self.id_rows = {}
+        self.ui.id_tree.delete(*self.ui.id_tree.get_children())
+        self.ui.connect_button.configure(text="Disconnect")
+        self.ui.connect_status.configure(text="Connected")
+
+    def close(self):
+        self.task.stop()
+        self.ui.destroy()
+
+    def refresh(self):
+        """Show the latest statistics snapshot, runs on the Tk thread"""
+        snapshot = self.task.snapshot
+        if snapshot is not None and snapshot is not self.shown_snapshot:
+            self.shown_snapshot = snapshot
+            self.show_snapshot(snapshot)
+        self.ui.after(self.refresh_ms, self.refresh)
+
+    def show_snapshot(self, snapshot):
+        labels = self.ui.stat_labels
+        labels["frames"].configure(text=f"{snapshot['frames_per_s']:.0f} ({snapshot['total_frames']} total)")
+        labels["load"].configure(text=f"{snapshot['bus_load']:.1f} %")
+        labels["errors"].configure(text=f"{snapshot['error_frames']} ({snapshot['errors_per_s']:.1f}/s)")
+        labels["isotp"].configure(text=f"{snapshot['isotp_kb_per_s']:.1f} KB/s, "
+                                       f"{snapshot['isotp_transfers_per_s']:.1f} transfers/s")
+        self.ui.load_progress.configure(value=min(snapshot['bus_load'], 100.0))
+        self.draw_history(snapshot['load_history'])
+
+        tree = self.ui.id_tree
+        for arbitration_id, extended, rate, count in snapshot['ids']:
+            key = (arbitration_id, extended)
+            values = (f"{rate:.1f}", count)
+            row = self.id_rows.get(key)
+            if row is None:
+                if arbitration_id is None:
+                    text = "Other"
+                else:
+                    text = f"{arbitration_id:08X}x" if extended else f"{arbitration_id:03X}"
+                # Keep the rows sorted by ID, "Other" last
+                index = sum(1 for other in self.id_rows if other[0] is not None and (arbitration_id is None or other < key))
+                self.id_rows[key] = [tree.insert("", index, text=text, values=values), values]
+            elif row[1] != values:
+                tree.item(row[0], values=values)
+                row[1] = values
+
+    def draw_history(self, history):
+        """Bus load of the last samples as a line, 0-100 %"""
+        canvas = self.ui.load_canvas
+        canvas.delete("all")
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        if len(history) < 2 or width < 2 or height < 2:
+            return
+        step = width / (len(history) - 1)
+        points = []
+        for i, load in enumerate(history):
+            points.extend((i * step, height - 1 - min(load, 100.0) / 100.0 * (height - 2)))
+        canvas.create_line(*points, fill="#005fb8", width=2)
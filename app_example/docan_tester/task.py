@@ -1,16 +1,182 @@
 import threading
-from time import sleep
+import time
+from array import array
+
+import can
+
+MAX_IDS = 512       # IDs tracked one by one, further IDs are counted together
+HISTORY = 120       # Bus load samples kept for the history plot
+
+def is_diagnostic_id(arbitration_id):
+    """Default ISO-TP ID range: 0x700-0x7FF and the 29-bit 0x18DA/0x18DB diagnostic IDs"""
+    return 0x700 <= arbitration_id <= 0x7FF or (arbitration_id >> 16) in (0x18DA, 0x18DB)
+
+def frame_bits(msg, bitrate, data_bitrate):
+    """
+    Frame length in nominal bit times, without stuff bits.
+    CAN FD frames with bitrate switch count their data phase at the data bitrate.
+    """
+    length = len(msg.data)
+    if not msg.is_fd:
+        return (67 if msg.is_extended_id else 47) + 8 * length
+    arbitration = (48 if msg.is_extended_id else 29) + 13     # Header plus ACK, EOF and IFS
+    data_phase = 8 * length + (28 if length > 16 else 24)     # Data, CRC and stuff count
+    if msg.bitrate_switch and data_bitrate:
+        data_phase = data_phase * bitrate / data_bitrate
+    return arbitration + data_phase
+
+class BusStats(can.Listener):
+    """
+    Counts the frames of a bus on the notifier thread.
+    Per-ID counters live in fixed-size arrays indexed by a slot per ID; sample() turns the
+    counters into rates, so the receive path only does a few increments per frame.
+    """
+    def __init__(self, bitrate=500000, data_bitrate=2000000, isotp_filter=is_diagnostic_id):
+        """
+        Initialize collector
+        :param bitrate: Nominal bitrate, used for the bus load
+        :param data_bitrate: CAN FD data phase bitrate
+        :param isotp_filter: Function telling which IDs carry ISO-TP frames
+        """
+        self.bitrate = bitrate
+        self.data_bitrate = data_bitrate
+        self.isotp_filter = isotp_filter
+
+        # Written by the notifier thread only
+        self.slots = {}                                 # (arbitration ID, extended) -> slot
+        self.slot_ids = []                              # slot -> (arbitration ID, extended)
+        self.counts = array('Q', [0]) * (MAX_IDS + 1)   # The last slot collects the other IDs
+        self.frames = 0
+        self.bits = 0.0
+        self.error_frames = 0
+        self.isotp_bytes = 0
+        self.isotp_transfers = 0
+
+        # Written by the sampling thread only
+        self.last_counts = array('Q', [0]) * (MAX_IDS + 1)
+        self.last_totals = (0, 0.0, 0, 0, 0)
+        self.load_history = array('d', [0.0]) * HISTORY
+        self.samples = 0
+
+    def on_message_received(self, msg):
+        if msg.is_error_frame:
+            self.error_frames += 1
+            return
+        self.frames += 1
+        self.bits += frame_bits(msg, self.bitrate, self.data_bitrate)
+
+        key = (msg.arbitration_id, msg.is_extended_id)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = len(self.slot_ids) if len(self.slot_ids) < MAX_IDS else MAX_IDS
+            if slot < MAX_IDS:
+                self.slots[key] = slot
+                self.slot_ids.append(key)
+        self.counts[slot] += 1
+
+        if msg.data and self.isotp_filter(msg.arbitration_id):
+            self._count_isotp(msg.data)
+
+    def _count_isotp(self, data):
+        """Payload bytes and started transfers from the PCI of one frame, normal addressing"""
+        pci = data[0] >> 4
+        if pci == 0:        # Single frame, CAN FD escape with length in the second byte
+            length = data[0] & 0x0F
+            self.isotp_bytes += length if length else (data[1] if len(data) > 1 else 0)
+            self.isotp_transfers += 1
+        elif pci == 1:      # First frame
+            self.isotp_bytes += len(data) - 2
+            self.isotp_transfers += 1
+        elif pci == 2:      # Consecutive frame, includes the padding of the last one
+            self.isotp_bytes += len(data) - 1
+
+    def sample(self, elapsed):
+        """
+        Turn the counters since the last call into rates
+        :param elapsed: Seconds since the last call
+        :return: Snapshot dict, safe to hand to another thread
+        """
+        totals = (self.frames, self.bits, self.error_frames, self.isotp_bytes, self.isotp_transfers)
+        frames, bits, errors, isotp_bytes, transfers = (now - last for now, last in zip(totals, self.last_totals))
+        self.last_totals = totals
+
+        counts = array('Q', self.counts)
+        ids = []
+        for slot, key in enumerate(self.slot_ids[:MAX_IDS]):
+            ids.append((key[0], key[1], (counts[slot] - self.last_counts[slot]) / elapsed, counts[slot]))
+        if counts[MAX_IDS]:
+            ids.append((None, False, (counts[MAX_IDS] - self.last_counts[MAX_IDS]) / elapsed, counts[MAX_IDS]))
+        self.last_counts = counts
+
+        load = 100.0 * bits / elapsed / self.bitrate
+        position = self.samples % HISTORY
+        self.load_history[position] = load
+        self.samples += 1
+        # Oldest sample first
+        start = self.samples % HISTORY if self.samples >= HISTORY else 0
+        count = min(self.samples, HISTORY)
+        history = [self.load_history[(start + i) % HISTORY] for i in range(count)]
+
+        return {
+            'frames_per_s': frames / elapsed,
+            'bus_load': load,
+            'total_frames': totals[0],
+            'error_frames': totals[2],
+            'errors_per_s': errors / elapsed,
+            'isotp_kb_per_s': isotp_bytes / 1024 / elapsed,
+            'isotp_transfers_per_s': transfers / elapsed,
+            'ids': ids,
+            'load_history': history,
+        }
 
 class Task:
-    def __init__(self, ctrl):
-        self.thread = threading.Thread(target=self.run, args=(ctrl,))
-        self.thread.setDaemon(True)
+    """
+    Background side of the dashboard: owns the bus and the notifier, and a sampling thread
+    that publishes a statistics snapshot every interval. The UI only reads `snapshot` from
+    its after() timer, no widget is touched from these threads.
+    """
+    def __init__(self, ctrl, interval=0.5):
+        self.ctrl = ctrl
+        self.interval = interval
+        self.bus = None
+        self.notifier = None
+        self.stats = None
+        self.snapshot = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, interface, channel, bitrate, fd=False, data_bitrate=2000000):
+        """Open the bus and start collecting"""
+        self.stop()
+        kwargs = {'fd': True, 'data_bitrate': data_bitrate} if fd else {}
+        self.bus = can.Bus(channel=channel, interface=interface, bitrate=bitrate, **kwargs)
+        self.stats = BusStats(bitrate, data_bitrate)
+        self.notifier = can.Notifier(self.bus, [self.stats])
+        self.snapshot = None
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
         self.thread.start()
 
-    def run(self, ctrl):
-        while True:
-            # ctrl.set_spinbox(ctrl.cnt)
-            a = ctrl.ui.spinbox.get()
-            ctrl.ui.spinbox.set(float(a) + 1)
-            sleep(1)
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.bus is not None:
+            self.bus.shutdown()
+            self.bus = None
 
+    def run(self):
+        last = time.perf_counter()
+        while not self.stop_event.wait(self.interval):
+            now = time.perf_counter()
+            # Replacing the reference is atomic, the UI sees either the old or the new snapshot
+            self.snapshot = self.stats.sample(now - last)
+            last = now
@@ -282,9 +282,81 @@ class WinGUI(tk.Tk):
         )
         self.label.grid(row=1, column=0, pady=10, columnspan=2)
 
-        # Tab #2
-        self.tab_2 = ttk.Frame(self.notebook)
-        self.notebook.add(self.tab_2, text="Tab 2")
+        # Tab #2: bus dashboard
+        self.tab_2 = ttk.Frame(self.notebook, padding=10)
+        self.tab_2.columnconfigure(index=0, weight=1)
+        self.tab_2.rowconfigure(index=3, weight=1)
+        self.notebook.add(self.tab_2, text="Bus")
+        self.notebook.select(self.tab_2)
+
+        # Connection
+        self.interface_var = tk.StringVar(value="pcan")
+        self.channel_var = tk.StringVar(value="PCAN_USBBUS1")
+        self.bitrate_var = tk.IntVar(value=500000)
+        self.connect_frame = ttk.Frame(self.tab_2)
+        self.connect_frame.grid(row=0, column=0, pady=(0, 10), sticky="ew")
+        self.interface_combo = ttk.Combobox(
+            self.connect_frame,
+            textvariable=self.interface_var,
+            values=["pcan", "vector", "socketcan", "virtual"],
+            width=10,
+        )
+        self.interface_combo.grid(row=0, column=0, padx=5, sticky="ew")
+        self.channel_entry = ttk.Entry(self.connect_frame, textvariable=self.channel_var, width=16)
+        self.channel_entry.grid(row=0, column=1, padx=5, sticky="ew")
+        self.bitrate_combo = ttk.Combobox(
+            self.connect_frame,
+            textvariable=self.bitrate_var,
+            values=[125000, 250000, 500000, 1000000],
+            width=10,
+        )
+        self.bitrate_combo.grid(row=0, column=2, padx=5, sticky="ew")
+        self.connect_button = ttk.Button(
+            self.connect_frame, text="Connect", style="Accent.TButton"
+        )
+        self.connect_button.grid(row=0, column=3, padx=5, sticky="ew")
+        self.connect_status = ttk.Label(self.connect_frame, text="Disconnected")
+        self.connect_status.grid(row=0, column=4, padx=5, sticky="w")
+
+        # Statistics
+        self.stats_frame = ttk.LabelFrame(self.tab_2, text="Statistics", padding=(20, 10))
+        self.stats_frame.grid(row=1, column=0, pady=(0, 10), sticky="ew")
+        self.stats_frame.columnconfigure(index=1, weight=1)
+        self.stat_labels = {}
+        for row, (key, text) in enumerate(
+            [
+                ("frames", "Frames/s"),
+                ("load", "Bus load"),
+                ("errors", "Error frames"),
+                ("isotp", "ISO-TP"),
+            ]
+        ):
+            ttk.Label(self.stats_frame, text=text).grid(row=row, column=0, padx=5, pady=2, sticky="w")
+            self.stat_labels[key] = ttk.Label(self.stats_frame, text="-")
+            self.stat_labels[key].grid(row=row, column=1, padx=5, pady=2, sticky="w")
+        self.load_progress = ttk.Progressbar(
+            self.stats_frame, value=0, maximum=100, mode="determinate"
+        )
+        self.load_progress.grid(row=1, column=2, padx=5, pady=2, sticky="ew")
+
+        # Bus load history
+        self.load_canvas = tk.Canvas(self.tab_2, height=80, highlightthickness=0)
+        self.load_canvas.grid(row=2, column=0, pady=(0, 10), sticky="ew")
+
+        # Frames per ID
+        self.id_tree = ttk.Treeview(
+            self.tab_2,
+            selectmode="none",
+            columns=("rate", "count"),
+            height=8,
+        )
+        self.id_tree.column("#0", anchor="w", width=120)
+        self.id_tree.column("rate", anchor="e", width=100)
+        self.id_tree.column("count", anchor="e", width=100)
+        self.id_tree.heading("#0", text="ID", anchor="center")
+        self.id_tree.heading("rate", text="Frames/s", anchor="center")
+        self.id_tree.heading("count", text="Count", anchor="center")
+        self.id_tree.grid(row=3, column=0, sticky="nsew")
 
         # Tab #3
         self.tab_3 = ttk.Frame(self.notebook)
@@ -304,6 +376,8 @@ class Win(WinGUI):
 
     def __event_bind(self):
         self.button.bind('<Button-1>',self.ctl.show_edit)
+        self.connect_button.bind('<Button-1>',self.ctl.toggle_connect)
+        self.protocol("WM_DELETE_WINDOW", self.ctl.close)
         pass
     def __style_config(self):
         pass
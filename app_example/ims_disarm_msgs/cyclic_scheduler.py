@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+import can
+
+class CyclicMessage:
+    """One cyclic CAN ID, sent through a list of phases"""
+    def __init__(self, can_id, phases, is_extended_id=False, is_fd=False, name=None, on_phase=None):
+        """
+        Initialize cyclic message
+        :param can_id: Arbitration ID
+        :param phases: List of (data, interval_ms, count) tuples, count None repeats the phase forever.
+                       Each frame is followed by the interval of its own phase, so the first frame
+                       of a phase comes one interval of the previous phase after its last frame.
+                       The message stops by itself after the last phase with a count.
+        :param name: Label for statistics, defaults to the ID
+        :param on_phase: Called as on_phase(message, phase_index) when a new phase begins
+        """
+        self.can_id = can_id
+        self.is_extended_id = is_extended_id
+        self.is_fd = is_fd
+        self.name = name or f"0x{can_id:03X}"
+        self.on_phase = on_phase
+        self.active = False
+        self.generation = 0
+        self.deadline = 0.0
+        self.set_phases(phases)
+        self.reset_stats()
+
+    def set_phases(self, phases):
+        """Replace the phase list, the next frame starts phase 0"""
+        if not phases:
+            raise ValueError(f"{self.name}: at least one phase is required")
+        compiled = []
+        for data, interval, count in phases:
+            if interval <= 0:
+                raise ValueError(f"{self.name}: invalid interval {interval}")
+            # One pre-built message per phase, resent unchanged every cycle
+            msg = can.Message(arbitration_id=self.can_id, data=data,
+                              is_extended_id=self.is_extended_id, is_fd=self.is_fd)
+            compiled.append((msg, interval / 1000.0, count))
+        self.phases = compiled
+        self.phase_index = 0
+        self.phase_sent = 0
+
+    def reset_stats(self):
+        """Clear frame counter and period statistics"""
+        self.sent = 0
+        self.overruns = 0
+        self.last_sent = None
+        self.last_interval = None
+        self.periods = 0
+        self.error_sum = 0.0
+        self.error_sq_sum = 0.0
+        self.error_max = 0.0
+
+    def _record(self, now, interval):
+        """Record the measured period against the nominal interval of the previous frame"""
+        if self.last_sent is not None:
+            error = (now - self.last_sent) - self.last_interval
+            self.periods += 1
+            self.error_sum += error
+            self.error_sq_sum += error * error
+            if abs(error) > self.error_max:
+                self.error_max = abs(error)
+        self.last_sent = now
+        self.last_interval = interval
+
+    def _advance(self):
+        """
+        Count the frame just sent and move to the next phase when due
+        :return: Interval of the phase of the frame just sent in seconds, None when finished
+        """
+        _, interval, count = self.phases[self.phase_index]
+        self.sent += 1
+        self.phase_sent += 1
+        if count is not None and self.phase_sent >= count:
+            if self.phase_index + 1 >= len(self.phases):
+                return None
+            self.phase_index += 1
+            self.phase_sent = 0
+            if self.on_phase:
+                self.on_phase(self, self.phase_index)
+        return interval
+
+    def stats(self):
+        """
+        Period statistics
+        :return: dict, jitter values are measured period minus nominal interval in ms
+        """
+        mean = self.error_sum / self.periods if self.periods else 0.0
+        variance = self.error_sq_sum / self.periods - mean * mean if self.periods else 0.0
+        return {
+            'name': self.name,
+            'sent': self.sent,
+            'phase': self.phase_index,
+            'overruns': self.overruns,
+            'mean_error_ms': round(mean * 1000, 3),
+            'jitter_ms': round(math.sqrt(max(variance, 0.0)) * 1000, 3),
+            'max_error_ms': round(self.error_max * 1000, 3),
+        }
+
+class _Timer:
+    """One-shot callback sharing the scheduler heap, see CyclicScheduler.call_later"""
+    def __init__(self, callback):
+        self.callback = callback
+        self.active = True
+        self.generation = 0
+
+    def cancel(self):
+        self.active = False
+
+class CyclicScheduler:
+    """Sends any number of CyclicMessages from one thread, ordered by deadline in a heap"""
+    def __init__(self, bus, spin=0.0):
+        """
+        Initialize scheduler
+        :param bus: CAN bus instance
+        :param spin: Busy-wait this many seconds before each deadline instead of sleeping (0 = always sleep)
+        """
+        self.bus = bus
+        self.spin = spin
+        self.heap = []
+        self.sequence = itertools.count()
+        self.cond = threading.Condition()
+        self.messages = set()
+        self.running = False
+        self.thread = None
+        self.send_errors = 0
+
+    def start(self):
+        """Start the scheduler thread, add() does this on demand"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def shutdown(self):
+        """Stop all messages and the scheduler thread"""
+        with self.cond:
+            for message in self.messages:
+                message.active = False
+            self.messages.clear()
+            self.heap.clear()
+            self.running = False
+            self.cond.notify()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def add(self, message, delay=0.0):
+        """
+        Start sending a message
+        :param message: CyclicMessage, restarted from phase 0 if it was sent before
+        :param delay: Seconds until the first frame
+        """
+        self.start()
+        with self.cond:
+            message.generation += 1
+            message.active = True
+            message.phase_index = 0
+            message.phase_sent = 0
+            message.reset_stats()
+            message.deadline = time.perf_counter() + delay
+            self.messages.add(message)
+            heapq.heappush(self.heap, (message.deadline, next(self.sequence), message.generation, message))
+            self.cond.notify()
+        return message
+
+    def remove(self, message):
+        """Stop sending a message, its heap entry is dropped when it comes up"""
+        with self.cond:
+            message.active = False
+            message.generation += 1
+            self.messages.discard(message)
+
+    def change_phases(self, message, phases):
+        """Switch a running message to new phases without breaking its cycle"""
+        with self.cond:
+            message.set_phases(phases)
+
+    def call_later(self, delay, callback):
+        """
+        Run callback() on the scheduler thread after delay seconds
+        :return: Timer handle, call its cancel() to drop the callback
+        """
+        self.start()
+        timer = _Timer(callback)
+        with self.cond:
+            heapq.heappush(self.heap, (time.perf_counter() + delay, next(self.sequence), timer.generation, timer))
+            self.cond.notify()
+        return timer
+
+    def stats(self):
+        """Statistics of every active message"""
+        with self.cond:
+            return [message.stats() for message in self.messages]
+
+    def _run(self):
+        clock = time.perf_counter
+        while True:
+            with self.cond:
+                while self.running:
+                    if self.heap:
+                        delay = self.heap[0][0] - clock() - self.spin
+                        if delay <= 0:
+                            break
+                        self.cond.wait(delay)
+                    else:
+                        self.cond.wait()
+                if not self.running:
+                    return
+                deadline, _, generation, message = heapq.heappop(self.heap)
+                if generation != message.generation or not message.active:
+                    continue
+                if isinstance(message, _Timer):
+                    msg = None
+                else:
+                    msg = message.phases[message.phase_index][0]
+
+            if msg is None:
+                try:
+                    message.callback()
+                except Exception as e:
+                    print(f"[Error] Scheduled callback failed: {e}")
+                continue
+
+            while clock() < deadline:
+                pass
+            try:
+                self.bus.send(msg)
+            except can.CanError as e:
+                self.send_errors += 1
+                print(f"[Error] Failed to send message {message.name}: {e}")
+            now = clock()
+
+            with self.cond:
+                if generation != message.generation:
+                    continue        # Removed or restarted while sending
+                interval = message._advance()
+                message._record(now, message.phases[message.phase_index][1] if interval is None else interval)
+                if interval is None:
+                    message.active = False
+                    self.messages.discard(message)
+                    continue
+                # Next deadline follows the previous one, so sleep/send latency does not accumulate
+                message.deadline = deadline + interval
+                if now - message.deadline > interval:
+                    message.overruns += 1
+                    message.deadline = now
+                heapq.heappush(self.heap, (message.deadline, next(self.sequence), generation, message))
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def shared_scheduler(bus):
+    """Get the scheduler of a bus, created on first use"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(bus))
+        if scheduler is None or scheduler.bus is not bus:
+            scheduler = CyclicScheduler(bus)
+            _schedulers[id(bus)] = scheduler
+        return scheduler
@@ -0,0 +1,174 @@
+import math
+import threading
+import time
+
+import can
+
+from cyclic_scheduler import shared_scheduler
+
+def supports_offload(bus):
+    """
+    True when the interface transmits cyclic frames itself (e.g. SocketCAN BCM),
+    python-can's default implementation runs one Python thread per task instead
+    """
+    return type(bus)._send_periodic_internal is not can.BusABC._send_periodic_internal
+
+class _OffloadState:
+    __slots__ = ('task', 'interval', 'started', 'next_due', 'timer')
+
+    def __init__(self):
+        self.task = None
+        self.interval = None
+        self.started = None     # perf_counter() of the task's first frame
+        self.next_due = None    # perf_counter() of the next phase's first frame, None starts it at once
+        self.timer = None
+
+class CyclicTransmitter:
+    """
+    Drop-in front end of CyclicScheduler that hands cyclic frames to bus.send_periodic
+    when the interface supports it. Only phase switches run in Python: a data change
+    becomes task.modify_data(), an interval change restarts the task.
+    """
+    def __init__(self, bus, offload=None, scheduler=None):
+        """
+        Initialize transmitter
+        :param bus: CAN bus instance
+        :param offload: Force (True) or disable (False) send_periodic, None detects interface support
+        :param scheduler: Software scheduler for the fallback and the phase timers, shared per bus by default
+        """
+        self.bus = bus
+        self.scheduler = scheduler or shared_scheduler(bus)
+        self.offload = supports_offload(bus) if offload is None else offload
+        self.states = {}    # CyclicMessage -> _OffloadState
+        self.lock = threading.RLock()
+
+    def add(self, message, delay=0.0):
+        """
+        Start sending a message, see CyclicScheduler.add
+        Offloaded messages count their frames per completed phase.
+        """
+        if not self.offload:
+            return self.scheduler.add(message, delay)
+        with self.lock:
+            self._stop_task(message)
+            message.generation += 1
+            message.active = True
+            message.phase_index = 0
+            message.phase_sent = 0
+            message.reset_stats()
+            generation = message.generation
+            self.states[message] = _OffloadState()
+            if delay > 0:
+                self.states[message].timer = self.scheduler.call_later(delay, lambda: self._start_phase(message, generation))
+            else:
+                self._start_phase(message, generation)
+        return message
+
+    def remove(self, message):
+        """Stop sending a message"""
+        if not self.offload:
+            return self.scheduler.remove(message)
+        with self.lock:
+            message.generation += 1
+            message.active = False
+            self._stop_task(message)
+            self.states.pop(message, None)
+
+    def change_phases(self, message, phases):
+        """Switch a running message to new phases, keeping the cycle when the interval stays the same"""
+        if not self.offload:
+            return self.scheduler.change_phases(message, phases)
+        with self.lock:
+            message.set_phases(phases)
+            state = self.states.get(message)
+            if state is None or not message.active:
+                return
+            if state.timer:
+                state.timer.cancel()
+            state.next_due = None
+            message.generation += 1
+            self._start_phase(message, message.generation)
+
+    def stats(self):
+        """Software scheduler statistics plus one entry per offloaded message"""
+        stats = self.scheduler.stats()
+        with self.lock:
+            for message in self.states:
+                stats.append({'name': message.name, 'sent': message.sent, 'phase': message.phase_index, 'offloaded': True})
+        return stats
+
+    def shutdown(self):
+        """Stop every message, offloaded or not"""
+        with self.lock:
+            for message in list(self.states):
+                self.remove(message)
+        self.scheduler.shutdown()
+
+    def _stop_task(self, message):
+        state = self.states.get(message)
+        if state is None:
+            return
+        if state.timer:
+            state.timer.cancel()
+            state.timer = None
+        if state.task:
+            state.task.stop()
+            state.task = None
+
+    def _start_phase(self, message, generation):
+        with self.lock:
+            if generation != message.generation or not message.active:
+                return
+            msg, interval, count = message.phases[message.phase_index]
+            state = self.states[message]
+            now = time.perf_counter()
+            if state.task is not None and state.interval == interval and hasattr(state.task, 'modify_data'):
+                state.task.modify_data(msg)
+                # The task keeps its cycle, the new data goes out from its next frame on
+                first = state.started + math.ceil((now - state.started) / interval) * interval
+            else:
+                if state.task is not None:
+                    state.task.stop()
+                    state.task = None
+                if state.next_due is not None and state.next_due > now:
+                    # The last frame of the previous phase is followed by its own interval, as in CyclicScheduler
+                    state.timer = self.scheduler.call_later(state.next_due - now,
+                                                            lambda: self._start_phase(message, generation))
+                    state.next_due = None
+                    return
+                state.task = self.bus.send_periodic(msg, interval)
+                state.interval = interval
+                state.started = first = now
+            state.next_due = None
+            if count is not None:
+                # Switch half a period before frame count+1 is due, away from either send
+                due = first + (count - 0.5) * interval
+                state.next_due = first + count * interval
+                state.timer = self.scheduler.call_later(max(due - time.perf_counter(), 0),
+                                                        lambda: self._next_phase(message, generation))
+
+    def _next_phase(self, message, generation):
+        with self.lock:
+            if generation != message.generation or not message.active:
+                return
+            message.sent += message.phases[message.phase_index][2]
+            if message.phase_index + 1 >= len(message.phases):
+                self.remove(message)
+                return
+            message.phase_index += 1
+            message.phase_sent = 0
+            if message.on_phase:
+                message.on_phase(message, message.phase_index)
+            self._start_phase(message, generation)
+
+_transmitters = {}
+_transmitters_lock = threading.Lock()
+
+def shared_transmitter(bus):
+    """Get the transmitter of a bus, created on first use"""
+    with _transmitters_lock:
+        transmitter = _transmitters.get(id(bus))
+        if transmitter is None or transmitter.bus is not bus:
+            transmitter = CyclicTransmitter(bus)
+            _transmitters[id(bus)] = transmitter
+        return transmitter
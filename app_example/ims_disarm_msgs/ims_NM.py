@@ -14,6 +14,9 @@ import threading
 import time
 from collections import defaultdict
 
+from cyclic_scheduler import CyclicMessage
+from cyclic_tx import CyclicTransmitter
+
 can.rc['interface'] = 'vector'
 can.rc['bustype'] = 'vector'
 can.rc['channel'] = '0'
@@ -33,68 +36,52 @@ class CANTaskManager:
     def __init__(self):
         self.bus = Bus()
         self.tasks = defaultdict(dict)
-        self.lock = threading.Lock()
-
-    def periodic_send(self, can_id, interval, count=None):
-        def wrapper():
-            sent_count = 0
-            pattern_count = 0  # Counter for the second pattern in logic 2
-            while True:
-                with self.lock:
-                    task = self.tasks[can_id]
-                    if not task['active']:
-                        break
-
-                try:
-                    data = [0] * 8  # Default all zeros for 0x600
-                    if can_id == 0x391:
-                        if sent_count < 10:
-                            data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00]  # First 10 frames
-                        elif pattern_count < 10:
-                            data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x02, 0x00, 0x00]  # Next 10 frames for logic 2
-                            pattern_count += 1
-                        else:
-                            data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x00, 0x00, 0x00]  # Remaining frames
-
-                    msg = can.Message(
-                        arbitration_id=can_id,
-                        data=data,
-                        is_extended_id=False
-                    )
-                    self.bus.send(msg)
-                    # print(f"[Success] Sent CAN message: {msg}")
-
-                    sent_count += 1
-                    if can_id == 0x600 and count and sent_count >= count:
-                        with self.lock:
-                            self.tasks[can_id]['interval'] = 1000
-                            print(f"Switched CAN ID {hex(can_id)} to 1000ms interval")
-                
-                except Exception as e:
-                    print(f"[Error] Failed to send message: {e}")
-                
-                time.sleep(task['interval'] / 1000)
-
-        return wrapper
+        # Re-entrant: the logic 2 timing thread restarts 0x391 while holding it
+        self.lock = threading.RLock()
+        # Cyclic IDs go to bus.send_periodic where supported, otherwise to one scheduler thread
+        self.scheduler = CyclicTransmitter(self.bus)
+
+    def build_phases(self, can_id, interval, count=None):
+        """Phase list (data, interval, count) of one ID, see CyclicMessage"""
+        zeros = [0] * 8  # Default all zeros for 0x600
+        if can_id == 0x391:
+            return [
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00], interval, 10),    # First 10 frames
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x02, 0x00, 0x00], interval, 10),    # Next 10 frames for logic 2
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x00, 0x00, 0x00], interval, None)   # Remaining frames
+            ]
+        if can_id == 0x600 and count:
+            # The 1000 ms gap already follows frame `count`, which opens the second phase
+            if count == 1:
+                return [(zeros, 1000, None)]
+            return [(zeros, interval, count - 1), (zeros, 1000, None)]
+        return [(zeros, interval, None)]
+
+    def _on_phase(self, message, phase_index):
+        if message.can_id == 0x600:
+            print(f"Switched CAN ID {hex(message.can_id)} to 1000ms interval")
 
     def add_task(self, can_id, interval, count=None):
+        phases = self.build_phases(can_id, interval, count)
         with self.lock:
             if can_id in self.tasks:
-                self.tasks[can_id]['active'] = True
+                # Already running: switch the data/interval in place, keeping the cycle
                 self.tasks[can_id]['interval'] = interval
+                self.scheduler.change_phases(self.tasks[can_id]['message'], phases)
             else:
+                message = CyclicMessage(can_id, phases, on_phase=self._on_phase)
                 self.tasks[can_id] = {
                     'active': True,
                     'interval': interval,
-                    'thread': threading.Thread(target=self.periodic_send(can_id, interval, count))
+                    'message': message
                 }
-                self.tasks[can_id]['thread'].start()
+                self.scheduler.add(message)
 
     def stop_task(self, can_id):
         with self.lock:
             if can_id in self.tasks:
                 self.tasks[can_id]['active'] = False
-                self.tasks[can_id]['thread'].join()
+                self.scheduler.remove(self.tasks[can_id]['message'])
                 del self.tasks[can_id]
 
 
@@ -135,6 +122,7 @@ def input_handler(task_manager):
         elif cmd.lower() == 'q':
             for can_id in list(task_manager.tasks.keys()):
                 task_manager.stop_task(can_id)
+            task_manager.scheduler.shutdown()
             task_manager.bus.shutdown()
             print("Exiting...")
             break
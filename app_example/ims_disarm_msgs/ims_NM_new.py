@@ -14,6 +14,10 @@ import threading
 import time
 from collections import defaultdict
 
+from cyclic_scheduler import CyclicMessage
+from cyclic_tx import CyclicTransmitter
+from nm_scenario import ScenarioEngine
+
 # 配置日志（可选，用于调试）
 # logging.basicConfig(level=logging.DEBUG)
 
@@ -37,79 +41,75 @@ class CANTaskManager:
     def __init__(self):
         self.bus = Bus()
         self.tasks = defaultdict(dict)
+        # Guards tasks, add_task/stop_task never nest so a plain lock is enough
         self.lock = threading.Lock()
-
-    def periodic_send(self, can_id, interval, count=None):
-        def wrapper():
-            sent_count = 0
-            task['pattern_count'] = 0  # Counter for the second pattern in logic 2
-            while True:
-                with self.lock:
-                    task = self.tasks[can_id]
-                    if not task['active']:
-                        break
-
-                try:
-                    data = [0] * 8  # Default all zeros for 0x600
-                    if can_id == 0x391:
-                        task_mode = task.get('mode', 1)
-                        
-                        if task_mode == 1:  # Logic 1
-                            if sent_count < 10:
-                                data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00]
-                            else:
-                                data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x01, 0x00, 0x00]
-                        
-                        elif task_mode == 2:  # Logic 2
-                            if sent_count < 10:
-                                data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00]
-                            elif task['pattern_count'] < 10:
-                                data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x02, 0x00, 0x00]
-                                task['pattern_count'] += 1
-                            else:
-                                data = [0x00, 0x00, 0x00, 0x00, 0x02, 0x00, 0x00, 0x00]
-
-                    msg = can.Message(
-                        arbitration_id=can_id,
-                        data=data,
-                        is_extended_id=False
-                    )
-                    self.bus.send(msg)
-                    # print(f"[Success] Sent CAN message: {msg}")
-
-                    sent_count += 1
-                    if can_id == 0x600 and count and sent_count >= count:
-                        with self.lock:
-                            self.tasks[can_id]['interval'] = 1000
-                            print(f"Switched CAN ID {hex(can_id)} to 1000ms interval")
-                
-                except Exception as e:
-                    print(f"[Error] Failed to send message: {e}")
-                
-                time.sleep(task['interval'] / 1000)
-
-        return wrapper
+        # Cyclic IDs go to bus.send_periodic where supported, otherwise to one scheduler thread
+        self.scheduler = CyclicTransmitter(self.bus)
+        self.scenario = None
+
+    def build_phases(self, can_id, interval, count=None, mode=None):
+        """Phase list (data, interval, count) of one ID, see CyclicMessage"""
+        zeros = [0] * 8  # Default all zeros for 0x600
+        if can_id == 0x391:
+            task_mode = mode or 1
+            if task_mode == 1:  # Logic 1
+                return [
+                    ([0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00], interval, 10),
+                    ([0x00, 0x00, 0x00, 0x00, 0x02, 0x01, 0x00, 0x00], interval, None)
+                ]
+            # Logic 2
+            return [
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x04, 0x00, 0x00], interval, 10),
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x02, 0x00, 0x00], interval, 10),
+                ([0x00, 0x00, 0x00, 0x00, 0x02, 0x00, 0x00, 0x00], interval, None)
+            ]
+        if can_id == 0x600 and count:
+            # The 1000 ms gap already follows frame `count`, which opens the second phase
+            if count == 1:
+                return [(zeros, 1000, None)]
+            return [(zeros, interval, count - 1), (zeros, 1000, None)]
+        return [(zeros, interval, None)]
+
+    def _on_phase(self, message, phase_index):
+        if message.can_id == 0x600:
+            print(f"Switched CAN ID {hex(message.can_id)} to 1000ms interval")
 
     def add_task(self, can_id, interval, count=None, mode=None):
+        phases = self.build_phases(can_id, interval, count, mode)
         with self.lock:
             if can_id in self.tasks:
-                self.tasks[can_id]['active'] = True
+                # Already running: switch the data/interval in place, keeping the cycle
                 self.tasks[can_id]['interval'] = interval
                 self.tasks[can_id]['mode'] = mode
+                self.scheduler.change_phases(self.tasks[can_id]['message'], phases)
             else:
+                message = CyclicMessage(can_id, phases, on_phase=self._on_phase)
                 self.tasks[can_id] = {
                     'active': True,
                     'interval': interval,
                     'mode': mode,
-                    'thread': threading.Thread(target=self.periodic_send(can_id, interval, count))
+                    'message': message
                 }
-                self.tasks[can_id]['thread'].start()
+                self.scheduler.add(message)
+
+    def run_scenario(self, path):
+        """Stop the running tasks and run a scenario file on the same transmitter"""
+        self.stop_scenario()
+        for can_id in list(self.tasks.keys()):
+            self.stop_task(can_id)
+        self.scenario = ScenarioEngine(self.bus, path, transmitter=self.scheduler)
+        self.scenario.start()
+
+    def stop_scenario(self):
+        if self.scenario:
+            self.scenario.stop()
+            self.scenario = None
 
     def stop_task(self, can_id):
         with self.lock:
             if can_id in self.tasks:
                 self.tasks[can_id]['active'] = False
-                self.tasks[can_id]['thread'].join()
+                self.scheduler.remove(self.tasks[can_id]['message'])
                 del self.tasks[can_id]
 
 
@@ -118,6 +118,7 @@ def input_handler(task_manager):
         cmd = input("\nEnter command (1-执行逻辑1, 2-执行逻辑2, q-退出): ")
         
         if cmd == '1':
+            task_manager.stop_scenario()
             # Wake-up mode: Send CAN messages to wake up the ECU
             # Logic 1: Send messages with IDs 0x600 and 0x391
             task_manager.add_task(0x600, 20, count=10)  # 0x600: First 10 frames at 20ms interval, then switch to 1000ms
@@ -125,31 +126,14 @@ def input_handler(task_manager):
             print("Started logic 1: Sending 10 frames each for 0x600 and 0x391 with 20ms interval. 0x600 will switch to 1000ms interval after completion.")
         elif cmd == '2':
             # Logic 2: Build upon Logic 1 with additional timing and data pattern changes
-            task_manager.add_task(0x600, 20, count=10)  # 0x600: First 10 frames at 20ms interval, then switch to 1000ms
-            task_manager.add_task(0x391, 20, mode=2)  # Start with logic 2 pattern transmission
-            print("Started logic 2: Initial transmission started...")
-            
-            def delayed_actions():
-                # Wait 3 seconds before changing 0x391 data pattern
-                time.sleep(3)
-                print("Changing 0x391 data pattern...")
-                with task_manager.lock:
-                    if 0x391 in task_manager.tasks:
-                        task_manager.stop_task(0x391)
-                        task_manager.add_task(0x391, 20, mode=2)  # Restart with new pattern for logic 2
-                
-                # Wait another 3 seconds before stopping 0x600
-                time.sleep(3)
-                print("Stopping 0x600 transmission...")
-                task_manager.stop_task(0x600)
-            
-            timing_thread = threading.Thread(target=delayed_actions)
-            timing_thread.daemon = True
-            timing_thread.start()
+            # 0x391 pattern restart after 3 s and 0x600 stop after 6 s, see ims_nm_logic2.json
+            task_manager.run_scenario('ims_nm_logic2.json')
             
         elif cmd.lower() == 'q':
+            task_manager.stop_scenario()
             for can_id in list(task_manager.tasks.keys()):
                 task_manager.stop_task(can_id)
+            task_manager.scheduler.shutdown()
             task_manager.bus.shutdown()
             print("Exiting...")
             break
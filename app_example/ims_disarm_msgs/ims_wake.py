@@ -4,12 +4,13 @@ import threading
 import time
 from collections import defaultdict
 
+from cyclic_scheduler import CyclicMessage
+from cyclic_tx import shared_transmitter
+from nm_scenario import ScenarioEngine
+
 import logging  # Import logging module
 import datetime  # Import datetime module for timestamping log files
 
-# Add a global counter variable
-case_counter = 0
-
 can.rc['interface'] = 'vector'
 can.rc['bustype'] = 'vector'
 can.rc['channel'] = '0'
@@ -26,44 +27,41 @@ can.rc['sam_abr'] = 1
 
 
 class CANFrameController:
-    def __init__(self, bus, can_id, initial_data, phase_change_count, intervals, switch_data=1):
+    def __init__(self, bus, can_id, initial_data, phase_change_count, intervals, switch_data=1, scheduler=None):
         self.bus = bus
         self.can_id = can_id
         self.initial_data = initial_data
         self.phase_data = initial_data
         self.phase_change_count = phase_change_count
         self.intervals = intervals
-        self.frame_count = 0
         self.running = False
-        self.thread = None
         self.switch_data = switch_data  # New parameter to control data switching
-
-    def _send_loop(self):
-        while self.running:
-            if self.switch_data:  # Check if data switching is enabled
-                phase_index = 0 if self.frame_count < self.phase_change_count else 1
-            else:
-                phase_index = 0  # If data switching is disabled, use initial data
-            msg = can.Message(
-                arbitration_id=self.can_id,
-                data=self.phase_data[phase_index],
-                is_extended_id=False
-            )
-            self.bus.send(msg)
-            self.frame_count += 1
-            time.sleep(self.intervals[phase_index]/1000)
+        # All controllers of a bus share one transmitter: send_periodic offload or one scheduler thread
+        self.scheduler = scheduler or shared_transmitter(bus)
+        self.message = CyclicMessage(can_id, self._phases())
+
+    def _phases(self):
+        if self.switch_data:  # Check if data switching is enabled
+            return [
+                (self.phase_data[0], self.intervals[0], self.phase_change_count),
+                (self.phase_data[1], self.intervals[1], None)
+            ]
+        # If data switching is disabled, use initial data
+        return [(self.phase_data[0], self.intervals[0], None)]
+
+    @property
+    def frame_count(self):
+        return self.message.sent if self.running else 0
 
     def start(self):
         if not self.running:
             self.running = True
-            self.thread = threading.Thread(target=self._send_loop)
-            self.thread.start()
+            self.scheduler.add(self.message)
 
     def stop(self):
         if self.running:
             self.running = False
-            self.thread.join()
-            self.frame_count = 0
+            self.scheduler.remove(self.message)
 
 # Shell control interface
 def shell_control():
@@ -124,6 +122,8 @@ def shell_control():
         intervals=[20, 20]
     )
     
+    scenario = ScenarioEngine(bus, 'ims_pressure_test.json', transmitter=shared_transmitter(bus))
+
     def get_user_input():
         while True:
             cmd = input("Enter command (1= Normal / 2= Polling /3=exit): ").strip().lower()
@@ -149,15 +149,22 @@ def shell_control():
                 threading.Timer(5.0, stop_arm_controllers).start()
                 
             elif cmd == '3':
+                scenario.stop()
                 controller_600.stop()
                 controller_391.stop()
                 controller_391_arm.stop()
                 controller_600_arm.stop()
                 controller_391_arm.stop()
+                controller_2EA.stop()
+                shared_transmitter(bus).shutdown()
                 bus.shutdown()
                 break  # Exit the loop to stop the thread
 
             elif cmd == '4':  # loop 1 and 2 to auto test
+                if scenario.thread and scenario.thread.is_alive():
+                    print("Pressure test is already running")
+                    continue
+
                 # Generate a timestamp for the log file name
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
                 log_filename = f"log_{timestamp}.txt"
@@ -175,33 +182,9 @@ def shell_control():
                 console_handler.setFormatter(formatter)
                 logger.addHandler(console_handler)
 
-                def run_case1():
-                    global case_counter  # Declare the use of the global counter variable
-                    case_counter += 1  # Increment the counter
-                    logging.info(f"Running Preasure Test No.{case_counter}: Wakeup ATAC to normal mode")
-                    controller_600.start()
-                    controller_391.start()
-                    controller_2EA.start()
-                    threading.Timer(5.0, run_case2).start()
-
-                def run_case2():
-                    controller_600.stop()
-                    controller_391.stop()
-                    controller_2EA.stop()
-                    logging.info("Set ATAC to polling mode")
-                    controller_600_arm.start()
-                    controller_391_arm.start()
-                    controller_2EA.start()
-                    threading.Timer(5.0, stop_case2).start()  # Stop Case 2 after 5 seconds
-
-                def stop_case2():
-                    logging.info("Stop NM Msgs and wait to enter polling mode")
-                    controller_600_arm.stop()
-                    controller_391_arm.stop()
-                    controller_2EA.stop()
-                    threading.Timer(45.0, run_case1).start()  # Restart Case 1 after 55 seconds
-
-                run_case1()
+                # Pressure test loop: normal 5 s, polling 5 s, sleep 45 s, see ims_pressure_test.json
+                scenario.log = logging.info
+                scenario.start()
 
     # Start the user input thread
     input_thread = threading.Thread(target=get_user_input)
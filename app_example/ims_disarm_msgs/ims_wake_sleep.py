@@ -4,6 +4,9 @@ import threading
 import time
 from collections import defaultdict
 
+from cyclic_scheduler import CyclicMessage
+from cyclic_tx import shared_transmitter
+
 can.rc['interface'] = 'vector'
 can.rc['bustype'] = 'vector'
 can.rc['channel'] = '0'
@@ -23,7 +26,7 @@ can.rc['sam_abr'] = 1
 class MessageController:
     def __init__(self, can_bus, arbitration_id, initial_data, changed_data, 
                  initial_interval, changed_interval, initial_count,
-                 temp_data=None, temp_duration=0):
+                 temp_data=None, temp_duration=0, scheduler=None):
         self.bus = can_bus
         self.arb_id = arbitration_id
         self.initial_data = initial_data
@@ -33,31 +36,35 @@ class MessageController:
         self.initial_count = initial_count
         self.temp_data = temp_data
         self.temp_duration = temp_duration
-        self.temp_counter = 0
-        self.counter = 0
-        self.running = True
-        self.in_temp_mode = False
-
-    def run(self):
-        while self.running:
-            if self.in_temp_mode:
-                data = self.temp_data
-                interval = self.changed_interval
-                self.temp_counter += 1
-                if self.temp_counter >= self.temp_duration:
-                    self.in_temp_mode = False
-            else:
-                data = self.initial_data if self.counter < self.initial_count else self.changed_data
-                interval = self.initial_interval if self.counter < self.initial_count else self.changed_interval
-
-            msg = can.Message(
-                arbitration_id=self.arb_id,
-                data=data,
-                is_extended_id=False
-            )
-            self.bus.send(msg)
-            self.counter += 1
-            time.sleep(interval/1000)
+        # All controllers of a bus share one transmitter: send_periodic offload or one scheduler thread
+        self.scheduler = scheduler or shared_transmitter(can_bus)
+        self.message = CyclicMessage(arbitration_id, [
+            (initial_data, initial_interval, initial_count),
+            (changed_data, changed_interval, None)
+        ])
+
+    @property
+    def counter(self):
+        return self.message.sent
+
+    @property
+    def running(self):
+        return self.message.active
+
+    def start(self):
+        self.scheduler.add(self.message)
+
+    def stop(self):
+        self.scheduler.remove(self.message)
+
+    def enter_temp_mode(self):
+        """Send temp_data for temp_duration frames, then continue where the normal sequence would be"""
+        remaining = max(0, self.initial_count - self.counter - self.temp_duration)
+        phases = [(self.temp_data, self.changed_interval, self.temp_duration)]
+        if remaining:
+            phases.append((self.initial_data, self.initial_interval, remaining))
+        phases.append((self.changed_data, self.changed_interval, None))
+        self.scheduler.change_phases(self.message, phases)
 
 # CAN bus initialization
 bus = Bus()
@@ -89,30 +96,27 @@ controller_391 = MessageController(
 command = input('Enter 1 to start normal transmission, 2 for special mode: ')
 
 if command == '1' or command == '2':
-    thread_600 = threading.Thread(target=controller_600.run, daemon=True)
-    thread_391 = threading.Thread(target=controller_391.run, daemon=True)
-    
-    thread_600.start()
-    thread_391.start()
+    controller_600.start()
+    controller_391.start()
     
     if command == '2':
         # Activate temporary mode for 0x391 after 1 second
         time.sleep(1)
-        controller_391.in_temp_mode = True
+        controller_391.enter_temp_mode()
         
         # Schedule stop after 10 seconds
         def stop_transmission():
             time.sleep(10)
-            controller_600.running = False
-            controller_391.running = False
+            controller_600.stop()
+            controller_391.stop()
         threading.Thread(target=stop_transmission, daemon=True).start()
     
     try:
         while controller_600.running or controller_391.running:
             time.sleep(0.1)
     except KeyboardInterrupt:
-        controller_600.running = False
-        controller_391.running = False
+        controller_600.stop()
+        controller_391.stop()
 
 
 
@@ -137,7 +141,7 @@ try:
         if current_command in ('1', '2'):
             # Stop existing controllers
             for ctrl in active_controllers:
-                ctrl.running = False
+                ctrl.stop()
             
             # Reinitialize controllers with fresh state
             controller_600 = MessageController(
@@ -155,19 +159,14 @@ try:
                 temp_duration=10
             )
             
-            # Start new threads
+            # Start sending, the shared transmitter serves both
             active_controllers = [controller_600, controller_391]
-            threads = [
-                threading.Thread(target=ctrl.run, daemon=True) 
-                for ctrl in active_controllers
-            ]
-            
-            for t in threads:
-                t.start()
+            for ctrl in active_controllers:
+                ctrl.start()
             
             if current_command == '2':
                 time.sleep(1)
-                controller_391.in_temp_mode = True
+                controller_391.enter_temp_mode()
                 
             # Clear command to prevent restart loop
             current_command = None
@@ -176,6 +175,7 @@ try:
         
 except KeyboardInterrupt:
     for ctrl in active_controllers:
-        ctrl.running = False
+        ctrl.stop()
+    shared_transmitter(bus).shutdown()
 
 
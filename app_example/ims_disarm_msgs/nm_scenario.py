@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+
+from cyclic_scheduler import CyclicMessage
+from cyclic_tx import CyclicTransmitter
+
+def _parse_data(data):
+    """Hex string ("00 02 FF") or list of ints"""
+    if isinstance(data, str):
+        return list(bytes.fromhex(data))
+    return list(data)
+
+def _parse_id(value):
+    return int(value, 0) if isinstance(value, str) else value
+
+def load_scenario(path):
+    """Read a scenario file"""
+    with open(path, 'r') as file:
+        return json.load(file)
+
+class ScenarioEngine:
+    """
+    Runs a scenario of timed phases, each starting a set of cyclic messages.
+
+    Scenario format:
+        {
+          "name": "...",
+          "loops": 0,                        # 0 runs until stop()
+          "phases": [
+            {
+              "name": "wakeup",
+              "duration": 5.0,               # seconds, omitted = until stop()
+              "log": "Test No.{loop}: ...",  # optional, {loop} and {phase} are filled in
+              "next": "polling",             # optional, defaults to the following phase
+              "messages": [
+                {"id": "0x600", "phases": [{"data": "00 00 00 00 00 00 00 00", "interval": 20, "count": 10},
+                                           {"data": "00 00 00 00 00 00 00 00", "interval": 1000}]},
+                {"id": "0x391", "keep": true}   # keep the message of the previous phase running
+              ]
+            }
+          ]
+        }
+    Going back to the first phase completes a loop. Phase start times are planned from the
+    scenario start, so timing errors do not add up over long runs.
+    """
+    def __init__(self, bus, scenario, transmitter=None, log=None):
+        """
+        Initialize engine
+        :param bus: CAN bus instance
+        :param scenario: Scenario dict or path of a scenario file
+        :param transmitter: CyclicTransmitter/CyclicScheduler, a new CyclicTransmitter by default
+        :param log: Called with one text line per phase, defaults to a timestamped print
+        """
+        if isinstance(scenario, str):
+            scenario = load_scenario(scenario)
+        self.name = scenario.get('name', 'scenario')
+        self.loops = int(scenario.get('loops', 0))
+        self.transmitter = transmitter or CyclicTransmitter(bus)
+        self.log = log or self._log
+        self.phases = [self._compile_phase(i, phase) for i, phase in enumerate(scenario['phases'])]
+        index = {phase['name']: i for i, phase in enumerate(self.phases)}
+        for i, phase in enumerate(self.phases):
+            target = phase.pop('next_name')
+            if target is None:
+                phase['next'] = (i + 1) % len(self.phases)
+            elif target in index:
+                phase['next'] = index[target]
+            else:
+                raise ValueError(f"Phase {phase['name']}: unknown next phase {target}")
+
+        self.running = {}               # can_id -> CyclicMessage currently sent
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.loop_count = 0
+        self.phase_count = 0
+        self.max_start_error = 0.0
+
+    def _compile_phase(self, number, phase):
+        name = phase.get('name', f"phase{number}")
+        messages = []
+        for entry in phase.get('messages', []):
+            can_id = _parse_id(entry['id'])
+            if entry.get('keep'):
+                messages.append((can_id, None))
+                continue
+            steps = [(_parse_data(step['data']), step['interval'], step.get('count')) for step in entry['phases']]
+            # Built once and restarted every loop
+            messages.append((can_id, CyclicMessage(can_id, steps, name=f"{name}:0x{can_id:03X}")))
+        return {
+            'name': name,
+            'duration': phase.get('duration'),
+            'log': phase.get('log'),
+            'next_name': phase.get('next'),
+            'messages': messages,
+        }
+
+    def _log(self, text):
+        """Print with a millisecond timestamp"""
+        current_time = time.time()
+        milliseconds = int((current_time - int(current_time)) * 1000)
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time)) + f'.{milliseconds:03d}'
+        print(f"[SCENARIO] [{timestamp}] {text}")
+
+    def _enter_phase(self, phase):
+        keep = {can_id for can_id, message in phase['messages'] if message is None}
+        for can_id in list(self.running):
+            if can_id not in keep:
+                self.transmitter.remove(self.running.pop(can_id))
+        for can_id, message in phase['messages']:
+            if message is not None:
+                self.running[can_id] = self.transmitter.add(message)
+
+    def _stop_messages(self):
+        for message in self.running.values():
+            self.transmitter.remove(message)
+        self.running.clear()
+
+    def run(self):
+        """Run the scenario in the calling thread until it ends or stop() is called"""
+        self.stop_event.clear()
+        # Counters describe the current run only
+        self.loop_count = 1
+        self.phase_count = 0
+        self.max_start_error = 0.0
+        index = 0
+        start = planned = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                phase = self.phases[index]
+                error = time.perf_counter() - planned
+                self.max_start_error = max(self.max_start_error, error)
+                self._enter_phase(phase)
+                self.phase_count += 1
+                offset = planned - start
+                if phase['log']:
+                    self.log(phase['log'].format(loop=self.loop_count, phase=phase['name']))
+                self.log(f"{self.name}: loop {self.loop_count} phase {phase['name']} "
+                         f"at +{offset:.3f}s (late {error * 1000:.1f}ms)")
+
+                if phase['duration'] is None:
+                    self.stop_event.wait()
+                    break
+                planned += phase['duration']
+                self.stop_event.wait(max(planned - time.perf_counter(), 0))
+
+                index = phase['next']
+                if index == 0:
+                    if self.loops and self.loop_count >= self.loops:
+                        break
+                    self.loop_count += 1
+        finally:
+            self._stop_messages()
+        self.log(f"{self.name}: finished after {self.phase_count} phases, "
+                 f"max phase start error {self.max_start_error * 1000:.1f}ms")
+
+    def start(self):
+        """Run the scenario in a background thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the scenario and every message it started"""
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
@@ -3,21 +3,44 @@ import isotp
 import time
 
 class CanIsotpSender:
-    def __init__(self, channel, bustype, bitrate, rxid, txid, stmin=6, blocksize=2):
+    MAX_PAYLOAD = 4095      # Largest ISOTP payload with a 12-bit first frame length
+
+    def __init__(self, channel, bustype, bitrate, rxid, txid, stmin=6, blocksize=2, send_timeout=10,
+                 fd=False, data_bitrate=2000000):
         self.channel = channel
         self.bustype = bustype
         self.bitrate = bitrate
-        self.rxid = rxid
-        self.txid = txid
+        # CAN FD: 64-byte frames with bitrate switch to data_bitrate
+        self.fd = fd
+        self.data_bitrate = data_bitrate
+        # IDs come from the GUI entries as hex strings
+        self.rxid = int(rxid, 16) if isinstance(rxid, str) else rxid
+        self.txid = int(txid, 16) if isinstance(txid, str) else txid
         self.stmin = stmin
         self.blocksize = blocksize
+        self.send_timeout = send_timeout
         self.bus = None
         self.notifier = None
         self.isotp_layer = None
+        self.rx_filters = None
+        # Throughput counters, written by the sending thread and read by the GUI
+        self.bytes_sent = 0
+        self.transfers_sent = 0
 
     def initialize(self):
         try:
-            self.bus = can.interface.Bus(channel=self.channel, bustype=self.bustype, bitrate=self.bitrate)
+            # Let only the response ID through, other traffic is dropped by the driver instead of the ISOTP stack
+            rx_filter = {'can_id': self.rxid, 'can_mask': 0x1FFFFFFF if self.rxid > 0x7FF else 0x7FF, 'extended': self.rxid > 0x7FF}
+            self.rx_filters = [rx_filter]
+            bus_kwargs = {}
+            if self.fd:
+                # 80 MHz is a valid clock on PCAN FD adapters
+                bus_kwargs['timing'] = can.BitTimingFd.from_sample_point(
+                    f_clock=80000000, nom_bitrate=self.bitrate, nom_sample_point=80.0,
+                    data_bitrate=self.data_bitrate, data_sample_point=80.0)
+                bus_kwargs['fd'] = True
+                bus_kwargs['data_bitrate'] = self.data_bitrate
+            self.bus = can.interface.Bus(channel=self.channel, bustype=self.bustype, bitrate=self.bitrate, can_filters=self.rx_filters, **bus_kwargs)
             self.notifier = can.Notifier(self.bus, [])
             isotp_params = {
                 'stmin': self.stmin,
@@ -26,16 +49,17 @@ class CanIsotpSender:
                 'rx_flowcontrol_timeout': 1000,
                 'rx_consecutive_frame_timeout': 1000,
                 'wftmax': 0,
-                'tx_data_length': 8,
+                'tx_data_length': 64 if self.fd else 8,
                 'tx_padding': 0x00,
                 'rx_flowcontrol_timeout': 1000,
                 'rx_consecutive_frame_timeout': 1000,
-                'can_fd': False,
-                'max_frame_size': 4095,
-                'bitrate_switch': False,
+                'can_fd': self.fd,
+                'max_frame_size': self.MAX_PAYLOAD,
+                'bitrate_switch': self.fd,
                 'rate_limit_enable': False,
                 'listen_mode': False,
-                'blocking_send': False    
+                # send() returns once the transfer is done, the GUI calls it from its worker thread
+                'blocking_send': True
             }
             tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=self.txid, rxid=self.rxid)
             self.isotp_layer = isotp.NotifierBasedCanStack(
@@ -51,23 +75,34 @@ class CanIsotpSender:
             print(f"Failed to initialize CAN ISOTP sender: {e}")
             raise
 
-    def send_data(self, data, dlc=8):
+    def send_data(self, data):
+        """
+        Send one ISOTP payload, segmented into as many frames as it needs
+        :param data: Payload bytes, 1 to MAX_PAYLOAD
+        :return: True once the transfer completed
+        """
         if self.isotp_layer is None:
             print("CAN ISOTP sender is not initialized.")
-            return
+            return False
 
         if isinstance(data, str):
             data = data.encode('utf-8')
 
-        # 补齐数据到 DLC 长度
-        if len(data) < dlc:
-            data += b'\x00' * (dlc - len(data))
+        if not 0 < len(data) <= self.MAX_PAYLOAD:
+            print(f"Payload length {len(data)} out of range 1..{self.MAX_PAYLOAD}.")
+            return False
 
         try:
-            self.isotp_layer.send(data[:dlc])
-            print(f"CAN data sent: Data={data[:dlc].hex()}")
+            self.isotp_layer.send(data, send_timeout=self.send_timeout)
+            self.bytes_sent += len(data)
+            self.transfers_sent += 1
+            # Long payloads are shortened in the log, hex text of 4095 bytes per transfer only slows the GUI
+            preview = data[:32].hex() + ('...' if len(data) > 32 else '')
+            print(f"CAN data sent: {len(data)} bytes, Data={preview}")
+            return True
         except Exception as e:
             print(f"Failed to send CAN data: {e}")
+            return False
 
     def receive_data(self, timeout=3):
         if self.isotp_layer is None:
@@ -75,9 +110,22 @@ class CanIsotpSender:
             return None
 
         try:
-            payload = self.isotp_layer.recv(block=False, timeout=timeout)
+            payload = self.isotp_layer.recv(block=True, timeout=timeout)
             if payload is not None:
                 print(f"Received data: {payload.hex()}")
             return payload
         except Exception as e:
-            print(f"Failed to send CAN data: {e}")
\ No newline at end of file
+            print(f"Failed to receive CAN data: {e}")
+
+    def shutdown(self):
+        """Stop the ISOTP stack and release the bus"""
+        if self.isotp_layer is not None:
+            self.isotp_layer.stop()
+            self.isotp_layer = None
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.bus is not None:
+            self.bus.shutdown()
+            self.bus = None
+            print("CAN ISOTP sender shut down.")
@@ -1,25 +1,87 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
+import os
 import sys
+import time
+import itertools
+import threading
+from collections import deque
 import can
 from can_isotp_sender import CanIsotpSender
+from sender_worker import SenderWorker
+from trace_table import TraceTable
 
 class RedirectText:
-    """Custom class to redirect stdout and stderr to the GUI text widget"""
-    def __init__(self, text_widget):
+    """
+    Custom class to redirect stdout and stderr to the GUI text widget.
+    write() may be called from any thread and only queues the text; the Tk thread drains
+    the queue in batches with root.after, and the widget keeps the last max_lines lines.
+    """
+    def __init__(self, text_widget, max_lines=5000, interval_ms=50, batch_size=2000):
+        """
+        Initialize redirector
+        :param text_widget: Text widget showing the log
+        :param max_lines: Lines kept in the widget, older lines are trimmed
+        :param interval_ms: Milliseconds between two drains of the queue
+        :param batch_size: Messages inserted per drain at most
+        """
         self.text_widget = text_widget
         self.text_widget.configure(state=tk.DISABLED)
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.batch_size = batch_size
+        # Writers number and append their message under write_lock, so the deque stays in
+        # sequence order; drain() pops without the lock and never blocks them. A full deque
+        # discards its oldest entry, drain() counts the gaps in the sequence numbers
+        self.pending = deque(maxlen=2 * max_lines)
+        self.sequence = itertools.count()
+        self.write_lock = threading.Lock()
+        self.next_sequence = 0
+        self.dropped = 0
+        self.text_widget.after(self.interval_ms, self.drain)
 
     def write(self, message):
-        self.text_widget.configure(state=tk.NORMAL)
-        self.text_widget.insert(tk.END, message)  # Insert message into the text widget
-        self.text_widget.see(tk.END)  # Automatically scroll to the bottom
-        self.text_widget.configure(state=tk.DISABLED)
+        if message:
+            with self.write_lock:
+                self.pending.append((next(self.sequence), message))
 
     def flush(self):
         pass  # Must implement flush method to avoid errors
 
+    def drain(self):
+        """Move queued messages into the widget, runs on the Tk thread"""
+        pending = self.pending
+        chunks = []
+        try:
+            for _ in range(self.batch_size):
+                sequence, message = pending.popleft()
+                if sequence > self.next_sequence:
+                    # Messages pushed out of the full deque
+                    lost = sequence - self.next_sequence
+                    self.dropped += lost
+                    chunks.append(f"... {lost} log messages dropped ...\n")
+                self.next_sequence = sequence + 1
+                chunks.append(message)
+        except IndexError:
+            pass
+
+        if chunks:
+            widget = self.text_widget
+            # Follow the output only if the view is already at the bottom
+            at_bottom = widget.yview()[1] >= 1.0
+            widget.configure(state=tk.NORMAL)
+            widget.insert(tk.END, ''.join(chunks))
+            lines = int(widget.index('end-1c').split('.')[0])
+            if lines > self.max_lines:
+                widget.delete('1.0', f'{lines - self.max_lines + 1}.0')
+            widget.configure(state=tk.DISABLED)
+            if at_bottom:
+                widget.see(tk.END)
+
+        # Come back at once while a backlog is left
+        self.text_widget.after(1 if pending else self.interval_ms, self.drain)
+
 class PCANGUIApp:
     def __init__(self, root):
         self.root = root
@@ -33,7 +95,7 @@ class PCANGUIApp:
         root.columnconfigure(0, weight=1)
         root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(0, weight=1)
-        main_frame.rowconfigure(1, weight=1)
+        main_frame.rowconfigure(3, weight=1)
 
         # Initialization frame
         init_frame = ttk.LabelFrame(main_frame, text="CAN Initialization", borderwidth=2, relief="solid")
@@ -61,6 +123,10 @@ class PCANGUIApp:
         self.bitrate_menu = ttk.Combobox(init_frame, textvariable=self.bitrate_var, values=[500000, 1000000])
         self.bitrate_menu.grid(column=4, row=0, padx=5, pady=5)
 
+        # CAN FD: 64-byte frames, data phase at 2 Mbit/s
+        self.fd_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(init_frame, text="CAN FD", variable=self.fd_var).grid(column=7, row=0, padx=5, pady=5)
+
         # ISOTP parameters frame
         isotp_frame = ttk.LabelFrame(main_frame, text="ISOTP Parameters", borderwidth=2, relief="solid")
         isotp_frame.grid(column=0, row=1, sticky=(tk.W, tk.E), pady=10)
@@ -105,11 +171,15 @@ class PCANGUIApp:
         self.can_data_entry = ttk.Entry(can_send_frame, textvariable=self.can_data_var, width=50)
         self.can_data_entry.grid(column=1, row=0, padx=5, pady=5)
 
-        # DLC input
-        self.dlc_var = tk.IntVar(value=8)
-        ttk.Label(can_send_frame, text="DLC:").grid(column=2, row=0, padx=5, pady=5, sticky=tk.E)
-        self.dlc_entry = ttk.Entry(can_send_frame, textvariable=self.dlc_var, width=5)
-        self.dlc_entry.grid(column=3, row=0, padx=5, pady=5)
+        # Payload length input, longer payloads are sent as multi-frame ISOTP transfers
+        self.length_var = tk.IntVar(value=8)
+        ttk.Label(can_send_frame, text="Length:").grid(column=2, row=0, padx=5, pady=5, sticky=tk.E)
+        self.length_entry = ttk.Entry(can_send_frame, textvariable=self.length_var, width=5)
+        self.length_entry.grid(column=3, row=0, padx=5, pady=5)
+
+        # Throughput readout
+        self.throughput_label = ttk.Label(can_send_frame, text="Throughput: -", anchor=tk.W)
+        self.throughput_label.grid(column=4, row=0, padx=5, pady=5, sticky=tk.W)
 
         # Generate data options
         self.generate_option = tk.IntVar(value=0)
@@ -121,9 +191,35 @@ class PCANGUIApp:
         self.send_button = ttk.Button(can_send_frame, text="Send CAN Data", command=self.send_can_data)
         self.send_button.grid(column=1, row=1, padx=5, pady=5)
 
+        # Receive button
+        self.receive_button = ttk.Button(can_send_frame, text="Receive", command=self.receive_can_data)
+        self.receive_button.grid(column=4, row=1, padx=5, pady=5)
+
+        # Cyclic send: period and number of transfers (0 = until stopped)
+        self.period_var = tk.IntVar(value=100)
+        ttk.Label(can_send_frame, text="Period (ms):").grid(column=2, row=1, padx=5, pady=5, sticky=tk.E)
+        self.period_entry = ttk.Entry(can_send_frame, textvariable=self.period_var, width=7)
+        self.period_entry.grid(column=3, row=1, padx=5, pady=5)
+        self.count_var = tk.IntVar(value=0)
+        ttk.Label(can_send_frame, text="Count:").grid(column=2, row=2, padx=5, pady=5, sticky=tk.E)
+        self.count_entry = ttk.Entry(can_send_frame, textvariable=self.count_var, width=7)
+        self.count_entry.grid(column=3, row=2, padx=5, pady=5)
+        self.cyclic_start_button = ttk.Button(can_send_frame, text="Start Cyclic", command=self.start_cyclic_send)
+        self.cyclic_start_button.grid(column=1, row=2, padx=5, pady=5)
+        self.cyclic_stop_button = ttk.Button(can_send_frame, text="Stop Cyclic", command=self.stop_cyclic_send)
+        self.cyclic_stop_button.grid(column=1, row=3, padx=5, pady=5)
+
+        # Log and trace tabs
+        notebook = ttk.Notebook(main_frame)
+        notebook.grid(column=0, row=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+
         # Log text box
-        self.log_text = ScrolledText(main_frame, wrap=tk.WORD, height=15)
-        self.log_text.grid(column=0, row=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+        self.log_text = ScrolledText(notebook, wrap=tk.WORD, height=15)
+        notebook.add(self.log_text, text="Log")
+
+        # CAN trace table
+        self.trace_table = TraceTable(notebook)
+        notebook.add(self.trace_table, text="Trace")
 
         # Redirect standard output and error output to the log text box
         self.log_redirector = RedirectText(self.log_text)
@@ -132,81 +228,200 @@ class PCANGUIApp:
 
         # CAN ISOTP sender instance
         self.can_isotp_sender = None
+        self.receive_timeout = 3
+        self.cyclic_sent = 0
+
+        # All bus I/O runs on the worker thread, its results come back through this timer
+        self.worker = SenderWorker()
+        self.root.after(20, self.process_worker_results)
+        self.throughput_last = (None, 0, 0, 0)
+        self.root.after(1000, self.update_throughput)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    SEQUENCE = bytes(range(256))
 
     def generate_sequential_data(self, length):
-        return ' '.join([f'{i:02X}' for i in range(length)])
+        """0x00, 0x01 .. 0xFF, 0x00 .. repeated to length bytes"""
+        return (self.SEQUENCE * (length // 256 + 1))[:length]
 
     def generate_random_data(self, length):
-        return ' '.join([f'{random.randint(0, 255):02X}' for _ in range(length)])
+        return os.urandom(length)
 
     def initialize_pcan(self):
-        """Initialize the PCAN device"""
+        """Initialize the PCAN device on the worker thread"""
+        if self.can_isotp_sender:
+            print("PCAN is already initialized.")
+            return
         print("Initializing PCAN...")
         try:
-            self.can_isotp_sender = CanIsotpSender(
+            sender = CanIsotpSender(
                 channel=self.device_var.get(),
                 bustype="pcan",
                 bitrate=self.bitrate_var.get(),
                 rxid=self.rxid_var.get(),
                 txid=self.txid_var.get(),
                 stmin=self.stmin_var.get(),
-                blocksize=self.blocksize_var.get()
+                blocksize=self.blocksize_var.get(),
+                fd=self.fd_var.get()
             )
-            self.can_isotp_sender.initialize()
-            print("PCAN initialized successfully!")
-            self.set_status("green")  # Change status light to green
         except Exception as e:
             print(f"Failed to initialize PCAN: {e}")
+            self.set_status("red")
+            return
+        self.init_button.configure(state=tk.DISABLED)
+        self.set_status("yellow")
+        self.worker.submit(sender.initialize, callback=lambda result, error: self.on_initialized(sender, error))
+
+    def on_initialized(self, sender, error):
+        self.init_button.configure(state=tk.NORMAL)
+        if error is not None:
+            print(f"Failed to initialize PCAN: {error}")
             self.set_status("red")  # Change status light to red
+            return
+        self.can_isotp_sender = sender
+        self.trace_table.attach(sender.notifier, sender.rx_filters)
+        print("PCAN initialized successfully!")
+        self.set_status("green")  # Change status light to green
 
     def shutdown_pcan(self):
-        """Shutdown the PCAN device"""
+        """Shutdown the PCAN device after the queued transfers"""
         print("Shutting down PCAN...")
         if self.can_isotp_sender:
-            self.can_isotp_sender.shutdown()
-            print("PCAN shutdown successfully!")
+            sender = self.can_isotp_sender
             self.can_isotp_sender = None
+            self.trace_table.detach()
+            self.worker.stop_cyclic()
+            self.worker.submit(sender.shutdown, callback=self.on_shutdown)
         else:
             print("PCAN is not initialized.")
+            self.set_status("red")
+
+    def on_shutdown(self, result, error):
+        if error is not None:
+            print(f"Failed to shut down PCAN: {error}")
+        else:
+            print("PCAN shutdown successfully!")
         self.set_status("red")
 
     def set_status(self, color):
         """Set the status light color"""
         self.status_indicator.configure(bg=color)
 
+    def update_throughput(self):
+        """Show the sent payload rate of the last second"""
+        now = time.perf_counter()
+        sender = self.can_isotp_sender
+        if sender is not None:
+            bytes_sent, transfers = sender.bytes_sent, sender.transfers_sent
+            if self.throughput_last[0] is sender:
+                elapsed = now - self.throughput_last[1]
+                rate = (bytes_sent - self.throughput_last[2]) / elapsed / 1024
+                transfer_rate = (transfers - self.throughput_last[3]) / elapsed
+                self.throughput_label.configure(text=f"Throughput: {rate:.1f} KB/s, {transfer_rate:.1f} transfers/s, "
+                                                     f"{transfers} sent")
+            self.throughput_last = (sender, now, bytes_sent, transfers)
+        self.root.after(1000, self.update_throughput)
+
+    def process_worker_results(self):
+        """Run the callbacks of finished worker commands on the Tk thread"""
+        self.worker.process_results()
+        self.root.after(20, self.process_worker_results)
+
+    def build_can_data(self):
+        """
+        Build the payload from the send settings, on the Tk thread
+        :return: Payload bytes, or None after printing why the settings are invalid
+        """
+        length = self.length_var.get()
+        option = self.generate_option.get()
+
+        if not 0 < length <= CanIsotpSender.MAX_PAYLOAD:
+            print(f"Length must be 1..{CanIsotpSender.MAX_PAYLOAD} bytes.")
+            return None
+
+        if option == 0:  # Custom Data, zero padded or cut to length
+            try:
+                data = bytes.fromhex(self.can_data_var.get())
+            except ValueError:
+                print("Invalid hex data.")
+                return None
+            return data[:length].ljust(length, b'\x00')
+        elif option == 1:  # Sequential Data
+            return self.generate_sequential_data(length)
+        elif option == 2:  # Random Data
+            return self.generate_random_data(length)
+        print("No data to send.")
+        return None
+
     def send_can_data(self):
-        """Send CAN data"""
+        """Queue one send of the CAN data"""
         if self.can_isotp_sender:
             try:
-                dlc = self.dlc_var.get()
-                option = self.generate_option.get()
-
-                if option == 0:  # Custom Data
-                    custom_data = self.can_data_var.get().strip()
-                    data_list = custom_data.split()
-                    if len(data_list) < dlc:
-                        data_list.extend(['00'] * (dlc - len(data_list)))
-                    elif len(data_list) > dlc:
-                        data_list = data_list[:dlc]
-                    data = ' '.join(data_list)
-                elif option == 1:  # Sequential Data
-                    data = self.generate_sequential_data(dlc)
-                elif option == 2:  # Random Data
-                    data = self.generate_random_data(dlc)
-
-                if data:
-                    # Validate hex data
-                    if all(c in '0123456789abcdefABCDEF' for c in data.replace(' ', '')) and len(data.replace(' ', '')) <= 16:
-                        self.can_isotp_sender.send_data(bytearray.fromhex(data), dlc)
-                    else:
-                        print("Invalid hex data or data length exceeds 8 bytes.")
-                else:
-                    print("No data to send.")
+                payload = self.build_can_data()
+                if payload:
+                    self.worker.submit(self.can_isotp_sender.send_data, payload, callback=self.on_sent)
             except Exception as e:
                 print(f"Failed to send CAN data: {e}")
         else:
             print("PCAN is not initialized.")
 
+    def on_sent(self, result, error):
+        if error is not None:
+            print(f"Failed to send CAN data: {error}")
+
+    def start_cyclic_send(self):
+        """Send the CAN data repeatedly with the configured period and count"""
+        if not self.can_isotp_sender:
+            print("PCAN is not initialized.")
+            return
+        try:
+            period = self.period_var.get() / 1000
+            count = self.count_var.get()
+            payload = self.build_can_data()
+        except Exception as e:
+            print(f"Failed to start cyclic send: {e}")
+            return
+        if not payload:
+            return
+        if period <= 0 or count < 0:
+            print("Period must be positive and count 0 (endless) or more.")
+            return
+        sender = self.can_isotp_sender
+        self.cyclic_sent = 0
+        self.worker.start_cyclic(lambda: sender.send_data(payload), period, count, callback=self.on_cyclic_sent)
+        print(f"Cyclic send started: every {period * 1000:.0f} ms, {count or 'endless'} times")
+
+    def stop_cyclic_send(self):
+        self.worker.stop_cyclic(callback=lambda result, error: print(f"Cyclic send stopped after {self.cyclic_sent} transfers"))
+
+    def on_cyclic_sent(self, result, error):
+        if error is not None:
+            print(f"Failed to send CAN data: {error}")
+        elif result:
+            self.cyclic_sent += 1
+
+    def receive_can_data(self):
+        """Wait for one ISOTP payload on the worker thread"""
+        if self.can_isotp_sender:
+            self.worker.submit(self.can_isotp_sender.receive_data, self.receive_timeout, callback=self.on_received)
+        else:
+            print("PCAN is not initialized.")
+
+    def on_received(self, payload, error):
+        if payload is None and error is None:
+            print(f"No data received within {self.receive_timeout} s.")
+
+    def on_close(self):
+        """Stop the worker and release the bus before the window closes"""
+        self.trace_table.detach()
+        if self.can_isotp_sender:
+            self.worker.submit(self.can_isotp_sender.shutdown)
+            self.can_isotp_sender = None
+        self.worker.stop()
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        self.root.destroy()
+
     def save_log(self):
         """Save the log to a file"""
         from tkinter.filedialog import asksaveasfilename
@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+
+class SenderWorker:
+    """
+    Runs the bus I/O of the GUI on one background thread.
+    Commands are queued with submit() and executed in order; their results come back through
+    process_results(), which the GUI calls from the Tk thread, so callbacks may touch widgets.
+    A cyclic job repeats one command with a fixed period between the queued commands.
+    """
+    def __init__(self):
+        self.commands = queue.Queue()
+        self.results = queue.Queue()
+        self.cyclic = None      # [func, period, remaining calls, next due time, callback]
+        self.thread = threading.Thread(target=self._run, name="SenderWorker", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, callback=None, **kwargs):
+        """
+        Queue func(*args, **kwargs) for the worker thread
+        :param callback: Called on the Tk thread as callback(result, error), error is None on success
+        """
+        self.commands.put((func, args, kwargs, callback))
+
+    def start_cyclic(self, func, period, count=0, callback=None):
+        """
+        Call func() every period seconds until stop_cyclic(), replacing a running cyclic job
+        :param func: Function without arguments, runs on the worker thread
+        :param period: Seconds between two calls, a call taking longer delays the next one
+        :param count: Number of calls, 0 repeats until stopped
+        :param callback: Called on the Tk thread after each call as callback(result, error)
+        """
+        self.commands.put((self._set_cyclic, (func, period, count, callback), {}, None))
+
+    def stop_cyclic(self, callback=None):
+        self.commands.put((self._set_cyclic, (None, 0, 0, None), {}, callback))
+
+    def stop(self, timeout=5):
+        """Finish the queued commands and end the thread"""
+        self.stop_cyclic()
+        self.commands.put(None)
+        self.thread.join(timeout)
+
+    @property
+    def cyclic_running(self):
+        return self.cyclic is not None
+
+    def process_results(self):
+        """Run the callbacks of finished commands, call this from the Tk thread"""
+        while True:
+            try:
+                callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            callback(result, error)
+
+    def _set_cyclic(self, func, period, count, callback):
+        if func is None:
+            self.cyclic = None
+        else:
+            self.cyclic = [func, period, count, time.perf_counter(), callback]
+
+    def _execute(self, func, args, kwargs, callback):
+        try:
+            result, error = func(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+        if callback is not None:
+            self.results.put((callback, result, error))
+
+    def _run(self):
+        while True:
+            cyclic = self.cyclic
+            timeout = None if cyclic is None else max(0.0, cyclic[3] - time.perf_counter())
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = False
+            if command is None:
+                return
+            if command:
+                self._execute(*command)
+                continue
+
+            # A cyclic call is due
+            func, period, remaining, due, callback = cyclic
+            self._execute(func, (), {}, callback)
+            if remaining == 1:
+                self.cyclic = None
+            else:
+                cyclic[2] = remaining - 1 if remaining else 0
+                # Keep the period without bursts when a call took longer than one period
+                cyclic[3] = max(due + period, time.perf_counter())
@@ -0,0 +1,342 @@
+import threading
+import time
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+import can
+
+FLAG_EXTENDED = 1
+FLAG_RTR = 2
+FLAG_ERROR = 4
+FLAG_FD = 8
+FLAG_RX = 16
+
+MAX_DATA = 64
+
+COLUMNS = (
+    ('time', "Time", 110, tk.E),
+    ('id', "ID", 90, tk.E),
+    ('dir', "Dir", 60, tk.W),
+    ('dlc', "DLC", 40, tk.E),
+    ('data', "Data", 420, tk.W),
+    ('cycle', "Cycle (ms)", 80, tk.E),
+    ('count', "Count", 70, tk.E),
+)
+
+class FrameStore:
+    """
+    Ring buffer of the last `capacity` frames in preallocated arrays, a frame costs a few
+    array writes instead of a Message object kept alive. Also keeps the per-ID statistics
+    of the fixed view. Written by the notifier thread, read by the Tk thread.
+    """
+    def __init__(self, capacity=100000):
+        """
+        Initialize store
+        :param capacity: Frames kept, older frames are overwritten
+        """
+        self.capacity = capacity
+        self.timestamps = array('d', [0.0]) * capacity
+        self.ids = array('L', [0]) * capacity
+        self.dlcs = bytearray(capacity)
+        self.lengths = bytearray(capacity)
+        self.flags = bytearray(capacity)
+        self.data = bytearray(MAX_DATA * capacity)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.count = 0          # Frames appended since the last clear, never wraps
+            self.start_time = None
+            # (arbitration ID, extended) -> [count, timestamp, cycle time, dlc, flags, data]
+            self.per_id = {}
+            self._sorted_keys = []
+
+    def append(self, msg):
+        flags = ((FLAG_EXTENDED if msg.is_extended_id else 0) | (FLAG_RTR if msg.is_remote_frame else 0) |
+                 (FLAG_ERROR if msg.is_error_frame else 0) | (FLAG_FD if msg.is_fd else 0) |
+                 (FLAG_RX if msg.is_rx else 0))
+        data = msg.data
+        length = min(len(data), MAX_DATA)
+        timestamp = msg.timestamp
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = timestamp
+            slot = self.count % self.capacity
+            self.timestamps[slot] = timestamp
+            self.ids[slot] = msg.arbitration_id
+            self.dlcs[slot] = msg.dlc
+            self.lengths[slot] = length
+            self.flags[slot] = flags
+            offset = slot * MAX_DATA
+            self.data[offset:offset + length] = data[:length]
+            self.count += 1
+
+            key = (msg.arbitration_id, msg.is_extended_id)
+            entry = self.per_id.get(key)
+            if entry is None:
+                self.per_id[key] = [1, timestamp, None, msg.dlc, flags, bytes(data[:length])]
+            else:
+                entry[0] += 1
+                entry[2] = timestamp - entry[1]
+                entry[1] = timestamp
+                entry[3] = msg.dlc
+                entry[4] = flags
+                entry[5] = bytes(data[:length])
+
+    @property
+    def first(self):
+        """Index of the oldest frame still in the ring"""
+        return max(0, self.count - self.capacity)
+
+    def frames(self, start, n):
+        """
+        Read up to n frames by index
+        :return: List of (timestamp, arbitration ID, dlc, flags, data) tuples
+        """
+        rows = []
+        with self.lock:
+            start = max(start, self.first)
+            for index in range(start, min(start + n, self.count)):
+                slot = index % self.capacity
+                offset = slot * MAX_DATA
+                rows.append((self.timestamps[slot], self.ids[slot], self.dlcs[slot], self.flags[slot],
+                             bytes(self.data[offset:offset + self.lengths[slot]])))
+        return rows
+
+    def fixed(self, start, n):
+        """
+        Read up to n per-ID rows, sorted by ID
+        :return: List of (arbitration ID, [count, timestamp, cycle time, dlc, flags, data]) tuples
+        """
+        with self.lock:
+            if len(self._sorted_keys) != len(self.per_id):
+                self._sorted_keys = sorted(self.per_id)
+            return [(key[0], list(self.per_id[key])) for key in self._sorted_keys[start:start + n]]
+
+class TraceListener(can.Listener):
+    """Notifier listener writing every received frame into a FrameStore"""
+    def __init__(self, store):
+        self.store = store
+
+    def on_message_received(self, msg):
+        self.store.append(msg)
+
+class TraceTable(ttk.Frame):
+    """
+    CAN trace view. Only the rows that fit in the window exist as Treeview items; they are
+    refilled from the FrameStore on a root.after timer, so the Tk cost depends on the window
+    height and the refresh rate, not on the bus load.
+    Chronological mode follows the newest frames until scrolled up, fixed mode shows one row
+    per ID updated in place with its cycle time and count.
+    """
+    def __init__(self, master, capacity=100000, interval_ms=100, **kwargs):
+        """
+        Initialize table
+        :param master: Parent widget
+        :param capacity: Frames kept for scrolling back in chronological mode
+        :param interval_ms: Milliseconds between two redraws
+        """
+        super().__init__(master, **kwargs)
+        self.store = FrameStore(capacity)
+        self.listener = TraceListener(self.store)
+        self.notifier = None
+        self.filters = None         # Filters of the traced buses, put back when capturing stops
+        self.capturing = False
+        self.interval_ms = interval_ms
+        self.top = None             # First shown frame index (chronological) or row (fixed), None follows the end
+        self.visible_rows = 0
+        self.items = []
+        self.shown = []
+        self.dirty = True
+        self.rate_count = 0
+        self.rate_time = time.perf_counter()
+        self.rate = 0.0
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        toolbar = ttk.Frame(self)
+        toolbar.grid(column=0, row=0, columnspan=2, sticky=(tk.W, tk.E))
+        # Capturing lifts the bus filters, so it is only on when asked for
+        self.capture_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Capture", variable=self.capture_var,
+                        command=self._capture_changed).grid(column=0, row=0, padx=5, pady=2)
+        self.mode_var = tk.StringVar(value="chronological")
+        ttk.Radiobutton(toolbar, text="Chronological", variable=self.mode_var, value="chronological",
+                        command=self._mode_changed).grid(column=1, row=0, padx=5, pady=2)
+        ttk.Radiobutton(toolbar, text="Fixed", variable=self.mode_var, value="fixed",
+                        command=self._mode_changed).grid(column=2, row=0, padx=5, pady=2)
+        self.pause_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="Pause", variable=self.pause_var).grid(column=3, row=0, padx=5, pady=2)
+        ttk.Button(toolbar, text="Clear", command=self.clear).grid(column=4, row=0, padx=5, pady=2)
+        self.status_label = ttk.Label(toolbar, text="", anchor=tk.W)
+        self.status_label.grid(column=5, row=0, padx=5, pady=2, sticky=tk.W)
+
+        self.tree = ttk.Treeview(self, columns=[column[0] for column in COLUMNS], show='headings',
+                                 selectmode='none', height=20)
+        for name, heading, width, anchor in COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, anchor=anchor, stretch=(name == 'data'))
+        self.tree.grid(column=0, row=1, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scroll)
+        self.scrollbar.grid(column=1, row=1, sticky=(tk.N, tk.S))
+
+        self.row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', lambda event: self._on_scroll('scroll', -event.delta // 120, 'units'))
+        self.tree.bind('<Button-4>', lambda event: self._on_scroll('scroll', -3, 'units'))
+        self.tree.bind('<Button-5>', lambda event: self._on_scroll('scroll', 3, 'units'))
+        self._set_visible_rows(20)
+        self.after(self.interval_ms, self._refresh)
+
+    def attach(self, notifier, filters=None):
+        """
+        Trace the buses of a notifier while Capture is on
+        :param notifier: Notifier of the buses
+        :param filters: can_filters of the buses, put back when capturing stops
+        """
+        self.detach()
+        self.notifier = notifier
+        self.filters = filters
+        if self.capture_var.get():
+            self._start_capture()
+
+    def detach(self):
+        """Stop tracing and put the bus filters back"""
+        self._stop_capture()
+        self.notifier = None
+        self.filters = None
+
+    def _buses(self):
+        return self.notifier.bus if isinstance(self.notifier.bus, list) else [self.notifier.bus]
+
+    def _capture_changed(self):
+        if self.capture_var.get():
+            self._start_capture()
+        else:
+            self._stop_capture()
+
+    def _start_capture(self):
+        if self.notifier is None or self.capturing:
+            return
+        for bus in self._buses():
+            # Stacks filter on their response ID, the trace needs every frame
+            bus.set_filters(None)
+        self.notifier.add_listener(self.listener)
+        self.capturing = True
+
+    def _stop_capture(self):
+        if not self.capturing:
+            return
+        try:
+            self.notifier.remove_listener(self.listener)
+        except ValueError:
+            pass
+        for bus in self._buses():
+            bus.set_filters(self.filters)
+        self.capturing = False
+
+    def clear(self):
+        self.store.clear()
+        self.top = None
+        self.rate_count = 0
+        self.dirty = True
+
+    def _mode_changed(self):
+        self.top = None
+        self.dirty = True
+
+    def _set_visible_rows(self, rows):
+        if rows == self.visible_rows:
+            return
+        for item in self.items:
+            self.tree.delete(item)
+        self.items = [self.tree.insert('', tk.END, values=()) for _ in range(rows)]
+        self.shown = [None] * rows
+        self.visible_rows = rows
+        self.dirty = True
+
+    def _on_resize(self, event):
+        # One row height is taken by the heading
+        self._set_visible_rows(max(1, event.height // self.row_height - 1))
+
+    def _span(self):
+        """(first index, number of rows) of the current mode"""
+        if self.mode_var.get() == "fixed":
+            return 0, len(self.store.per_id)
+        first = self.store.first
+        return first, self.store.count - first
+
+    def _top_offset(self, first, total):
+        last_top = max(0, total - self.visible_rows)
+        if self.top is None:
+            return last_top if self.mode_var.get() == "chronological" else 0
+        return min(max(self.top - first, 0), last_top)
+
+    def _on_scroll(self, action, value, unit=None):
+        first, total = self._span()
+        if action == 'moveto':
+            offset = int(float(value) * total)
+        else:
+            step = int(value) * (self.visible_rows if unit == 'pages' else 1)
+            offset = self._top_offset(first, total) + step
+        offset = min(max(offset, 0), max(0, total - self.visible_rows))
+        if self.mode_var.get() == "chronological" and offset >= total - self.visible_rows:
+            self.top = None
+        else:
+            self.top = first + offset
+        self.dirty = True
+        self._draw()
+
+    def _refresh(self):
+        now = time.perf_counter()
+        if now - self.rate_time >= 1.0:
+            count = self.store.count
+            self.rate = (count - self.rate_count) / (now - self.rate_time)
+            self.rate_count = count
+            self.rate_time = now
+        if not self.pause_var.get() or self.dirty:
+            self._draw()
+        self.status_label.configure(text=f"{self.store.count} frames, {self.rate:.0f} frames/s, "
+                                         f"{len(self.store.per_id)} IDs")
+        self.after(self.interval_ms, self._refresh)
+
+    def _draw(self):
+        first, total = self._span()
+        offset = self._top_offset(first, total)
+        start_time = self.store.start_time or 0.0
+        if self.mode_var.get() == "fixed":
+            rows = [self._format(entry[1], arbitration_id, entry[3], entry[4], entry[5], entry[2], entry[0], start_time)
+                    for arbitration_id, entry in self.store.fixed(offset, self.visible_rows)]
+        else:
+            rows = [self._format(timestamp, arbitration_id, dlc, flags, data, None, None, start_time)
+                    for timestamp, arbitration_id, dlc, flags, data in self.store.frames(first + offset, self.visible_rows)]
+        rows.extend([()] * (self.visible_rows - len(rows)))
+        for index, values in enumerate(rows):
+            # Only touch the items whose text changed
+            if self.shown[index] != values:
+                self.tree.item(self.items[index], values=values)
+                self.shown[index] = values
+        if total > 0:
+            self.scrollbar.set(offset / total, min(1.0, (offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.dirty = False
+
+    @staticmethod
+    def _format(timestamp, arbitration_id, dlc, flags, data, cycle, count, start_time):
+        if flags & FLAG_ERROR:
+            id_text = "Error"
+        elif flags & FLAG_EXTENDED:
+            id_text = f"{arbitration_id:08X}x"
+        else:
+            id_text = f"{arbitration_id:03X}"
+        direction = "Rx" if flags & FLAG_RX else "Tx"
+        if flags & FLAG_FD:
+            direction += " FD"
+        data_text = "Remote" if flags & FLAG_RTR else data.hex(' ').upper()
+        cycle_text = f"{cycle * 1000:.1f}" if cycle is not None else ""
+        count_text = str(count) if count is not None else ""
+        return (f"{timestamp - start_time:.6f}", id_text, direction, dlc, data_text, cycle_text, count_text)
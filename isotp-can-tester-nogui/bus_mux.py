@@ -0,0 +1,415 @@
+import argparse
+import collections
+import os
+import queue
+import select
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import can
+
+# Record layout, little endian:
+#   FRAME   B type, d timestamp, I arbitration id, B flags, B data length, data
+#   FILTERS B type, H count, count x (I can_id, I can_mask, B extended: 0/1/2=any)
+_FRAME = 1
+_FILTERS = 2
+_FRAME_HEADER = struct.Struct('<BdIBB')
+_FILTERS_HEADER = struct.Struct('<BH')
+_FILTER_ENTRY = struct.Struct('<IIB')
+
+_EXTENDED, _REMOTE, _ERROR, _FD, _BRS, _ESI = 1, 2, 4, 8, 16, 32
+
+DEFAULT_ADDRESS = 'tcp:127.0.0.1:29536' if os.name == 'nt' else 'unix:/tmp/can_mux.sock'
+
+def _pack_frame(msg):
+    flags = ((_EXTENDED if msg.is_extended_id else 0) | (_REMOTE if msg.is_remote_frame else 0) |
+             (_ERROR if msg.is_error_frame else 0) | (_FD if msg.is_fd else 0) |
+             (_BRS if msg.bitrate_switch else 0) | (_ESI if msg.error_state_indicator else 0))
+    data = bytes(msg.data) if msg.data is not None else b''
+    return _FRAME_HEADER.pack(_FRAME, msg.timestamp or time.time(), msg.arbitration_id, flags, len(data)) + data
+
+def _pack_filters(filters):
+    out = [_FILTERS_HEADER.pack(_FILTERS, len(filters))]
+    for entry in filters:
+        extended = entry.get('extended')
+        out.append(_FILTER_ENTRY.pack(entry['can_id'], entry['can_mask'], 2 if extended is None else int(extended)))
+    return b''.join(out)
+
+def _parse_records(buffer, on_frame, on_filters):
+    """
+    Parse complete records from the start of buffer
+    :return: Number of bytes consumed
+    """
+    offset = 0
+    size = len(buffer)
+    while offset < size:
+        kind = buffer[offset]
+        if kind == _FRAME:
+            if size - offset < _FRAME_HEADER.size:
+                break
+            _, timestamp, arbitration_id, flags, length = _FRAME_HEADER.unpack_from(buffer, offset)
+            end = offset + _FRAME_HEADER.size + length
+            if end > size:
+                break
+            on_frame(can.Message(
+                timestamp=timestamp,
+                arbitration_id=arbitration_id,
+                is_extended_id=bool(flags & _EXTENDED),
+                is_remote_frame=bool(flags & _REMOTE),
+                is_error_frame=bool(flags & _ERROR),
+                is_fd=bool(flags & _FD),
+                bitrate_switch=bool(flags & _BRS),
+                error_state_indicator=bool(flags & _ESI),
+                dlc=length,
+                data=bytes(buffer[offset + _FRAME_HEADER.size:end]),
+            ))
+            offset = end
+        elif kind == _FILTERS:
+            if size - offset < _FILTERS_HEADER.size:
+                break
+            _, count = _FILTERS_HEADER.unpack_from(buffer, offset)
+            end = offset + _FILTERS_HEADER.size + count * _FILTER_ENTRY.size
+            if end > size:
+                break
+            filters = []
+            for index in range(count):
+                can_id, can_mask, extended = _FILTER_ENTRY.unpack_from(buffer, offset + _FILTERS_HEADER.size + index * _FILTER_ENTRY.size)
+                filters.append((can_id, can_mask, None if extended == 2 else bool(extended)))
+            on_filters(filters)
+            offset = end
+        else:
+            raise ValueError(f"Corrupt mux stream, record type {kind}")
+    return offset
+
+def _open_socket(address):
+    kind, _, rest = address.partition(':')
+    if kind == 'unix':
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), rest
+    if kind == 'tcp':
+        host, _, port = rest.rpartition(':')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, (host, int(port))
+    raise ValueError(f"Unsupported mux address: {address}")
+
+class _MuxClient:
+    """Server side of one connection, sends from its own thread so a slow client never blocks the bus"""
+    def __init__(self, server, sock, name, max_queue):
+        self.server = server
+        self.sock = sock
+        self.name = name
+        self.filters = None         # None receives everything
+        self.buffer = bytearray()
+        self.out = queue.Queue(max_queue)
+        self.forwarded = 0
+        self.dropped = 0
+        self.dead = False           # Set by the sender thread when the connection failed
+        self.thread = threading.Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+
+    def wants(self, msg):
+        filters = self.filters
+        if filters is None:
+            return True
+        arbitration_id = msg.arbitration_id
+        for can_id, can_mask, extended in filters:
+            if (arbitration_id ^ can_id) & can_mask == 0 and (extended is None or extended == msg.is_extended_id):
+                return True
+        return False
+
+    def push(self, record):
+        if self.dead:
+            return
+        try:
+            self.out.put_nowait(record)
+            self.forwarded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _send_loop(self):
+        get = self.out.get
+        get_nowait = self.out.get_nowait
+        while True:
+            record = get()
+            if record is None:
+                return
+            chunks = [record]
+            try:
+                while len(chunks) < 256:
+                    chunks.append(get_nowait())
+            except queue.Empty:
+                pass
+            closing = chunks[-1] is None
+            if closing:
+                chunks.pop()
+            try:
+                self.sock.sendall(b''.join(chunks))
+            except OSError:
+                # The selector belongs to the IO thread, let it drop the client
+                self.dead = True
+                self.server._client_died(self)
+                return
+            if closing:
+                return
+
+    def close(self, timeout=2.0):
+        """Let the sender thread write what is still queued, then close the socket"""
+        if self.thread.is_alive():
+            try:
+                self.out.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self.thread.join(timeout)
+        if self.thread.is_alive():
+            # The peer stopped reading, unblock sendall
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.thread.join(timeout)
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class BusMuxServer(can.Listener):
+    """Owns the physical bus and shares it with client processes connected through MuxBus"""
+    def __init__(self, bus, notifier, address=DEFAULT_ADDRESS, local_echo=True, max_queue=10000):
+        """
+        Initialize server
+        :param bus: The real CAN bus
+        :param notifier: Its notifier, the server registers as a listener
+        :param address: 'unix:/path' or 'tcp:host:port'
+        :param local_echo: Frames sent by one client are delivered to the other clients as well
+        :param max_queue: Records buffered per client before frames are dropped for it
+        """
+        self.bus = bus
+        self.notifier = notifier
+        self.address = address
+        self.local_echo = local_echo
+        self.max_queue = max_queue
+        self.clients = []
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.listen_sock, bind_address = _open_socket(address)
+        if isinstance(bind_address, str) and os.path.exists(bind_address):
+            os.unlink(bind_address)
+        if not isinstance(bind_address, str):
+            self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_sock.bind(bind_address)
+        self.listen_sock.listen()
+        self.listen_sock.setblocking(False)
+        self.selector.register(self.listen_sock, selectors.EVENT_READ)
+        # Sender threads report failed clients here and wake the IO loop through the socket pair
+        self.dead_clients = queue.Queue()
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ)
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.send_errors = 0
+
+    def start(self):
+        self.running = True
+        self.notifier.add_listener(self)
+        self.thread = threading.Thread(target=self._io_loop, daemon=True)
+        self.thread.start()
+        print(f"[MUX] Serving {self.bus.channel_info} on {self.address}")
+
+    def stop(self):
+        self.running = False
+        try:
+            self.notifier.remove_listener(self)
+        except ValueError:
+            pass
+        if self.thread:
+            self.thread.join()
+        # The IO thread is gone, clients are dropped from this thread now
+        for client in list(self.clients):
+            self._drop_client(client)
+        self.selector.close()
+        self.listen_sock.close()
+        self.wake_recv.close()
+        self.wake_send.close()
+        kind, _, path = self.address.partition(':')
+        if kind == 'unix' and os.path.exists(path):
+            os.unlink(path)
+
+    def on_message_received(self, msg):
+        """Frame from the real bus: pack once, queue for every client whose filters match"""
+        record = None
+        for client in self.clients:
+            if client.wants(msg):
+                if record is None:
+                    record = _pack_frame(msg)
+                client.push(record)
+
+    def _client_died(self, client):
+        """Called by a client's sender thread, the IO loop drops the client"""
+        self.dead_clients.put(client)
+        try:
+            self.wake_send.send(b'\0')
+        except OSError:
+            pass
+
+    def _drop_client(self, client):
+        """Unregister and close a client, only on the IO thread or after it ended"""
+        with self.lock:
+            if client not in self.clients:
+                return
+            self.clients = [c for c in self.clients if c is not client]
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError, OSError):
+            pass
+        client.close()
+        print(f"[MUX] {client.name} disconnected, {client.forwarded} frames forwarded, {client.dropped} dropped")
+
+    def _io_loop(self):
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                if key.fileobj is self.wake_recv:
+                    try:
+                        self.wake_recv.recv(4096)
+                    except OSError:
+                        pass
+                    while not self.dead_clients.empty():
+                        self._drop_client(self.dead_clients.get_nowait())
+                    continue
+                if key.fileobj is self.listen_sock:
+                    sock, peer = self.listen_sock.accept()
+                    sock.setblocking(True)
+                    client = _MuxClient(self, sock, f"client {peer or sock.fileno()}", self.max_queue)
+                    with self.lock:
+                        self.clients = self.clients + [client]     # Copy on write, read without lock by the notifier
+                    self.selector.register(sock, selectors.EVENT_READ, client)
+                    print(f"[MUX] {client.name} connected")
+                    continue
+                client = key.data
+                try:
+                    chunk = client.sock.recv(65536)
+                except OSError:
+                    chunk = b''
+                if not chunk:
+                    self._drop_client(client)
+                    continue
+                client.buffer += chunk
+                try:
+                    used = _parse_records(client.buffer, lambda msg: self._client_frame(client, msg),
+                                          lambda filters: setattr(client, 'filters', filters or None))
+                except ValueError as e:
+                    print(f"[MUX] {client.name}: {e}")
+                    self._drop_client(client)
+                    continue
+                del client.buffer[:used]
+
+    def _client_frame(self, sender, msg):
+        try:
+            self.bus.send(msg)
+            self.sent += 1
+        except can.CanError as e:
+            self.send_errors += 1
+            print(f"[MUX] Send failed for {sender.name}: {e}")
+            return
+        if self.local_echo:
+            msg.timestamp = time.time()
+            record = None
+            for client in self.clients:
+                if client is not sender and client.wants(msg):
+                    if record is None:
+                        record = _pack_frame(msg)
+                    client.push(record)
+
+class MuxBus(can.BusABC):
+    """python-can bus talking to a BusMuxServer, usable wherever a Bus is expected"""
+    def __init__(self, channel=DEFAULT_ADDRESS, can_filters=None, **kwargs):
+        """
+        Connect to a mux server
+        :param channel: Server address, 'unix:/path' or 'tcp:host:port'
+        :param can_filters: python-can filters, applied in the server
+        """
+        self.sock, address = _open_socket(channel)
+        try:
+            self.sock.connect(address)
+        except OSError as e:
+            raise can.CanInitializationError(f"Cannot connect to bus mux at {channel}: {e}") from e
+        self.channel_info = f"mux {channel}"
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._send_lock = threading.Lock()
+        super().__init__(channel=channel, can_filters=can_filters, **kwargs)
+
+    def _apply_filters(self, filters):
+        with self._send_lock:
+            self.sock.sendall(_pack_filters(filters or []))
+        self._is_filtered = bool(filters)
+
+    def send(self, msg, timeout=None):
+        record = _pack_frame(msg)
+        try:
+            with self._send_lock:
+                self.sock.sendall(record)
+        except OSError as e:
+            raise can.CanOperationError(f"Bus mux connection lost: {e}") from e
+
+    def _recv_internal(self, timeout):
+        if self._pending:
+            return self._pending.popleft(), self._is_filtered
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready, _, _ = select.select([self.sock], [], [], remaining)
+            if not ready:
+                return None, self._is_filtered
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise can.CanOperationError("Bus mux closed the connection")
+            self._buffer += chunk
+            used = _parse_records(self._buffer, self._pending.append, lambda filters: None)
+            del self._buffer[:used]
+            if self._pending:
+                return self._pending.popleft(), self._is_filtered
+
+    def shutdown(self):
+        super().shutdown()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+def main():
+    from isotp_server import DEFAULT_PROFILE_FILE, load_profile
+    from uds_server_common import CANBusFactory
+
+    parser = argparse.ArgumentParser(description="Share one CAN adapter between several processes")
+    parser.add_argument('--profile', default='pcan', help="Bus profile from the profile file (default: pcan)")
+    parser.add_argument('--profiles', default=DEFAULT_PROFILE_FILE, help="Profile file")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help="unix:/path or tcp:host:port")
+    parser.add_argument('--no-echo', action='store_true', help="Do not deliver one client's frames to the others")
+    args = parser.parse_args()
+
+    profile, _ = load_profile(args.profiles, args.profile)
+    bus_config = dict(profile.get('bus', {}))
+    try:
+        can_factory = CANBusFactory(channel_type=profile['interface'], is_fd=bus_config.get('fd', False), **bus_config)
+        bus, notifier = can_factory.create_bus()
+        server = BusMuxServer(bus, notifier, args.address, local_echo=not args.no_echo)
+        server.start()
+        while True:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+    finally:
+        if 'server' in locals():
+            server.stop()
+        if 'notifier' in locals():
+            notifier.stop()
+        if 'bus' in locals():
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
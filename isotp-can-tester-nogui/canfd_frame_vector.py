@@ -1,57 +1,85 @@
-import can
-import isotp
-import time
-import random
-from can.interface import Bus
-import logging
-from config import Config
-import sys
-import binascii
+import argparse
 import json
+import sys
+
+import can
+
+from frame_generator import FrameGenerator, frame_bits, rate_for_load, run_periodic
+from uds_server_common import CANBusFactory
+
+# Vector CAN-FD setup this script always used
+VECTOR_CONFIG = {
+    'channel': '0',
+    'app_name': 'Python_ISOTP_Server',
+    'fd': True,
+    'bitrate': 500000,
+    'data_bitrate': 2000000,
+    'tseg1_abr': 63,
+    'tseg2_abr': 16,
+    'sjw_abr': 16,
+    'sam_abr': 1,
+    'tseg1_dbr': 13,
+    'tseg2_dbr': 6,
+    'sjw_dbr': 6,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Send one frame at a fixed rate or bus load")
+    parser.add_argument('--interface', default='vector', choices=['vector', 'pcan', 'slcan', 'socketcan', 'virtual'])
+    parser.add_argument('--channel', help="Channel, defaults to the interface default")
+    parser.add_argument('--id', type=lambda text: int(text, 16), default=0x99, help="Arbitration ID in hex")
+    #VCU_02
+    parser.add_argument('--data', default='FE3FFE7FFEFF3800', help="Payload in hex")
+    parser.add_argument('--classic', action='store_true', help="Send classic CAN instead of CAN-FD frames")
+    parser.add_argument('--brs', action='store_true', help="CAN-FD bitrate switch")
+    rate = parser.add_mutually_exclusive_group()
+    rate.add_argument('--rate', type=float, default=10, help="Frames per second")
+    rate.add_argument('--load', type=float, help="Target bus load in percent, e.g. 70")
+    parser.add_argument('--count', type=int, default=6000, help="Frames to send, 0 for no limit")
+    parser.add_argument('--duration', type=float, help="Seconds to send")
+    parser.add_argument('--timing', default='hybrid', choices=['sleep', 'busy', 'hybrid'])
+    parser.add_argument('--batch', type=int, default=1, help="Frames sent back to back per deadline")
+    parser.add_argument('--periodic', action='store_true', help="Use bus.send_periodic (interface cyclic transmit)")
+    args = parser.parse_args()
+
+    bus_config = dict(VECTOR_CONFIG) if args.interface == 'vector' else {'fd': not args.classic}
+    if args.channel:
+        bus_config['handle' if args.interface == 'pcan' else 'port' if args.interface == 'slcan' else 'channel'] = args.channel
+    bitrate = bus_config.get('bitrate', 500000)
+    data_bitrate = bus_config.get('data_bitrate', 2000000)
+
+    msg = can.Message(arbitration_id=args.id, is_extended_id=False, data=bytes.fromhex(args.data),
+                      is_fd=not args.classic, bitrate_switch=args.brs and not args.classic)
+    frames_per_s = rate_for_load(msg, args.load, bitrate, data_bitrate) if args.load else args.rate
+    print(f"ID {args.id:#05X}, {frame_bits(msg, bitrate, data_bitrate):.0f} bit times per frame, "
+          f"target {frames_per_s:.1f} frames/s")
+
+    try:
+        bus, notifier = CANBusFactory(channel_type=args.interface, is_fd=not args.classic, **bus_config).create_bus()
+    except Exception as e:
+        print(f"Failed to initialize {args.interface} bus: {e}")
+        return 1
+
+    try:
+        if args.periodic:
+            duration = args.duration or (args.count / frames_per_s if args.count else None)
+            if duration is None:
+                print("--periodic needs --duration or --count")
+                return 1
+            stats = run_periodic(bus, msg, frames_per_s, duration)
+        else:
+            generator = FrameGenerator(bus, msg, frames_per_s, timing=args.timing, batch=args.batch)
+            stats = generator.run(count=args.count or None, duration=args.duration)
+            stats['bus_load_percent'] = FrameGenerator.bus_load(stats, msg, bitrate, data_bitrate)
+        print(json.dumps(stats, indent=2))
+    except KeyboardInterrupt:
+        print("Stopped sending messages.")
+    except Exception as e:
+        print(f"Error sending message: {e}")
+    finally:
+        notifier.stop()
+        bus.shutdown()
+    return 0
 
-can.rc['interface'] = 'vector'
-can.rc['bustype'] = 'vector'
-can.rc['channel'] = '0'
-can.rc['app_name'] = 'Python_ISOTP_Server'
- 
-can.rc['fd'] = True  
-can.rc['bitrate'] = 500000
-can.rc['data_bitrate'] = 2000000
-
-can.rc['tseg1_abr'] = 63
-can.rc['tseg2_abr'] = 16
-can.rc['sjw_abr'] = 16
-
-can.rc['sam_abr'] = 1
-can.rc['tseg1_dbr'] = 13
-can.rc['tseg2_dbr'] = 6
-can.rc['sjw_dbr'] = 6
-
-try:
-    bus = Bus()
-    notifier = can.Notifier(bus, [])
-    print("Vector bus initialized successfully.\r\n")
-except Exception as e:
-    print(f"Failed to initialize Vector bus: {e}")
-    exit(1)
-
-#VCU_02
-msg = can.Message(arbitration_id = 0x99, is_extended_id=False, data=[0xFE, 0x3F, 0xFE, 0x7F, 0xFE, 0xFF, 0x38, 0x00], is_fd=True)
-
-total_messages = 6000
-
-try:
-    sent_count = 0
-    while sent_count < total_messages:
-        bus.send(msg)
-        # print(f"Message sent on CAN ID {msg.arbitration_id}: {binascii.hexlify(msg.data)}")
-        sent_count += 1
-        time.sleep(0.1)  
-        # time.sleep(1)  
-    print(f"Sent {total_messages} messages. Exiting.")
-except KeyboardInterrupt:
-    print("Stopped sending messages.")
-except Exception as e:
-    print(f"Error sending message: {e}")
-finally:
-    bus.shutdown()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
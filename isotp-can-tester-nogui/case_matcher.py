@@ -0,0 +1,193 @@
+import re
+
+# Request pattern tokens:
+#   "22"     exact byte
+#   "??"     any byte ("XX" is accepted as well)
+#   "3?"     nibble wildcard, high or low nibble
+#   "F0/F0"  explicit value/mask
+#   "*"      any number of trailing bytes, must be the last token
+_REQ_TOKEN = re.compile(r'\*|[0-9A-Fa-f?Xx]{2}(?:/[0-9A-Fa-f]{2})?')
+
+# Response template tokens:
+#   "62"     literal byte
+#   "{1}"    echo request byte 1
+#   "{1:3}"  echo request bytes 1..2, "{4:}" echoes up to the end
+#   "{0|40}" echo request byte 0 OR'ed with 0x40 (positive response SID)
+_RES_TOKEN = re.compile(r'\{(\d+)(?::(\d*))?(?:\|([0-9A-Fa-f]{2}))?\}|[0-9A-Fa-f]{2}')
+
+
+def _tokenize(pattern, token_re):
+    """Split a pattern string into tokens, rejecting anything unparsable"""
+    compact = ''.join(pattern.split())
+    matches = list(token_re.finditer(compact))
+    if ''.join(m.group(0) for m in matches) != compact:
+        raise ValueError(f"Invalid pattern: {pattern}")
+    return matches
+
+
+def _parse_req_byte(token):
+    """Convert a request token into a (value, mask) pair"""
+    if '/' in token:
+        value, mask = token.split('/')
+        mask = int(mask, 16)
+        return int(value, 16) & mask, mask
+    token = token.upper().replace('X', '?')
+    if token == '??':
+        return 0x00, 0x00
+    if token[0] == '?':
+        return int(token[1], 16), 0x0F
+    if token[1] == '?':
+        return int(token[0], 16) << 4, 0xF0
+    return int(token, 16), 0xFF
+
+
+class _Node:
+    """Trie node, one level per request byte"""
+    __slots__ = ('exact', 'masked', 'rules', 'tail_rules')
+
+    def __init__(self):
+        self.exact = {}         # byte -> _Node
+        self.masked = []        # [(value, mask, _Node)]
+        self.rules = []         # rules ending exactly at this depth
+        self.tail_rules = []    # rules ending with '*' at this depth
+
+
+class CaseRule:
+    """A compiled request pattern and its response template"""
+    def __init__(self, case):
+        """
+        Compile a test case entry
+        :param case: dict with 'req', 'res' and optional 'len'/'min_len'/'max_len'
+        """
+        self.source = case
+        self.req = []
+        self.has_tail = False
+        for m in _tokenize(case["req"], _REQ_TOKEN):
+            token = m.group(0)
+            if self.has_tail:
+                raise ValueError(f"'*' must be the last token: {case['req']}")
+            if token == '*':
+                self.has_tail = True
+            else:
+                self.req.append(_parse_req_byte(token))
+
+        # Without '*' the trie already pins the length to len(self.req)
+        if 'len' in case:
+            self.min_len = self.max_len = int(case['len'])
+        else:
+            self.min_len = int(case.get('min_len', 0))
+            self.max_len = int(case['max_len']) if 'max_len' in case else None
+        self.min_len = max(self.min_len, len(self.req))
+
+        self.parts = []
+        for m in _tokenize(case["res"], _RES_TOKEN):
+            if m.group(1) is None:
+                self.parts.append(bytes.fromhex(m.group(0)))
+                continue
+            start = int(m.group(1))
+            if m.group(2) is not None:
+                stop = int(m.group(2)) if m.group(2) else None
+                if max(start, stop or 0) > self.min_len:
+                    raise ValueError(f"Echo {m.group(0)} exceeds request length: {case['req']}")
+                self.parts.append(slice(start, stop))
+            else:
+                if start >= self.min_len:
+                    raise ValueError(f"Echo {m.group(0)} exceeds request length: {case['req']}")
+                self.parts.append((start, int(m.group(3), 16) if m.group(3) else 0))
+
+        # Collapse fully literal templates into one pre-built response
+        if all(isinstance(part, bytes) for part in self.parts):
+            self.static = b''.join(self.parts)
+        else:
+            self.static = None
+
+    def accepts_length(self, length):
+        if length < self.min_len:
+            return False
+        return self.max_len is None or length <= self.max_len
+
+    def render(self, payload):
+        """Build the response for a matching request"""
+        if self.static is not None:
+            return self.static
+        out = bytearray()
+        for part in self.parts:
+            if isinstance(part, bytes):
+                out += part
+            elif isinstance(part, slice):
+                out += payload[part]
+            else:
+                out.append(payload[part[0]] | part[1])
+        return bytes(out)
+
+
+class CaseMatcher:
+    """Byte trie over request patterns with masked/wildcard segments"""
+    def __init__(self):
+        self.root = _Node()
+        self.count = 0
+
+    def add(self, case):
+        """
+        Compile and insert a test case
+        :param case: Test case entry from the JSON file
+        :return: The compiled CaseRule
+        """
+        rule = CaseRule(case)
+        node = self.root
+        for value, mask in rule.req:
+            if mask == 0xFF:
+                node = node.exact.setdefault(value, _Node())
+                continue
+            for m_value, m_mask, child in node.masked:
+                if m_value == value and m_mask == mask:
+                    node = child
+                    break
+            else:
+                child = _Node()
+                node.masked.append((value, mask, child))
+                node = child
+        (node.tail_rules if rule.has_tail else node.rules).append(rule)
+        self.count += 1
+        return rule
+
+    def match(self, payload):
+        """
+        Find the most specific rule for a request
+        Exact bytes are preferred over masked ones at every depth, then
+        rules are tried in the order they were added.
+        :param payload: Request data
+        :return: Matching CaseRule or None
+        """
+        return self._walk(self.root, payload, 0, len(payload))
+
+    def _walk(self, node, payload, depth, length):
+        if depth < length:
+            byte = payload[depth]
+            child = node.exact.get(byte)
+            if child is not None:
+                rule = self._walk(child, payload, depth + 1, length)
+                if rule is not None:
+                    return rule
+            for value, mask, child in node.masked:
+                if byte & mask == value:
+                    rule = self._walk(child, payload, depth + 1, length)
+                    if rule is not None:
+                        return rule
+        else:
+            for rule in node.rules:
+                if rule.accepts_length(length):
+                    return rule
+        for rule in node.tail_rules:
+            if rule.accepts_length(length):
+                return rule
+        return None
+
+    def find_response(self, payload):
+        """
+        Match a request and render its response
+        :param payload: Request data
+        :return: Response bytes or None
+        """
+        rule = self.match(payload)
+        return rule.render(payload) if rule is not None else None
@@ -1,16 +1,68 @@
 import json
+from case_matcher import CaseMatcher
 
 class Config:
     def load_case(self, config_file):
         try:
             with open(config_file, "r") as fd:
                 self.config = json.load(fd)
-                return self.config
-        except:
-            print("test case file parse failed")
+        except (OSError, ValueError) as e:
+            print(f"test case file parse failed: {e}")
             return None
+        if not isinstance(self.config, list):
+            print("test case file parse failed: expected a list of cases")
+            return None
+        self._build_index()
+        return self.config
+
+    def _build_index(self):
+        """Build request bytes -> (response hex, response bytes) table"""
+        self.case_table = {}
+        self.matcher = CaseMatcher()
+        self.add_cases(self.config)
+
+    def add_cases(self, cases):
+        """
+        Add cases on top of the loaded file
+        Plain hex cases go to the exact table, anything using wildcards,
+        length constraints or response templates goes to the pattern matcher.
+        A malformed entry is reported and skipped, the others are still loaded.
+        :param cases: List of {"req": ..., "res": ...} entries
+        """
+        for index, case in enumerate(cases):
+            try:
+                req = self._literal(case)
+                if req is None:
+                    self.matcher.add(case)
+                elif req not in self.case_table:  # First definition wins, same as the old linear scan
+                    self.case_table[req] = (case["res"], bytes.fromhex(case["res"]))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"test case {index} skipped: {e!r} in {case}")
+
+    def _literal(self, case):
+        """Return the request bytes of a plain hex case, None for patterns"""
+        if 'len' in case or 'min_len' in case or 'max_len' in case or '{' in case["res"]:
+            return None
+        try:
+            return bytes.fromhex(case["req"])
+        except ValueError:
+            return None
+
     def find_case(self, req):
-        for case in self.config:
-            if case["req"].upper() == req:
-                return case["res"]
-        return None
+        try:
+            payload = bytes.fromhex(req)
+        except ValueError:
+            return None
+        entry = self.case_table.get(payload)
+        if entry is not None:
+            return entry[0] or None
+        response = self.matcher.find_response(payload)
+        return response.hex().upper() if response else None
+
+    def find_response(self, payload):
+        """Look up the response bytes for a raw request payload, None when there is no (non-empty) response"""
+        entry = self.case_table.get(bytes(payload))
+        if entry is not None:
+            # An empty response means no answer, the caller sends its NRC like it did for "" before
+            return entry[1] or None
+        return self.matcher.find_response(payload) or None
@@ -0,0 +1,254 @@
+import abc
+import binascii
+import mmap
+import os
+from array import array
+
+HEX_SUFFIXES = ('.hex', '.ihex', '.ihx')
+SREC_SUFFIXES = ('.s19', '.s28', '.s37', '.srec', '.mot')
+
+class FirmwareImage(abc.ABC):
+    """
+    Base class of the image readers.
+    An image is a list of (address, length) segments. Segment data is handed out as
+    memoryview blocks, so TransferData payloads are cut from the file mapping (BIN) or
+    from one decoded segment buffer (HEX/S-record) without further copies.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+        self._segments = None
+
+    def _open_map(self):
+        """Map the whole file read-only, None for an empty file"""
+        if self._map is None and self._file is None:
+            self._file = open(self.path, 'rb') if isinstance(self.path, str) else self.path
+            if os.fstat(self._file.fileno()).st_size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    @abc.abstractmethod
+    def _scan(self):
+        """Read the segment list from the file, see segments"""
+
+    @property
+    def segments(self):
+        """[(address, length)], sorted by address, built on first use"""
+        if self._segments is None:
+            self._segments = self._scan()
+        return self._segments
+
+    @property
+    def size(self):
+        return sum(length for _, length in self.segments)
+
+    @abc.abstractmethod
+    def segment_data(self, index):
+        """memoryview of one segment's bytes"""
+
+    def blocks(self, index, block_length):
+        """
+        Cut one segment into TransferData blocks
+        :param index: Segment index
+        :param block_length: Bytes per block, the last block may be shorter
+        :return: Generator of memoryview blocks
+        """
+        data = self.segment_data(index)
+        for offset in range(0, len(data), block_length):
+            yield data[offset:offset + block_length]
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # Blocks are still referenced, the mapping goes away with them
+            self._map = None
+        if self._file is not None and self._file is not self.path:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        segments = ', '.join(f"0x{address:08X}+{length}" for address, length in self.segments)
+        return f"<{type(self).__name__} {self.path} [{segments}]>"
+
+class BinImage(FirmwareImage):
+    """Raw binary, memory-mapped, one segment at base_address"""
+    def __init__(self, path, base_address=0, offset=0, length=None):
+        """
+        Initialize image
+        :param path: File path or a binary file object with fileno()
+        :param base_address: Memory address of the first programmed byte
+        :param offset: Skip this many bytes at the start of the file
+        :param length: Program this many bytes, defaults to the rest of the file
+        """
+        super().__init__(path)
+        self.base_address = base_address
+        self.offset = offset
+        self.length = length
+
+    def _scan(self):
+        mapping = self._open_map()
+        available = max((len(mapping) if mapping is not None else 0) - self.offset, 0)
+        length = available if self.length is None else self.length
+        if length > available:
+            raise ValueError(f"{self.path}: {length} bytes requested, {available} available")
+        return [(self.base_address, length)] if length else []
+
+    def segment_data(self, index):
+        _, length = self.segments[index]
+        return memoryview(self._open_map())[self.offset:self.offset + length]
+
+class _RecordImage(FirmwareImage):
+    """
+    Text formats: the first pass only records (address, file offset, length) per data record
+    in compact arrays; a segment is decoded when it is requested and only the latest decoded
+    segment is kept.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self._addresses = array('Q')
+        self._offsets = array('Q')
+        self._lengths = array('H')
+        self._order = None          # Record indexes sorted by address
+        self._segment_records = []  # (first, end) into _order per segment
+        self._cached = (None, None)
+
+    def _add_record(self, address, offset, length):
+        self._addresses.append(address)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+
+    @abc.abstractmethod
+    def _parse_records(self, mapping):
+        """Record every data record of the file mapping with _add_record()"""
+
+    def _scan(self):
+        mapping = self._open_map()
+        if mapping is not None:
+            self._parse_records(mapping)
+        addresses, lengths = self._addresses, self._lengths
+        if all(addresses[i] <= addresses[i + 1] for i in range(len(addresses) - 1)):
+            order = range(len(addresses))
+        else:
+            order = sorted(range(len(addresses)), key=addresses.__getitem__)
+        self._order = order
+
+        segments = []
+        first = 0
+        end = None
+        for position, record in enumerate(order):
+            address = addresses[record]
+            if end is not None and address < end:
+                raise ValueError(f"{self.path}: overlapping data at 0x{address:08X}")
+            if end is None or address != end:
+                if end is not None:
+                    self._segment_records.append((first, position))
+                    segments.append((start, end - start))
+                first = position
+                start = address
+            end = address + lengths[record]
+        if end is not None:
+            self._segment_records.append((first, len(order)))
+            segments.append((start, end - start))
+        return segments
+
+    def segment_data(self, index):
+        cached_index, cached_data = self._cached
+        if cached_index == index:
+            return cached_data
+        start, length = self.segments[index]
+        buffer = bytearray(length)
+        mapping = self._map
+        first, end = self._segment_records[index]
+        for position in range(first, end):
+            record = self._order[position]
+            offset = self._offsets[record]
+            count = self._lengths[record]
+            target = self._addresses[record] - start
+            buffer[target:target + count] = self._decode(mapping, offset, count)
+        data = memoryview(buffer)
+        self._cached = (index, data)
+        return data
+
+    @staticmethod
+    def _decode(mapping, offset, count):
+        """Data bytes of one record, read from the file mapping"""
+        return binascii.unhexlify(mapping[offset:offset + 2 * count])
+
+class IntelHexImage(_RecordImage):
+    """Intel HEX (record types 00, 01, 02, 04; start addresses 03/05 are ignored)"""
+    def _parse_records(self, mapping):
+        base = 0
+        position = 0
+        size = len(mapping)
+        while position < size:
+            start = mapping.find(b':', position)
+            if start < 0:
+                break
+            end = mapping.find(b'\n', start)
+            end = size if end < 0 else end
+            line = mapping[start + 1:end].rstrip()
+            position = end + 1
+            record = binascii.unhexlify(line)
+            if sum(record) & 0xFF:
+                raise ValueError(f"{self.path}: checksum error in record at byte {start}")
+            count, kind = record[0], record[3]
+            if kind == 0x00:
+                # Data stays in the file, decoded again when its segment is requested
+                self._add_record(base + ((record[1] << 8) | record[2]), start + 9, count)
+            elif kind == 0x01:
+                break
+            elif kind == 0x02:
+                base = ((record[4] << 8) | record[5]) << 4
+            elif kind == 0x04:
+                base = ((record[4] << 8) | record[5]) << 16
+
+class SRecordImage(_RecordImage):
+    """Motorola S-record (S1/S2/S3 data, S0 and S5-S9 are skipped)"""
+    ADDRESS_BYTES = {ord('1'): 2, ord('2'): 3, ord('3'): 4}
+
+    def _parse_records(self, mapping):
+        position = 0
+        size = len(mapping)
+        while position < size:
+            start = mapping.find(b'S', position)
+            if start < 0:
+                break
+            end = mapping.find(b'\n', start)
+            end = size if end < 0 else end
+            line = mapping[start:end].rstrip()
+            position = end + 1
+            address_bytes = self.ADDRESS_BYTES.get(line[1])
+            if address_bytes is None:
+                if line[1] in b'789':
+                    break
+                continue
+            record = binascii.unhexlify(line[2:])
+            if (sum(record) & 0xFF) != 0xFF:
+                raise ValueError(f"{self.path}: checksum error in record at byte {start}")
+            address = int.from_bytes(record[1:1 + address_bytes], 'big')
+            count = record[0] - address_bytes - 1
+            self._add_record(address, start + 4 + 2 * address_bytes, count)
+
+def open_image(path, base_address=0):
+    """
+    Open an image by its suffix: Intel HEX, S-record, anything else is raw binary
+    :param path: File path, or a binary file object (raw binary)
+    :param base_address: Load address of raw binary images
+    :return: FirmwareImage
+    """
+    if isinstance(path, str):
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix in HEX_SUFFIXES:
+            return IntelHexImage(path)
+        if suffix in SREC_SUFFIXES:
+            return SRecordImage(path)
+    return BinImage(path, base_address)
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from firmware_image import HEX_SUFFIXES, SREC_SUFFIXES
+from uds_client_common import CommonClient, node_id_map
+
+class FlashJob:
+    """One memory area to program on one ECU"""
+    def __init__(self, node_name, image, address, block_length=None, check_routine=None):
+        """
+        Initialize job
+        :param node_name: Node name from uds_client_common.node_id_map
+        :param image: Image path, .hex/.s19/... or raw binary
+        :param address: Memory address of a raw binary image
+        :param block_length: Upper limit for the TransferData data size
+        :param check_routine: RoutineControl ID started with the CRC32 after the transfer
+        """
+        self.node_name = node_name
+        self.image = image
+        self.address = address
+        self.block_length = block_length
+        self.check_routine = check_routine
+        self.result = None
+        self.error = None
+        self.done = 0
+        self.total = 0
+
+    def _progress(self, done, total):
+        self.done = done
+        self.total = total
+
+class ParallelFlasher:
+    """
+    Programs several ECUs at the same time, one thread and one CommonClient per ECU.
+    All clients share one bus, so the ISO-TP transfers of different CAN IDs interleave
+    on the wire and the total time is set by the slowest ECU instead of the sum.
+    """
+    def __init__(self, bus_type, jobs, timeout=10, status_interval=1.0, bus=None, notifier=None):
+        """
+        Initialize flasher
+        :param bus_type: CommonClient bus type, 'vector' or 'pcan'
+        :param jobs: FlashJob list, at most one job per ECU
+        :param timeout: P2/request timeout in seconds during the transfer
+        :param status_interval: Seconds between progress lines, 0 disables them
+        :param bus: Already opened bus (e.g. a bus_mux.MuxBus) instead of opening one by bus_type
+        :param notifier: Notifier of that bus
+        """
+        names = [job.node_name for job in jobs]
+        if len(set(names)) != len(names):
+            raise ValueError("Only one job per ECU, the transfers would share its CAN IDs")
+        # The clients share one bus: a stack takes every frame with its RX ID, so no ID may
+        # belong to two jobs (e.g. IMS sends on 0x749, which is HCMR's response ID)
+        owners = {}
+        for name in names:
+            if name not in node_id_map:
+                raise ValueError(f"Unsupported node name: {name}")
+            for can_id in (node_id_map[name]['TXID'], node_id_map[name]['RXID']):
+                if can_id in owners:
+                    raise ValueError(f"{name} and {owners[can_id]} both use CAN ID 0x{can_id:03X}, "
+                                     f"flash them in separate runs")
+                owners[can_id] = name
+        self.bus_type = bus_type
+        self.jobs = jobs
+        self.timeout = timeout
+        self.status_interval = status_interval
+        self.bus = bus
+        self.notifier = notifier
+        self.clients = []
+
+    def run(self):
+        """
+        Program every job and wait for all of them
+        :return: List with one statistics dict per job, failed jobs carry 'error'
+        """
+        bus, notifier = self.bus, self.notifier
+        try:
+            for job in self.jobs:
+                client = CommonClient(self.bus_type, job.node_name, bus=bus, notifier=notifier)
+                # The first client opens the bus when none was given, the others share it
+                bus, notifier = client.bus, client.notifier
+                self.clients.append(client)
+                client.start()
+
+            threads = [threading.Thread(target=self._flash, args=(client, job), daemon=True)
+                       for client, job in zip(self.clients, self.jobs)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(self.status_interval or None)
+                if self.status_interval:
+                    self._print_status(time.perf_counter() - start)
+        finally:
+            # The first client owns the bus, stop it last; clients created before a failure are stopped too
+            for client in reversed(self.clients):
+                try:
+                    client.stop()
+                except Exception as e:
+                    print(f"[FLASH] {client.node_name}: stop failed: {e}")
+            self.clients = []
+
+        results = []
+        for job in self.jobs:
+            if job.error is not None:
+                results.append({'ecu': job.node_name, 'error': str(job.error)})
+                print(f"[FLASH] {job.node_name}: failed: {job.error}")
+            else:
+                results.append(job.result)
+                print(f"[FLASH] {job.node_name}: {job.result['bytes'] / 1024:.1f} KB in {job.result['elapsed_s']}s, "
+                      f"{job.result['kb_per_s']} KB/s, CRC32 {job.result['crc32']}")
+        return results
+
+    def _flash(self, client, job):
+        try:
+            job.result = client.download(job.image, job.address, block_length=job.block_length,
+                                         check_routine=job.check_routine, timeout=self.timeout,
+                                         progress=job._progress)
+        except Exception as e:
+            job.error = e
+
+    def _print_status(self, elapsed):
+        parts = []
+        for job in self.jobs:
+            rate = job.done / 1024 / elapsed if elapsed else 0
+            percent = 100.0 * job.done / job.total if job.total else 0
+            parts.append(f"{job.node_name} {percent:5.1f}% {rate:7.1f} KB/s")
+        print("[FLASH] " + " | ".join(parts))
+
+def _parse_job(text):
+    """NODE:IMAGE[:ADDRESS], the address (hex or decimal) may only be left out for HEX/S-record images"""
+    node_name, _, rest = text.partition(':')
+    image, _, address = rest.rpartition(':')
+    try:
+        address = int(address, 0)
+    except ValueError:
+        image, address = rest, None
+    if not node_name or not image:
+        raise argparse.ArgumentTypeError(f"Expected NODE:IMAGE[:ADDRESS], got {text}")
+    if address is None:
+        # Record formats carry their addresses, a raw binary without one would go to 0x00000000
+        if os.path.splitext(image)[1].lower() not in HEX_SUFFIXES + SREC_SUFFIXES:
+            raise argparse.ArgumentTypeError(f"{text}: raw binary image needs a load address, NODE:IMAGE:ADDRESS")
+        address = 0
+    return node_name, image, address
+
+def main():
+    parser = argparse.ArgumentParser(description="Program several ECUs in parallel with 0x34/0x36/0x37")
+    parser.add_argument('jobs', nargs='+', type=_parse_job, help="NODE:IMAGE[:ADDRESS], e.g. IMS:app.bin:0x00440000 or IMS:app.hex")
+    parser.add_argument('--bus', default='vector', choices=['vector', 'pcan'], help="Bus type (default: vector)")
+    parser.add_argument('--block-length', type=int, help="Upper limit for the TransferData data size")
+    parser.add_argument('--check-routine', type=lambda x: int(x, 0), help="RoutineControl ID started with the CRC32, e.g. 0xFF01")
+    parser.add_argument('--timeout', type=float, default=10, help="P2/request timeout in seconds during the transfer")
+    parser.add_argument('-o', '--output', help="Write the results as JSON")
+    args = parser.parse_args()
+
+    jobs = [FlashJob(node_name, image, address, args.block_length, args.check_routine)
+            for node_name, image, address in args.jobs]
+    try:
+        results = ParallelFlasher(args.bus, jobs, timeout=args.timeout).run()
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+        return 1
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if any('error' in result for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
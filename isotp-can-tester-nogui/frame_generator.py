@@ -0,0 +1,214 @@
+import array
+import math
+import random
+import time
+
+import can
+
+# Spin instead of sleeping once the next deadline is closer than this (hybrid timing)
+SPIN_THRESHOLD = 0.002
+
+# Lateness samples kept for the percentiles, memory stays fixed for any run length
+LATENESS_SAMPLES = 10000
+
+def frame_bits(msg, bitrate=500000, data_bitrate=2000000):
+    """
+    Approximate on-wire length of a frame, expressed in nominal bit times
+    Stuff bits are estimated as one per four bits of the stuffed fields (worst case).
+    :param msg: can.Message
+    :param bitrate: Nominal (arbitration) bitrate
+    :param data_bitrate: CAN-FD data phase bitrate, used when msg.bitrate_switch is set
+    :return: Frame length in nominal bit times, including the 3 bit interframe space
+    """
+    length = len(msg.data)
+    id_bits = 29 + 2 if msg.is_extended_id else 11
+    if not msg.is_fd:
+        stuffed = 1 + id_bits + 3 + 4 + 8 * length + 15     # SOF..DLC, data, CRC
+        return stuffed + (stuffed - 1) // 4 + 1 + 2 + 7 + 3  # CRC delimiter, ACK, EOF, IFS
+
+    arbitration = 1 + id_bits + 5                           # SOF, ID, RRS/IDE/FDF/res/BRS
+    crc = 17 if length <= 16 else 21
+    data_phase = 1 + 4 + 8 * length + 4 + crc               # ESI, DLC, data, stuff count, CRC
+    data_phase += (data_phase - crc) // 4 + math.ceil(crc / 4)
+    tail = 1 + 2 + 7 + 3                                    # CRC delimiter, ACK, EOF, IFS
+    arbitration += (arbitration - 1) // 4
+    if msg.bitrate_switch:
+        return arbitration + tail + data_phase * bitrate / data_bitrate
+    return arbitration + tail + data_phase
+
+def rate_for_load(msg, load_percent, bitrate=500000, data_bitrate=2000000):
+    """
+    Frames per second needed for a bus load
+    :param load_percent: Target bus load 0-100
+    :return: Frames per second
+    """
+    return load_percent / 100.0 * bitrate / frame_bits(msg, bitrate, data_bitrate)
+
+class LatenessStats:
+    """
+    Running mean/std/max of the send lateness (Welford) and a fixed-size reservoir sample
+    for the percentiles, instead of keeping one value per deadline
+    """
+    def __init__(self, size=LATENESS_SAMPLES):
+        self.size = size
+        self.samples = array.array('d')
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = 0.0
+        self._randrange = random.Random(0).randrange
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.count == 1 or value > self.max:
+            self.max = value
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling: every value ends up in the sample with the same probability
+            slot = self._randrange(self.count)
+            if slot < self.size:
+                self.samples[slot] = value
+
+    def summary(self):
+        """Lateness in microseconds, None before the first value"""
+        if not self.count:
+            return None
+        samples = sorted(self.samples)
+        to_us = lambda value: round(value * 1e6, 1)
+        return {
+            'mean': to_us(self.mean),
+            'std': to_us(math.sqrt(self.m2 / self.count)),
+            'p50': to_us(samples[len(samples) // 2]),
+            'p99': to_us(samples[min(len(samples) - 1, int(len(samples) * 0.99))]),
+            'max': to_us(self.max),
+        }
+
+class FrameGenerator:
+    """Sends frames at a fixed rate with absolute deadlines and records how late each send was"""
+    def __init__(self, bus, messages, rate, timing='hybrid', batch=1):
+        """
+        Initialize generator
+        :param bus: CAN bus instance
+        :param messages: can.Message or list of messages sent in turn
+        :param rate: Target frames per second
+        :param timing: 'sleep', 'busy' (spin on perf_counter) or 'hybrid' (sleep, spin the last SPIN_THRESHOLD)
+        :param batch: Frames sent back to back per deadline, for rates above what the timer resolution allows
+        """
+        if timing not in ('sleep', 'busy', 'hybrid'):
+            raise ValueError(f"Unsupported timing mode: {timing}")
+        if rate <= 0:
+            raise ValueError(f"Invalid frame rate: {rate}")
+        self.bus = bus
+        self.messages = messages if isinstance(messages, (list, tuple)) else [messages]
+        self.rate = rate
+        self.timing = timing
+        self.batch = max(1, int(batch))
+        self.period = self.batch / rate
+        self.running = False
+        self.stats = None
+
+    def _wait_until(self, deadline):
+        clock = time.perf_counter
+        if self.timing == 'sleep':
+            delay = deadline - clock()
+            if delay > 0:
+                time.sleep(delay)
+            return
+        if self.timing == 'hybrid':
+            delay = deadline - clock() - SPIN_THRESHOLD
+            if delay > 0:
+                time.sleep(delay)
+        while clock() < deadline:
+            pass
+
+    def run(self, count=None, duration=None):
+        """
+        Send until count frames are sent, duration has passed or stop() is called
+        :param count: Number of frames, None for no limit
+        :param duration: Seconds, None for no limit
+        :return: Statistics dict, see stats()
+        """
+        ticks = None if count is None else math.ceil(count / self.batch)
+        if duration is not None:
+            ticks = min(ticks, int(duration / self.period)) if ticks is not None else int(duration / self.period)
+        lateness = LatenessStats()
+        record = lateness.add
+
+        send = self.bus.send
+        messages = self.messages
+        n_messages = len(messages)
+        clock = time.perf_counter
+        sent = errors = index = tick = 0
+        self.running = True
+        start = clock()
+        try:
+            while self.running and (ticks is None or tick < ticks):
+                deadline = start + tick * self.period
+                self._wait_until(deadline)
+                late = clock() - deadline
+                for _ in range(self.batch):
+                    if count is not None and sent + errors >= count:
+                        break
+                    try:
+                        send(messages[index])
+                        sent += 1
+                    except can.CanError:
+                        errors += 1     # e.g. TX queue full, the frame is dropped
+                    index = index + 1 if index + 1 < n_messages else 0
+                # Recorded after the sends, so the bookkeeping does not delay them
+                record(late)
+                tick += 1
+        finally:
+            self.running = False
+        elapsed = clock() - start
+        self.stats = self._make_stats(sent, errors, elapsed, lateness)
+        return self.stats
+
+    def stop(self):
+        """Stop a run from another thread"""
+        self.running = False
+
+    def _make_stats(self, sent, errors, elapsed, lateness):
+        stats = {
+            'sent': sent,
+            'errors': errors,
+            'elapsed_s': round(elapsed, 4),
+            'target_fps': round(self.rate, 1),
+            'achieved_fps': round(sent / elapsed, 1) if elapsed else None,
+            'timing': self.timing,
+            'batch': self.batch,
+        }
+        summary = lateness.summary()
+        if summary is not None:
+            stats['lateness_us'] = summary
+        return stats
+
+    @staticmethod
+    def bus_load(stats, msg, bitrate=500000, data_bitrate=2000000):
+        """Bus load in percent caused by the achieved rate of a run"""
+        if not stats.get('achieved_fps'):
+            return 0.0
+        return round(stats['achieved_fps'] * frame_bits(msg, bitrate, data_bitrate) / bitrate * 100, 1)
+
+def run_periodic(bus, msg, rate, duration):
+    """
+    Offload the frame to the interface (bus.send_periodic), python-can falls back
+    to its own thread when the interface has no cyclic transmit support
+    :return: Statistics dict, achieved rate is not measurable from the sending side
+    """
+    task = bus.send_periodic(msg, 1.0 / rate, duration)
+    start = time.perf_counter()
+    try:
+        time.sleep(duration)
+    finally:
+        task.stop()
+    return {
+        'timing': 'periodic',
+        'task': type(task).__name__,
+        'target_fps': round(rate, 1),
+        'elapsed_s': round(time.perf_counter() - start, 4),
+    }
@@ -0,0 +1,303 @@
+import argparse
+import contextlib
+import itertools
+import json
+import sys
+import time
+
+import can
+import isotp
+
+from isotp_server import GeneratedResponder
+from rx_filters import add_rx_filters
+from uds_server_common import CANBusFactory, ISOTPLayer, KernelISOTPLayer, kernel_isotp_available
+
+# Server side IDs, the client swaps them
+BENCH_RXID = 0x749
+BENCH_TXID = 0x759
+
+# tx_data_length/can_fd per frame mode
+FRAME_MODES = {
+    'can': {'tx_data_length': 8, 'can_fd': False},
+    'canfd': {'tx_data_length': 64, 'can_fd': True},
+}
+
+DEFAULT_SIZES = [1, 7, 8, 62, 63, 64, 256, 1024, 4095]
+
+# 'python': can-isotp stacks on the notifier, 'kernel': Linux CAN_ISOTP sockets (socketcan only)
+TRANSPORTS = ('python', 'kernel')
+
+class _FrameCounter(can.Listener):
+    """Counts frames on one arbitration ID, runs on the notifier thread"""
+    def __init__(self, arbitration_id):
+        self.arbitration_id = arbitration_id
+        self.count = 0
+
+    def on_message_received(self, msg):
+        if msg.arbitration_id == self.arbitration_id:
+            self.count += 1
+
+def _percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    index = min(len(samples) - 1, max(0, int(round(pct / 100.0 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+def make_request(size):
+    """
+    Benchmark request of the given size
+    The first two bytes carry the wanted response length, so GeneratedResponder
+    answers with the same amount of data (2 bytes for a 1 byte request).
+    """
+    if size < 2:
+        return bytes(size)
+    return size.to_bytes(2, 'big') + b'\x55' * (size - 2)
+
+class IsoTpBenchmark:
+    """Round trip benchmark of an in-process responder and client sharing one CAN channel"""
+    def __init__(self, interface='socketcan', channel='vcan0', fd=True, test_case_file='test_case.json', receive_mode='blocking'):
+        """
+        Initialize benchmark
+        :param interface: 'socketcan' or 'virtual', socketcan falls back to virtual when the channel is missing
+        :param channel: CAN channel
+        :param fd: Open the buses in CAN-FD mode, needed for the 'canfd' frame mode
+        :param test_case_file: Case file of the responder
+        :param receive_mode: UDSResponder receive mode, 'blocking' or 'poll'
+        """
+        self.channel = channel
+        self.fd = fd
+        try:
+            self.server_bus, self.server_notifier = CANBusFactory(interface, fd, channel=channel, fd=fd).create_bus(rx_ids=[BENCH_RXID])
+        except Exception as e:
+            if interface == 'virtual':
+                raise
+            print(f"[BENCH] {interface} {channel} not available ({e}), using python-can virtual bus", file=sys.stderr)
+            interface = 'virtual'
+            self.server_bus, self.server_notifier = CANBusFactory(interface, fd, channel=channel, fd=fd).create_bus(rx_ids=[BENCH_RXID])
+        self.interface = interface
+        self.client_bus, self.client_notifier = CANBusFactory(interface, fd, channel=channel, fd=fd).create_bus(rx_ids=[BENCH_TXID])
+
+        self.responder = GeneratedResponder(test_case_file, verbose=False)
+        self.receive_mode = receive_mode
+        self.request_frames = _FrameCounter(BENCH_RXID)
+        self.response_frames = _FrameCounter(BENCH_TXID)
+        self.server_notifier.add_listener(self.request_frames)
+        self.client_notifier.add_listener(self.response_frames)
+
+    def transport_available(self, transport):
+        """Kernel transport needs a real socketcan channel and the can-isotp module"""
+        if transport == 'kernel':
+            return self.interface == 'socketcan' and kernel_isotp_available()
+        return True
+
+    def run_case(self, size, stmin=0, blocksize=0, mode='can', iterations=20, timeout=10, transport='python'):
+        """
+        Run one benchmark point
+        :param size: Request and response payload size in bytes
+        :param stmin: STmin in ms, used by both sides
+        :param blocksize: Block size, used by both sides
+        :param mode: Key of FRAME_MODES
+        :param iterations: Measured round trips, one extra warm-up round trip is not counted
+        :param timeout: Seconds to wait for one response
+        :param transport: Key of TRANSPORTS, used by both sides
+        :return: Result dict
+        """
+        params = dict(ISOTPLayer.DEFAULT_PARAMS)
+        params.update(FRAME_MODES[mode])
+        params['stmin'] = stmin
+        params['blocksize'] = blocksize
+        params['rx_consecutive_frame_timeout'] = 1000
+
+        if transport == 'kernel':
+            server = KernelISOTPLayer(self.channel, BENCH_TXID, BENCH_RXID, params=params)
+            client = KernelISOTPLayer(self.channel, BENCH_RXID, BENCH_TXID, params=params)
+        else:
+            server = ISOTPLayer(self.server_bus, self.server_notifier, BENCH_TXID, BENCH_RXID, params=params)
+            client = isotp.NotifierBasedCanStack(
+                bus=self.client_bus,
+                notifier=self.client_notifier,
+                address=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=BENCH_RXID, rxid=BENCH_TXID),
+                params=params
+            )
+        request = make_request(size)
+        expected = max(size, 2)
+        samples = []
+        errors = 0
+
+        server.start()
+        client.start()
+        self.responder.latency.reset()
+        self.responder.start_receiving(server, mode=self.receive_mode)
+        try:
+            client.send(request)
+            client.recv(block=True, timeout=timeout)    # Warm-up
+            # The responder records the warm-up after its send, wait for it before resetting
+            deadline = time.perf_counter() + timeout
+            while self.responder.latency.count == 0 and time.perf_counter() < deadline:
+                time.sleep(0.001)
+            self.responder.latency.reset()
+            self.request_frames.count = 0
+            self.response_frames.count = 0
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                sent = time.perf_counter()
+                client.send(request)
+                response = client.recv(block=True, timeout=timeout)
+                if response is None or len(response) != expected:
+                    errors += 1
+                    continue
+                samples.append(time.perf_counter() - sent)
+            elapsed = time.perf_counter() - start
+        finally:
+            self.responder.stop_receiving()
+            client.stop()
+            server.stop()
+
+        frames = self.request_frames.count + self.response_frames.count
+        transferred = len(samples) * (size + expected)
+        samples.sort()
+        to_ms = lambda value: None if value is None else round(value * 1000, 3)
+        return {
+            'transport': transport,
+            'mode': mode,
+            'tx_data_length': params['tx_data_length'],
+            'stmin': stmin,
+            'blocksize': blocksize,
+            'payload': size,
+            'iterations': iterations,
+            'errors': errors,
+            'elapsed_s': round(elapsed, 4),
+            'frames': frames,
+            'frames_per_s': round(frames / elapsed, 1) if elapsed else None,
+            'bytes_per_s': round(transferred / elapsed, 1) if elapsed else None,
+            'rtt_ms': {
+                'min': to_ms(samples[0] if samples else None),
+                'mean': to_ms(sum(samples) / len(samples) if samples else None),
+                'p50': to_ms(_percentile(samples, 50)),
+                'p99': to_ms(_percentile(samples, 99)),
+                'max': to_ms(samples[-1] if samples else None),
+            },
+            'server_ms': {key: value for key, value in self.responder.get_latency_stats().items() if key != 'buckets'},
+        }
+
+    def sweep(self, sizes, stmins, blocksizes, modes, iterations=20, timeout=10, transports=('python',)):
+        """Run every combination, printing one line per point"""
+        results = []
+        for transport in transports:
+            if not self.transport_available(transport):
+                print(f"[BENCH] Skipping {transport} transport, not available on {self.interface} {self.channel}", file=sys.stderr)
+                continue
+            for mode, stmin, blocksize, size in itertools.product(modes, stmins, blocksizes, sizes):
+                result = self.run_case(size, stmin, blocksize, mode, iterations, timeout, transport)
+                results.append(result)
+                print(f"[BENCH] {transport:<6} {mode:<5} stmin={stmin:<3} bs={blocksize:<3} size={size:<5} "
+                      f"{result['frames_per_s']} frames/s {result['bytes_per_s']} B/s "
+                      f"p50={result['rtt_ms']['p50']}ms p99={result['rtt_ms']['p99']}ms errors={result['errors']}",
+                      file=sys.stderr)
+        return results
+
+    def environment(self):
+        return {
+            'interface': self.interface,
+            'channel': self.channel,
+            'fd': self.fd,
+            'receive_mode': self.receive_mode,
+            'python': sys.version.split()[0],
+            'python_can': can.__version__,
+            'can_isotp': getattr(isotp, '__version__', None),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+    def close(self):
+        for notifier in (self.server_notifier, self.client_notifier):
+            notifier.stop()
+        for bus in (self.server_bus, self.client_bus):
+            bus.shutdown()
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with an earlier report
+    :param results: Result list of this run
+    :param baseline: Report dict loaded from a previous run
+    :param tolerance: Allowed relative loss, e.g. 0.2 for 20 %
+    :return: List of regression messages
+    """
+    key = lambda r: (r.get('transport', 'python'), r['mode'], r['stmin'], r['blocksize'], r['payload'])
+    previous = {key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        name = "{} {} stmin={} bs={} size={}".format(*key(result))
+        if old['bytes_per_s'] and result['bytes_per_s'] is not None \
+                and result['bytes_per_s'] < old['bytes_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['bytes_per_s']} B/s, was {old['bytes_per_s']} B/s")
+        if old['rtt_ms']['p99'] and result['rtt_ms']['p99'] is not None \
+                and result['rtt_ms']['p99'] > old['rtt_ms']['p99'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['rtt_ms']['p99']}ms, was {old['rtt_ms']['p99']}ms")
+        if result['errors'] > old['errors']:
+            regressions.append(f"{name}: {result['errors']} errors, was {old['errors']}")
+    return regressions
+
+def _int_list(text):
+    return [int(value, 0) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="ISOTP round trip throughput/latency benchmark")
+    parser.add_argument('--interface', default='socketcan', choices=['socketcan', 'virtual'])
+    parser.add_argument('--channel', default='vcan0')
+    parser.add_argument('--sizes', type=_int_list, default=DEFAULT_SIZES, help="Payload sizes, e.g. 1,64,4095")
+    parser.add_argument('--stmin', type=_int_list, default=[0], help="STmin values in ms")
+    parser.add_argument('--blocksize', type=_int_list, default=[0, 8], help="Block sizes")
+    parser.add_argument('--modes', default='can,canfd', help="Frame modes: can (8 byte), canfd (64 byte)")
+    parser.add_argument('--transports', default='python', help="ISOTP transports: python, kernel (socketcan with can-isotp)")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=10, help="Seconds to wait for one response")
+    parser.add_argument('--cases', default='test_case.json', help="Responder case file")
+    parser.add_argument('--receive-mode', default='blocking', choices=['blocking', 'poll'])
+    parser.add_argument('-o', '--output', help="Write the JSON report to a file instead of stdout")
+    parser.add_argument('--baseline', help="Earlier JSON report, exit with 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative loss against the baseline")
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in FRAME_MODES:
+            parser.error(f"Unsupported frame mode: {mode}")
+    fd = 'canfd' in modes
+    transports = args.transports.split(',')
+    for transport in transports:
+        if transport not in TRANSPORTS:
+            parser.error(f"Unsupported transport: {transport}")
+
+    bench = IsoTpBenchmark(args.interface, args.channel, fd, args.cases, args.receive_mode)
+    try:
+        # Keep stdout clean for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            results = bench.sweep(args.sizes, args.stmin, args.blocksize, modes, args.iterations, args.timeout, transports)
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+        return 1
+    finally:
+        bench.close()
+
+    report = {'environment': bench.environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"[BENCH] Regression {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,8 @@ import random
 from can.interface import Bus
 import logging
 from config import Config
+from rx_filters import add_rx_filters
+from uds_server_common import KernelISOTPLayer, kernel_isotp_available
 import sys
 import binascii
 
@@ -13,13 +15,6 @@ can.rc['channel'] = 'vcan0'
 can.rc['fd'] = False  
 can.rc['bitrate'] = 500000
 
-try:
-    bus = can.Bus()
-    notifier = can.Notifier(bus, [])
-    print("A Client on SocketCAN bus initialized successfully.")
-except Exception as e:
-    print(f"Failed to initialize: {e}")
-    exit(1)
     
 isotp_params = {
     'stmin': 8,
@@ -54,6 +49,8 @@ node_id_map = {
     'HCU': {'RXID': 0x7EF, 'TXID': 0x7E7},
 }
 node_name = sys.argv[1]
+# Optional ISOTP transport: auto (default, kernel when can-isotp is loaded), kernel, python
+transport = sys.argv[2] if len(sys.argv) > 2 else 'auto'
 
 if node_name in node_id_map:
     rx_id = node_id_map[node_name]['RXID']
@@ -66,14 +63,29 @@ else:
     print(f"not found: {node_name}")
             
 tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx_id, rxid=rx_id)
+bus = None
+if transport == 'kernel' or (transport == 'auto' and kernel_isotp_available()):
+    # Segmentation and flow control in the kernel, no raw CAN socket needed
+    isotp_layer = KernelISOTPLayer(can.rc['channel'], tx_id, rx_id, isotp_params)
+    print("A Client on SocketCAN kernel ISOTP initialized successfully.")
+else:
+    try:
+        bus = can.Bus()
+        notifier = can.Notifier(bus, [])
+        print("A Client on SocketCAN bus initialized successfully.")
+    except Exception as e:
+        print(f"Failed to initialize: {e}")
+        exit(1)
+    # Only the response ID reaches the notifier
+    add_rx_filters(bus, [rx_id])
 
-isotp_layer = isotp.NotifierBasedCanStack(
-    bus = bus,
-    notifier = notifier,
-    address = tp_addr,
-    error_handler = None,
-    params = isotp_params
-)
+    isotp_layer = isotp.NotifierBasedCanStack(
+        bus = bus,
+        notifier = notifier,
+        address = tp_addr,
+        error_handler = None,
+        params = isotp_params
+    )
 
 isotp_layer.start()
 
@@ -124,4 +136,5 @@ except KeyboardInterrupt:
 
 finally:
     isotp_layer.stop()
-    bus.shutdown()
+    if bus is not None:
+        bus.shutdown()
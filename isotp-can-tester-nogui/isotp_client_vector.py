@@ -5,6 +5,7 @@ import random
 from can.interface import Bus
 import logging
 from config import Config
+from rx_filters import add_rx_filters
 import sys
 import binascii
 
@@ -80,6 +81,8 @@ else:
     print(f"not found: {node_name}")
             
 tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx_id, rxid=rx_id)
+# Only the response ID reaches the notifier
+add_rx_filters(bus, [rx_id])
 
 isotp_layer = isotp.NotifierBasedCanStack(
     bus = bus,
@@ -0,0 +1,130 @@
+import argparse
+import json
+import time
+
+from payload_patterns import MAX_PAYLOAD, get_pattern
+from trace_logger import TraceLogger
+from uds_server_common import CANBusFactory, UDSResponder
+
+DEFAULT_PROFILE_FILE = 'server_profiles.json'
+
+def load_profile(profile_file, name):
+    """
+    Read one deployment profile
+    :param profile_file: Profile JSON with "nodes" and "profiles"
+    :param name: Profile name, e.g. 'pcanfd' or 'socketcan'
+    :return: (profile dict, node map {name: {'RXID': int, 'TXID': int}})
+    """
+    with open(profile_file, 'r') as file:
+        data = json.load(file)
+    profiles = data.get('profiles', {})
+    if name not in profiles:
+        raise ValueError(f"Unknown profile: {name} (available: {', '.join(profiles)})")
+
+    node_map = {}
+    for node, ids in data.get('nodes', {}).items():
+        node_map[node] = {key: int(value, 0) if isinstance(value, str) else value for key, value in ids.items()}
+    # A profile may add or override nodes, e.g. when its bus uses other IDs
+    for node, ids in profiles[name].get('nodes', {}).items():
+        node_map[node] = {key: int(value, 0) if isinstance(value, str) else value for key, value in ids.items()}
+    return profiles[name], node_map
+
+class GeneratedResponder(UDSResponder):
+    """UDSResponder that answers unknown requests with generated data instead of an NRC"""
+
+    # Only the case file decides, the same as the old per-interface servers
+    DEFAULT_RULES = []
+
+    def __init__(self, test_case_file='test_case.json', pattern='sequential', verbose=True):
+        """
+        Initialize responder
+        :param test_case_file: Test case file
+        :param pattern: Payload pattern spec, see payload_patterns.get_pattern
+        :param verbose: Print every request and response
+        """
+        super().__init__(test_case_file, verbose=verbose)
+        self.pattern = get_pattern(pattern)
+
+    def process_request(self, payload):
+        """
+        Case file response, otherwise generated data whose length is taken
+        from the first two request bytes (big endian, clipped to MAX_PAYLOAD)
+        """
+        response = self.cfg.find_response(payload)
+        if response is None:
+            len_res = 2 if len(payload) < 2 else min((payload[0] << 8) | payload[1], MAX_PAYLOAD)
+            response = self.pattern.get(len_res)
+        if self.verbose:
+            self._log(f"Received request: {payload.hex().upper()}")
+            self._log(f"Sending response, len = {len(response)}: {response.hex().upper()}")
+        return response
+
+def main():
+    parser = argparse.ArgumentParser(description="ISOTP server, interface and parameters taken from a profile")
+    parser.add_argument('node', help="Node name from the profile file, e.g. IMS")
+    parser.add_argument('--profile', default='pcan', help="Profile name (default: pcan)")
+    parser.add_argument('--profiles', default=DEFAULT_PROFILE_FILE, help="Profile file")
+    parser.add_argument('--cases', help="Test case file, overrides the profile")
+    parser.add_argument('--pattern', default='sequential', help="Generated payload: sequential, random[:seed], fill[:byte]")
+    parser.add_argument('--stmin', type=int, help="Override ISOTP stmin")
+    parser.add_argument('--blocksize', type=int, help="Override ISOTP blocksize")
+    parser.add_argument('--tx-data-length', type=int, help="Override ISOTP tx_data_length")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not print every request/response")
+    parser.add_argument('--trace', help="Record all frames and UDS events, e.g. soak.blf or trace.asc")
+    parser.add_argument('--trace-max-bytes', type=int, default=0, help="Rotate the trace at this size")
+    parser.add_argument('--trace-compress', choices=['gzip', 'zstd'], help="Compress finished trace files")
+    args = parser.parse_args()
+
+    profile, node_map = load_profile(args.profiles, args.profile)
+    if args.node not in node_map:
+        parser.error(f"Node not found: {args.node}")
+    rx_id = node_map[args.node]['RXID']
+    tx_id = node_map[args.node]['TXID']
+
+    bus_config = dict(profile.get('bus', {}))
+    params = dict(profile.get('isotp', {}))
+    for key, value in (('stmin', args.stmin), ('blocksize', args.blocksize), ('tx_data_length', args.tx_data_length)):
+        if value is not None:
+            params[key] = value
+    test_case_file = args.cases or profile.get('cases', 'test_case.json')
+
+    print("************************************************************")
+    print(f"ISOTP Server : {args.node} ({args.profile}) \r\nRXID: {rx_id:#04X}  \r\nTXID: {tx_id:#04X}")
+    print("************************************************************")
+
+    try:
+        can_factory = CANBusFactory(channel_type=profile['interface'], is_fd=bus_config.get('fd', False), **bus_config)
+        bus, notifier = can_factory.create_bus()
+        if args.trace:
+            trace = TraceLogger(args.trace, max_bytes=args.trace_max_bytes, compress=args.trace_compress)
+            trace.attach(notifier, bus)
+
+        isotp_layer = can_factory.create_isotp_layer(tx_id, rx_id, params)
+        isotp_layer.start()
+
+        responder = GeneratedResponder(test_case_file, pattern=args.pattern, verbose=not args.quiet)
+        if args.trace:
+            responder.trace = trace
+        responder.start_receiving(isotp_layer)
+
+        while True:
+            time.sleep(0.1)
+
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+    finally:
+        if 'responder' in locals():
+            responder.stop_receiving()
+            print(responder.latency)
+        if 'isotp_layer' in locals():
+            isotp_layer.stop()
+        if 'notifier' in locals():
+            notifier.stop()
+        if 'trace' in locals():
+            trace.stop()
+            print(f"[TRACE] {trace.written} records, {trace.dropped} dropped: {', '.join(trace.files)}")
+        if 'bus' in locals():
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
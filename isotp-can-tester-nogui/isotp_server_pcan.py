@@ -5,6 +5,7 @@ import random
 from can.interface import Bus
 import logging
 from config import Config
+from payload_patterns import get_pattern
 import sys
 import binascii
 import json
@@ -49,6 +50,8 @@ isotp_layer = isotp.NotifierBasedCanStack(
 )
 
 isotp_layer.start()
+# Optional generated payload pattern: sequential (default), random[:seed], fill[:byte]
+pattern = get_pattern(sys.argv[1] if len(sys.argv) > 1 else 'sequential')
 cfg = Config()
 
 with open('Node_Description.json', 'r') as file:
@@ -79,12 +82,12 @@ try:
             print("Recv Request:")
             print(payload.hex().upper())
 
-            payload_res = cfg.find_case(payload.hex().upper())
+            payload_res = cfg.find_response(payload)
             if  payload_res == None:
-                payload = bytearray([x & 0xFF for x in range(5)])
+                payload = pattern.get(5)
             else:
                 print("Send Random Data from json file:")
-                payload = bytes.fromhex(payload_res)
+                payload = payload_res
 
             isotp_layer.send(payload)
             print("Send Random Data, len = ",len(payload))
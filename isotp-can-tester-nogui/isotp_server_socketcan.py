@@ -5,6 +5,9 @@ import random
 from can.interface import Bus
 import logging
 from config import Config
+from payload_patterns import get_pattern
+from rx_filters import add_rx_filters
+from uds_server_common import KernelISOTPLayer, kernel_isotp_available
 import sys
 import binascii
 import json
@@ -14,14 +17,6 @@ can.rc['channel'] = 'vcan0'
 can.rc['fd'] = False  
 can.rc['bitrate'] = 500000
 
-try:
-    bus = can.Bus()
-    notifier = can.Notifier(bus, [])
-    print("A Server on SocketCAN bus initialized successfully.")
-except Exception as e:
-    print(f"Failed to initialize: {e}")
-    exit(1)
-
 isotp_params = {
     'stmin': 10,
     'blocksize': 4,
@@ -52,6 +47,10 @@ node_id_map = {
     'HCU': {'RXID': 0x7E7, 'TXID': 0x7EF},
 }
 node_name = sys.argv[1]
+# Optional generated payload pattern: sequential (default), random[:seed], fill[:byte]
+pattern = get_pattern(sys.argv[2] if len(sys.argv) > 2 else 'sequential')
+# Optional ISOTP transport: auto (default, kernel when can-isotp is loaded), kernel, python
+transport = sys.argv[3] if len(sys.argv) > 3 else 'auto'
 
 if node_name in node_id_map:
     rx_id = node_id_map[node_name]['RXID']
@@ -66,13 +65,29 @@ else:
             
 tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx_id, rxid=rx_id)
 
-isotp_layer = isotp.NotifierBasedCanStack(
-    bus = bus,
-    notifier = notifier,
-    address = tp_addr,
-    error_handler = None,
-    params = isotp_params
-)
+bus = None
+if transport == 'kernel' or (transport == 'auto' and kernel_isotp_available()):
+    # Segmentation and flow control in the kernel, no raw CAN socket needed
+    isotp_layer = KernelISOTPLayer(can.rc['channel'], tx_id, rx_id, isotp_params)
+    print("A Server on SocketCAN kernel ISOTP initialized successfully.")
+else:
+    try:
+        bus = can.Bus()
+        notifier = can.Notifier(bus, [])
+        print("A Server on SocketCAN bus initialized successfully.")
+    except Exception as e:
+        print(f"Failed to initialize: {e}")
+        exit(1)
+    # Only the request ID reaches the notifier
+    add_rx_filters(bus, [rx_id])
+
+    isotp_layer = isotp.NotifierBasedCanStack(
+        bus = bus,
+        notifier = notifier,
+        address = tp_addr,
+        error_handler = None,
+        params = isotp_params
+    )
 
 isotp_layer.start()
 cfg = Config()
@@ -88,7 +103,7 @@ try:
             print("Recv Request:")
             print(payload.hex().upper())
 
-            payload_res = cfg.find_case(payload.hex().upper())
+            payload_res = cfg.find_response(payload)
             if  payload_res == None:
                 
                 if len(payload) < 2:
@@ -100,10 +115,10 @@ try:
                     if len_res > 4095:
                         len_res = 4095
                     
-                payload = bytearray([x & 0xFF for x in range(len_res)])
+                payload = pattern.get(len_res)
             else:
                 print("Send specific Data from json file:")
-                payload = bytes.fromhex(payload_res)
+                payload = payload_res
 
             isotp_layer.send(payload)
             print("Send Data, len = ",len(payload))
@@ -116,4 +131,5 @@ except KeyboardInterrupt:
 
 finally:
     isotp_layer.stop()
-    bus.shutdown()
+    if bus is not None:
+        bus.shutdown()
@@ -5,6 +5,7 @@ import random
 from can.interface import Bus
 import logging
 from config import Config
+from payload_patterns import get_pattern
 import sys
 import binascii
 import json
@@ -64,6 +65,8 @@ node_id_map = {
     'VCU': {'RXID': 0x7E1, 'TXID': 0x7E9},
 }
 node_name = sys.argv[1]
+# Optional generated payload pattern: sequential (default), random[:seed], fill[:byte]
+pattern = get_pattern(sys.argv[2] if len(sys.argv) > 2 else 'sequential')
 
 if node_name in node_id_map:
     rx_id = node_id_map[node_name]['RXID']
@@ -100,7 +103,7 @@ try:
             print("Recv Request:")
             print(payload.hex().upper())
 
-            payload_res = cfg.find_case(payload.hex().upper())
+            payload_res = cfg.find_response(payload)
             if  payload_res == None:
                 
                 if len(payload) < 2:
@@ -112,10 +115,10 @@ try:
                     if len_res > 4095:
                         len_res = 4095
                     
-                payload = bytearray([x & 0xFF for x in range(len_res)])
+                payload = pattern.get(len_res)
             else:
                 print("Send specific Data from json file:")
-                payload = bytes.fromhex(payload_res)
+                payload = payload_res
 
             isotp_layer.send(payload)
             print("Send Data, len = ",len(payload))
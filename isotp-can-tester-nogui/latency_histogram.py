@@ -0,0 +1,90 @@
+import bisect
+import threading
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram (values in seconds)"""
+
+    # Bucket upper edges in milliseconds, last bucket catches everything above
+    BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, name="latency"):
+        """
+        Initialize histogram
+        :param name: Label used when printing
+        """
+        self.name = name
+        self._edges = [edge / 1000.0 for edge in self.BUCKETS_MS]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all samples"""
+        with self._lock:
+            self.counts = [0] * (len(self._edges) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+    def record(self, seconds):
+        """Add one sample"""
+        index = bisect.bisect_left(self._edges, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, pct):
+        """
+        Approximate percentile from bucket edges
+        :param pct: Percentile 0-100
+        :return: Upper edge of the bucket holding the percentile, in seconds
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = self.count * pct / 100.0
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if count and seen >= target:
+                    if index < len(self._edges):
+                        return min(self._edges[index], self.max)
+                    return self.max
+            return self.max
+
+    def snapshot(self):
+        """
+        Get histogram content
+        :return: dict with count/min/max/mean/p50/p99 in ms and per-bucket counts
+        """
+        p50 = self.percentile(50)
+        p99 = self.percentile(99)
+        with self._lock:
+            to_ms = lambda value: None if value is None else round(value * 1000, 3)
+            buckets = {}
+            for index, count in enumerate(self.counts):
+                label = f"<={self.BUCKETS_MS[index]}ms" if index < len(self.BUCKETS_MS) else f">{self.BUCKETS_MS[-1]}ms"
+                buckets[label] = count
+            return {
+                'count': self.count,
+                'min_ms': to_ms(self.min),
+                'max_ms': to_ms(self.max),
+                'mean_ms': to_ms(self.total / self.count) if self.count else None,
+                'p50_ms': to_ms(p50),
+                'p99_ms': to_ms(p99),
+                'buckets': buckets,
+            }
+
+    def __str__(self):
+        stats = self.snapshot()
+        lines = [f"[{self.name}] count={stats['count']} min={stats['min_ms']}ms "
+                 f"mean={stats['mean_ms']}ms p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms max={stats['max_ms']}ms"]
+        for label, count in stats['buckets'].items():
+            if count:
+                lines.append(f"  {label:>10}: {count}")
+        return "\n".join(lines)
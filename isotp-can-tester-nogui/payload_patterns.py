@@ -0,0 +1,53 @@
+import random
+
+# Largest ISOTP payload the servers generate
+MAX_PAYLOAD = 4095
+
+class PayloadPattern:
+    """Pre-built response buffer, generated payloads are memoryview slices of it"""
+    def __init__(self, kind='sequential', seed=0, fill=0x00, size=MAX_PAYLOAD):
+        """
+        Build pattern buffer
+        :param kind: 'sequential' (00 01 .. FF 00 ..), 'random' or 'fill'
+        :param seed: Seed for 'random', same seed gives the same bytes
+        :param fill: Byte value for 'fill'
+        :param size: Buffer length, longer requests are clipped to it
+        """
+        if kind == 'sequential':
+            data = (bytes(range(256)) * (size // 256 + 1))[:size]
+        elif kind == 'random':
+            data = random.Random(seed).getrandbits(size * 8).to_bytes(size, 'little')
+        elif kind == 'fill':
+            data = bytes([fill & 0xFF]) * size
+        else:
+            raise ValueError(f"Unsupported payload pattern: {kind}")
+        self.kind = kind
+        self.size = size
+        self.buffer = memoryview(data)
+
+    def get(self, length):
+        """
+        Get a payload without copying
+        :param length: Requested length, clipped to the buffer size
+        :return: Read-only memoryview
+        """
+        return self.buffer[:min(length, self.size)]
+
+_patterns = {}
+
+def get_pattern(spec='sequential'):
+    """
+    Get a shared pattern from a short spec, built once per spec
+    :param spec: 'sequential', 'random', 'random:<seed>', 'fill' or 'fill:<hex byte>'
+    """
+    pattern = _patterns.get(spec)
+    if pattern is None:
+        kind, _, arg = spec.partition(':')
+        if kind == 'random':
+            pattern = PayloadPattern('random', seed=int(arg or 0))
+        elif kind == 'fill':
+            pattern = PayloadPattern('fill', fill=int(arg or '00', 16))
+        else:
+            pattern = PayloadPattern(kind)
+        _patterns[spec] = pattern
+    return pattern
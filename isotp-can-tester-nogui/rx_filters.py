@@ -0,0 +1,75 @@
+import threading
+
+STANDARD_MASK = 0x7FF
+EXTENDED_MASK = 0x1FFFFFFF
+# No data frame carries the error flag (CAN_ERR_FLAG), a filter requiring it lets nothing through
+NO_FRAMES_FILTER = {'can_id': 0x20000000, 'can_mask': 0x20000000}
+
+# Interfaces whose hardware takes one acceptance filter per ID type; python-can drops back
+# to filtering in Python when given more, so the IDs are merged into one covering filter
+SINGLE_FILTER_BUSES = ('VectorBus',)
+
+_lock = threading.Lock()
+
+def exact_filters(rx_ids):
+    """python-can can_filters accepting exactly these IDs, 29-bit for IDs above 0x7FF"""
+    return [{'can_id': rx_id, 'can_mask': EXTENDED_MASK if rx_id > STANDARD_MASK else STANDARD_MASK,
+             'extended': rx_id > STANDARD_MASK} for rx_id in sorted(set(rx_ids))]
+
+def covering_filter(rx_ids, extended):
+    """One filter accepting every ID in rx_ids (and the IDs sharing all their common bits)"""
+    full_mask = EXTENDED_MASK if extended else STANDARD_MASK
+    first = rx_ids[0]
+    differing = 0
+    for rx_id in rx_ids[1:]:
+        differing |= rx_id ^ first
+    mask = full_mask & ~differing
+    return {'can_id': first & mask, 'can_mask': mask, 'extended': extended}
+
+def _bus_filters(bus, rx_ids):
+    if type(bus).__name__ not in SINGLE_FILTER_BUSES:
+        return exact_filters(rx_ids)
+    filters = []
+    for extended in (False, True):
+        ids = sorted(rx_id for rx_id in rx_ids if (rx_id > STANDARD_MASK) == extended)
+        if ids:
+            filters.append(covering_filter(ids, extended))
+    return filters
+
+def add_rx_filters(bus, rx_ids):
+    """
+    Let frames with these IDs through the bus filters, keeping the IDs added before.
+    Stacks sharing a bus each add their RX ID; the driver/kernel then drops other frames
+    before they reach the notifier. No effect after receive_all().
+    :param bus: CAN bus instance
+    :param rx_ids: Iterable of arbitration IDs
+    """
+    with _lock:
+        if getattr(bus, 'rx_receive_all', False):
+            return
+        current = getattr(bus, 'rx_filter_ids', set())
+        merged = current | set(rx_ids)
+        if merged == current:
+            return
+        bus.rx_filter_ids = merged
+        bus.set_filters(_bus_filters(bus, merged))
+
+def block_rx(bus):
+    """
+    Let no frames through a bus nobody receives on, e.g. the raw socket next to kernel ISOTP
+    sockets. Does nothing when RX IDs were added already, add_rx_filters() and receive_all()
+    open the bus again.
+    :param bus: CAN bus instance
+    """
+    with _lock:
+        if getattr(bus, 'rx_receive_all', False) or getattr(bus, 'rx_filter_ids', None):
+            return
+        bus.rx_filter_ids = set()
+        bus.set_filters([NO_FRAMES_FILTER])
+
+def receive_all(bus):
+    """Remove the RX filters for good, for listeners that need every frame (trace, monitor)"""
+    with _lock:
+        bus.rx_receive_all = True
+        bus.rx_filter_ids = set()
+        bus.set_filters(None)
@@ -0,0 +1,184 @@
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+import can
+
+from rx_filters import receive_all
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Queue item kinds
+_RX, _TX, _EVENT, _STOP = range(4)
+
+class TraceLogger(can.Listener):
+    """
+    Background CAN trace writer.
+    The notifier/TX threads only put references into a queue; one writer thread
+    converts and writes them in batches through python-can's writers, so the
+    file format follows the suffix (.blf binary with zlib, .asc, .log, ...).
+    """
+    def __init__(self, filename, max_bytes=0, compress=None, batch_size=1000, max_queue=200000):
+        """
+        Initialize trace logger
+        :param filename: Trace file, e.g. 'soak.blf' or 'trace.asc'
+        :param max_bytes: Start a new file when this size is reached, 0 writes one file
+        :param compress: None, 'gzip' or 'zstd'; finished files (rotated and the last one) are compressed
+        :param batch_size: Records written per writer wakeup at most
+        :param max_queue: Records buffered before new ones are dropped
+        """
+        if compress not in (None, 'gzip', 'zstd'):
+            raise ValueError(f"Unsupported compression: {compress}")
+        if compress == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        self.filename = filename
+        self.compress = compress
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.queue = queue.SimpleQueue()
+        self.dropped = 0
+        self.written = 0
+        self.files = []     # Finished (and compressed) files
+
+        if max_bytes:
+            self.logger = can.SizedRotatingLogger(filename, max_bytes=max_bytes)
+            self.logger.rotator = self._rotate
+        else:
+            self.logger = can.Logger(filename)
+        self.tx_buses = []
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        if self.queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.put(item)
+
+    def on_message_received(self, msg):
+        """can.Listener entry point, records a received frame"""
+        self._put((_RX, None, msg))
+
+    def record_tx(self, msg):
+        """Record a transmitted frame, the message object is not modified"""
+        self._put((_TX, time.time(), msg))
+
+    def log_event(self, text):
+        """Record a text event (ISO-TP/UDS activity, test phase, ...) as a marker/comment"""
+        self._put((_EVENT, time.time(), text))
+
+    def attach(self, notifier, bus=None):
+        """
+        Record everything a notifier receives and, when a bus is given, everything sent on it.
+        RX filters installed for ISO-TP stacks are removed from the notifier's buses.
+        :param notifier: can.Notifier
+        :param bus: Bus whose send() is wrapped to record TX frames
+        """
+        for notifier_bus in (notifier.bus if isinstance(notifier.bus, list) else [notifier.bus]):
+            receive_all(notifier_bus)
+        notifier.add_listener(self)
+        if bus is not None:
+            self.attach_tx(bus)
+
+    def attach_tx(self, bus):
+        """Wrap bus.send so transmitted frames are recorded as well"""
+        if bus in self.tx_buses:
+            return
+        send = bus.send
+        record_tx = self.record_tx
+
+        def traced_send(msg, timeout=None):
+            send(msg, timeout)
+            record_tx(msg)
+
+        bus.send = traced_send
+        self.tx_buses.append(bus)
+
+    def detach_tx(self):
+        for bus in self.tx_buses:
+            try:
+                del bus.send    # Drop the instance attribute, the class method is visible again
+            except AttributeError:
+                pass
+        self.tx_buses = []
+
+    def stop(self):
+        """Write everything queued, close the file and compress it if configured"""
+        self.detach_tx()
+        if self.thread.is_alive():
+            self.queue.put((_STOP, None, None))
+            self.thread.join()
+
+    def _write_loop(self):
+        get = self.queue.get
+        get_nowait = self.queue.get_nowait
+        running = True
+        while running:
+            batch = [get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(get_nowait())
+            except queue.Empty:
+                pass
+            for kind, timestamp, item in batch:
+                try:
+                    if kind == _RX:
+                        self.logger.on_message_received(item)
+                    elif kind == _TX:
+                        self.logger.on_message_received(self._tx_copy(item, timestamp))
+                    elif kind == _EVENT:
+                        writer = getattr(self.logger, 'writer', self.logger)
+                        log_event = getattr(writer, 'log_event', None)
+                        if log_event:
+                            log_event(item, timestamp)
+                    else:
+                        running = False
+                        continue
+                    self.written += 1
+                except Exception as e:
+                    print(f"[TRACE] Write error: {e}")
+        self.logger.stop()
+        self._finish(os.path.abspath(self.filename))
+
+    @staticmethod
+    def _tx_copy(msg, timestamp):
+        return can.Message(
+            timestamp=timestamp,
+            arbitration_id=msg.arbitration_id,
+            is_extended_id=msg.is_extended_id,
+            is_remote_frame=msg.is_remote_frame,
+            is_error_frame=msg.is_error_frame,
+            channel=msg.channel,
+            dlc=msg.dlc,
+            data=msg.data,
+            is_fd=msg.is_fd,
+            is_rx=False,
+            bitrate_switch=msg.bitrate_switch,
+            error_state_indicator=msg.error_state_indicator,
+        )
+
+    def _rotate(self, source, dest):
+        os.rename(source, dest)
+        self._finish(dest)
+
+    def _finish(self, path):
+        """Compress a closed trace file"""
+        if self.compress is None or not os.path.exists(path):
+            self.files.append(path)
+            return
+        if self.compress == 'gzip':
+            target = path + '.gz'
+            with open(path, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            target = path + '.zst'
+            with open(path, 'rb') as src, open(target, 'wb') as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+        os.remove(path)
+        self.files.append(target)
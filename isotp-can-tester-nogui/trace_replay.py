@@ -0,0 +1,180 @@
+import argparse
+import json
+import time
+
+import can
+
+from isotp_server import DEFAULT_PROFILE_FILE, load_profile
+from latency_histogram import LatencyHistogram
+from uds_server_common import CANBusFactory
+
+# Sleep until this close to a frame's send time, then spin
+SPIN_THRESHOLD = 0.002
+
+class TraceReplayer:
+    """Replays a recorded trace (ASC/BLF/candump .log, optionally .gz) with its original timing"""
+    def __init__(self, bus, speed=1.0, ids=None, exclude_ids=None, direction='both', keep_channel=False, max_lag=1.0):
+        """
+        Initialize replayer
+        :param bus: CAN bus instance to send on
+        :param speed: Time scale, 2.0 replays twice as fast, 0 sends as fast as possible
+        :param ids: Only replay these arbitration IDs
+        :param exclude_ids: Never replay these arbitration IDs
+        :param direction: 'rx', 'tx' or 'both', by the direction recorded in the trace
+        :param keep_channel: Keep the recorded channel on each frame (multi-channel interfaces)
+        :param max_lag: Seconds behind schedule after which the timeline is shifted instead of bursting to catch up
+        """
+        if direction not in ('rx', 'tx', 'both'):
+            raise ValueError(f"Unsupported direction: {direction}")
+        self.bus = bus
+        self.speed = speed
+        self.ids = set(ids) if ids else None
+        self.exclude_ids = set(exclude_ids) if exclude_ids else set()
+        self.direction = direction
+        self.keep_channel = keep_channel
+        self.max_lag = max_lag
+        self.running = False
+        self.timing_error = LatencyHistogram("Replay timing error")
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = 0
+        self.errors = 0
+        self.filtered = 0
+        self.resyncs = 0
+        self.timing_error.reset()
+
+    def _wanted(self, msg):
+        if msg.is_error_frame:
+            return False
+        if self.ids is not None and msg.arbitration_id not in self.ids:
+            return False
+        if msg.arbitration_id in self.exclude_ids:
+            return False
+        if self.direction == 'rx' and not msg.is_rx:
+            return False
+        if self.direction == 'tx' and msg.is_rx:
+            return False
+        return True
+
+    def replay(self, filename, start_offset=0.0, end_offset=None):
+        """
+        Replay one file, reading it frame by frame
+        :param filename: Trace file
+        :param start_offset: Skip frames recorded earlier than this many seconds after the first frame
+        :param end_offset: Stop at frames recorded this many seconds after the first frame
+        :return: Statistics dict, see stats()
+        """
+        clock = time.perf_counter
+        send = self.bus.send
+        record_error = self.timing_error.record
+        first = None
+        origin = None
+        self.running = True
+        started = clock()
+        for msg in can.LogReader(filename):
+            if not self.running:
+                break
+            if first is None:
+                first = msg.timestamp
+            offset = msg.timestamp - first
+            if offset < start_offset:
+                continue
+            if end_offset is not None and offset > end_offset:
+                break
+            if not self._wanted(msg):
+                self.filtered += 1
+                continue
+
+            if self.speed > 0:
+                if origin is None:
+                    origin = clock() - (offset - start_offset) / self.speed
+                # Absolute schedule from the first frame, so sleep errors do not add up
+                target = origin + (offset - start_offset) / self.speed
+                delay = target - clock()
+                if delay > SPIN_THRESHOLD:
+                    time.sleep(delay - SPIN_THRESHOLD)
+                while clock() < target:
+                    pass
+
+            if not self.keep_channel:
+                msg.channel = None
+            try:
+                send(msg)
+                self.sent += 1
+            except can.CanError as e:
+                self.errors += 1
+                if self.errors <= 10:
+                    print(f"[REPLAY] Send failed for {msg.arbitration_id:#05X}: {e}")
+
+            if self.speed > 0:
+                lag = clock() - target
+                record_error(max(lag, 0.0))
+                if lag > self.max_lag:
+                    # Stalled (e.g. TX buffer full): continue from now instead of bursting
+                    origin += lag
+                    self.resyncs += 1
+        self.running = False
+        return self.stats(clock() - started)
+
+    def stop(self):
+        """Stop a replay from another thread"""
+        self.running = False
+
+    def stats(self, elapsed=None):
+        stats = {
+            'sent': self.sent,
+            'errors': self.errors,
+            'filtered': self.filtered,
+            'resyncs': self.resyncs,
+            'timing_error_ms': {key: value for key, value in self.timing_error.snapshot().items() if key != 'buckets'},
+        }
+        if elapsed is not None:
+            stats['elapsed_s'] = round(elapsed, 3)
+            stats['frames_per_s'] = round(self.sent / elapsed, 1) if elapsed else None
+        return stats
+
+def _id_list(text):
+    return [int(value, 16) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay ASC/BLF/candump logs onto a CAN bus")
+    parser.add_argument('files', nargs='+', help="Trace files, replayed in order")
+    parser.add_argument('--profile', default='pcan', help="Bus profile from the profile file (default: pcan)")
+    parser.add_argument('--profiles', default=DEFAULT_PROFILE_FILE, help="Profile file")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time scale, 0 = as fast as possible")
+    parser.add_argument('--ids', type=_id_list, help="Only these IDs (hex, comma separated)")
+    parser.add_argument('--exclude-ids', type=_id_list, help="Skip these IDs (hex, comma separated)")
+    parser.add_argument('--direction', default='both', choices=['rx', 'tx', 'both'])
+    parser.add_argument('--start', type=float, default=0.0, help="Start offset in seconds")
+    parser.add_argument('--end', type=float, help="End offset in seconds")
+    parser.add_argument('--loops', type=int, default=1, help="Replay the files this many times, 0 = forever")
+    parser.add_argument('--keep-channel', action='store_true', help="Send on the channel recorded in the trace")
+    args = parser.parse_args()
+
+    profile, _ = load_profile(args.profiles, args.profile)
+    bus_config = dict(profile.get('bus', {}))
+    try:
+        can_factory = CANBusFactory(channel_type=profile['interface'], is_fd=bus_config.get('fd', False), **bus_config)
+        bus, notifier = can_factory.create_bus()
+        replayer = TraceReplayer(bus, args.speed, args.ids, args.exclude_ids, args.direction, args.keep_channel)
+
+        loop = 0
+        while args.loops == 0 or loop < args.loops:
+            loop += 1
+            for filename in args.files:
+                replayer.reset_stats()
+                stats = replayer.replay(filename, args.start, args.end)
+                print(f"[REPLAY] Loop {loop} {filename}:")
+                print(json.dumps(stats, indent=2))
+
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+    finally:
+        if 'notifier' in locals():
+            notifier.stop()
+        if 'bus' in locals():
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()
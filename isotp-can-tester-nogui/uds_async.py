@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import can
+import isotp
+import udsoncan
+from udsoncan import services
+from udsoncan.exceptions import TimeoutException
+
+from latency_histogram import LatencyHistogram
+from rx_filters import add_rx_filters
+from uds_client_common import isotp_params, node_id_map, uds_config
+from uds_server_common import CANBusFactory, ISOTPLayer, UDSResponder
+
+class AsyncCanDispatcher:
+    """Reads the bus through can.AsyncBufferedReader and routes frames to sessions by arbitration ID"""
+    def __init__(self, bus, notifier):
+        """
+        Initialize dispatcher
+        :param bus: CAN bus instance
+        :param notifier: Notifier created with the running event loop (CANBusFactory.create_bus(loop=...))
+        """
+        self.bus = bus
+        self.notifier = notifier
+        self.reader = can.AsyncBufferedReader()
+        self.routes = {}    # rxid -> AsyncIsoTpStack
+        self.task = None
+
+    def start(self):
+        """Start routing, must be called from inside the event loop"""
+        self.notifier.add_listener(self.reader)
+        self.task = asyncio.get_event_loop().create_task(self._route())
+
+    async def stop(self):
+        """Stop routing and wait until the routing task is gone"""
+        try:
+            self.notifier.remove_listener(self.reader)
+        except ValueError:
+            pass
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def register(self, rxid, stack):
+        if rxid in self.routes:
+            raise ValueError(f"RX ID {rxid:#05X} is already in use")
+        self.routes[rxid] = stack
+        add_rx_filters(self.bus, [rxid])
+
+    def unregister(self, rxid):
+        self.routes.pop(rxid, None)
+
+    async def _route(self):
+        async for msg in self.reader:
+            stack = self.routes.get(msg.arbitration_id)
+            if stack is not None and not msg.is_error_frame and not msg.is_remote_frame:
+                stack.feed(msg)
+
+class AsyncIsoTpStack:
+    """ISOTP session driven by a coroutine instead of threads"""
+
+    # Service interval while waiting for flow control or consecutive frames
+    ACTIVE_POLL = 0.005
+
+    def __init__(self, dispatcher, txid, rxid, params=None):
+        """
+        Initialize ISOTP session
+        :param dispatcher: AsyncCanDispatcher of the bus
+        :param txid: Transmission ID
+        :param rxid: Reception ID
+        :param params: ISOTP parameters, defaults to ISOTPLayer.DEFAULT_PARAMS
+        """
+        self.dispatcher = dispatcher
+        self.txid = txid
+        self.rxid = rxid
+        self.frames = collections.deque()
+        self.last_rx_time = None
+        self.layer = isotp.TransportLayerLogic(
+            rxfn=self._rxfn,
+            txfn=self._txfn,
+            address=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=txid, rxid=rxid),
+            params=params or ISOTPLayer.DEFAULT_PARAMS
+        )
+        self.rx_queue = None
+        self.wakeup = None
+        self.task = None
+
+    def _rxfn(self, timeout):
+        try:
+            return self.frames.popleft()
+        except IndexError:
+            return None
+
+    def _txfn(self, msg):
+        self.dispatcher.bus.send(can.Message(
+            arbitration_id=msg.arbitration_id,
+            data=msg.data,
+            is_extended_id=msg.is_extended_id,
+            is_fd=msg.is_fd,
+            bitrate_switch=msg.bitrate_switch
+        ))
+
+    def feed(self, msg):
+        """Called by the dispatcher for every frame on our RX ID"""
+        self.last_rx_time = time.perf_counter()
+        self.frames.append(isotp.CanMessage(
+            arbitration_id=msg.arbitration_id,
+            data=msg.data,
+            extended_id=msg.is_extended_id,
+            is_fd=msg.is_fd,
+            bitrate_switch=msg.bitrate_switch
+        ))
+        self.wakeup.set()
+
+    def start(self):
+        """Start the session, must be called from inside the event loop"""
+        self.rx_queue = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.dispatcher.register(self.rxid, self)
+        self.task = asyncio.get_event_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the session; returns once its task has really finished"""
+        self.dispatcher.unregister(self.rxid)
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.layer.reset()
+
+    async def _run(self):
+        layer = self.layer
+        while True:
+            self.wakeup.clear()
+            layer.process()
+            while layer.available():
+                self.rx_queue.put_nowait(layer.recv())
+
+            if layer.is_tx_transmitting_cf():
+                delay = layer.next_cf_delay()
+            elif self.frames:
+                delay = 0
+            elif layer.transmitting() or layer.is_rx_active():
+                delay = self.ACTIVE_POLL
+            else:
+                delay = None
+
+            if delay == 0:
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def send(self, payload):
+        """Queue a payload for transmission"""
+        self.layer.send(payload)
+        self.wakeup.set()
+
+    async def recv(self, timeout=None):
+        """
+        Wait for a complete ISOTP frame
+        :param timeout: Seconds to wait, None waits forever
+        :return: Payload or None on timeout
+        """
+        try:
+            return await asyncio.wait_for(self.rx_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class AsyncUDSResponder:
+    """asyncio front end of UDSResponder"""
+    def __init__(self, test_case_file='IMS_response.json', verbose=True):
+        """
+        Initialize responder
+        :param test_case_file: Test case file
+        :param verbose: Print every request and response
+        """
+        self.responder = UDSResponder(test_case_file, verbose=verbose)
+        self.latency = LatencyHistogram("UDS response latency")
+        self.tasks = []
+
+    def serve(self, stack):
+        """
+        Answer requests arriving on a session until stop() is called
+        :param stack: Started AsyncIsoTpStack
+        :return: The serving task
+        """
+        task = asyncio.get_event_loop().create_task(self._serve(stack))
+        self.tasks.append(task)
+        return task
+
+    async def _serve(self, stack):
+        while True:
+            payload = await stack.recv()
+            wake_time = time.perf_counter()
+            rx_time = stack.last_rx_time if stack.last_rx_time and stack.last_rx_time <= wake_time else wake_time
+            try:
+                stack.send(self.responder.process_request(payload))
+            except Exception as e:
+                print(f"[UDS] Reception processing error: {e}")
+                continue
+            self.latency.record(time.perf_counter() - rx_time)
+
+    async def stop(self):
+        """Cancel every serving task and wait for them"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+class AsyncCommonClient:
+    """asyncio counterpart of CommonClient, many instances can share one dispatcher"""
+    def __init__(self, dispatcher, node_name, params=None, config=None):
+        """
+        Initialize client
+        :param dispatcher: AsyncCanDispatcher of the bus
+        :param node_name: Node name, used to determine send and receive ID
+        :param params: ISOTP parameters, defaults to uds_client_common.isotp_params
+        :param config: UDS timing/DID configuration, defaults to uds_client_common.uds_config
+        """
+        if node_name not in node_id_map:
+            raise ValueError(f"Unsupported node name: {node_name}")
+        self.node_name = node_name
+        self.tx_id = node_id_map[node_name]['TXID']
+        self.rx_id = node_id_map[node_name]['RXID']
+        self.config = config or uds_config
+        self.stack = AsyncIsoTpStack(dispatcher, self.tx_id, self.rx_id, params or isotp_params)
+
+    def start(self):
+        self.stack.start()
+
+    async def stop(self):
+        await self.stack.close()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def send_raw(self, payload, timeout=2):
+        """
+        Send raw bytes and wait for one response payload
+        :return: Response payload or None on timeout
+        """
+        self.stack.send(payload)
+        return await self.stack.recv(timeout)
+
+    async def send_request(self, request):
+        """
+        Send a udsoncan Request, handling NRC 0x78 (response pending) like udsoncan's Client
+        :param request: udsoncan.Request
+        :return: udsoncan.Response, check .positive
+        :raises TimeoutException: No final response within P2/P2*/request_timeout
+        """
+        payload = request.get_payload()
+        sid = payload[0]
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.config['request_timeout']
+        single_timeout = self.config['p2_timeout']
+
+        self.stack.send(payload)
+        while True:
+            timeout = min(single_timeout, max(deadline - loop.time(), 0))
+            data = await self.stack.recv(timeout)
+            if data is None:
+                raise TimeoutException(f"[{self.node_name}] No response to service 0x{sid:02X} in time")
+            response = udsoncan.Response.from_payload(data)
+            if not response.positive and response.code == udsoncan.Response.Code.RequestCorrectlyReceived_ResponsePending:
+                single_timeout = self.config['p2_star_timeout']
+                continue
+            if data[0] not in (sid + 0x40, 0x7F) or (data[0] == 0x7F and data[1:2] != bytes([sid])):
+                continue    # Late answer to an earlier request
+            return response
+
+    async def read_data_by_identifier(self, didlist):
+        """
+        ReadDataByIdentifier using the configured DID codecs
+        :return: udsoncan.Response, decoded values in response.service_data.values when positive
+        """
+        didconfig = self.config['data_identifiers']
+        request = services.ReadDataByIdentifier.make_request(didlist, didconfig)
+        response = await self.send_request(request)
+        if response.positive:
+            services.ReadDataByIdentifier.interpret_response(
+                response, didlist, didconfig,
+                tolerate_zero_padding=self.config['tolerate_zero_padding']
+            )
+        return response
+
+async def serve_nodes(interface, bus_config, node_file, test_case_file, verbose):
+    """Serve every node of a node description file from one event loop"""
+    loop = asyncio.get_event_loop()
+    can_factory = CANBusFactory(channel_type=interface, is_fd=bus_config.get('fd', False), **bus_config)
+    bus, notifier = can_factory.create_bus(loop=loop)
+    dispatcher = AsyncCanDispatcher(bus, notifier)
+    dispatcher.start()
+
+    responder = AsyncUDSResponder(test_case_file, verbose=verbose)
+    stacks = []
+    with open(node_file, 'r') as file:
+        data = json.load(file)
+    for entry in data['CAN_Nodes']:
+        rxid = int(entry['phyreq_address'], 16)
+        txid = int(entry['resp_address'], 16)
+        if rxid in dispatcher.routes:
+            print(f"[ASYNC] Skipping {entry['node_id']}: request ID {rxid:#05X} already in use")
+            continue
+        stack = AsyncIsoTpStack(dispatcher, txid, rxid)
+        stack.start()
+        responder.serve(stack)
+        stacks.append(stack)
+        print(f"[ASYNC] {entry['node_id']:<6} RXID: {rxid:#05X}  TXID: {txid:#05X}")
+
+    try:
+        await asyncio.Event().wait()    # Run until cancelled
+    finally:
+        await responder.stop()
+        for stack in stacks:
+            await stack.close()
+        await dispatcher.stop()
+        print(responder.latency)
+        notifier.stop()
+        bus.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve all nodes from one asyncio event loop")
+    parser.add_argument('--interface', default='socketcan', choices=['pcan', 'vector', 'slcan', 'socketcan'])
+    parser.add_argument('--channel', default='vcan0')
+    parser.add_argument('--bitrate', type=int, default=500000)
+    parser.add_argument('--nodes', default='Node_Description.json')
+    parser.add_argument('--cases', default='IMS_response.json')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args()
+
+    bus_config = {'bitrate': args.bitrate, 'channel': args.channel}
+    try:
+        asyncio.run(serve_nodes(args.interface, bus_config, args.nodes, args.cases, not args.quiet))
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 import can
 import isotp
 import udsoncan
+from udsoncan import services
 from udsoncan.client import Client
+from udsoncan.common.dids import fetch_codec_definition_from_config, make_did_codec_from_definition
 from udsoncan.connections import PythonIsoTpConnection
+from udsoncan.exceptions import TimeoutException
+import collections
 import time
 import random
 from can.interface import Bus
 import logging
 from config import Config
+from firmware_image import BinImage, FirmwareImage, open_image
+from rx_filters import add_rx_filters
 import sys
 import binascii
 import struct
+import zlib
 
 isotp_params = {
     'stmin': 10,
@@ -49,29 +56,90 @@ class FlexRawData(udsoncan.DidCodec):
     def __len__(self):
         return 30    # Fixed return 30 bytes length
 
+# Node ID mapping table
+node_id_map = {
+    'IMS': {'RXID': 0x759, 'TXID': 0x749},
+    'SMLS': {'RXID': 0x739, 'TXID': 0x731},
+    'HCML': {'RXID': 0x748, 'TXID': 0x740},
+    'HCMR': {'RXID': 0x749, 'TXID': 0x741},
+    'RCM':  {'RXID': 0x74A, 'TXID': 0x742},
+    'BMS': {'RXID': 0x7EA, 'TXID': 0x7E2},
+    'PWR': {'RXID': 0x7EB, 'TXID': 0x7E3},
+    'OCDC': {'RXID': 0x7ED, 'TXID': 0x7E5},
+    'TMM': {'RXID': 0x7EE, 'TXID': 0x7E6},
+    'VCU': {'RXID': 0x7E9, 'TXID': 0x7E1},
+    'HCU': {'RXID': 0x7EF, 'TXID': 0x7E7},
+}
+
+uds_config = {
+    'request_timeout': 2,
+    'p2_timeout': 1,
+    'p2_star_timeout': 5,
+    'security_algo': None,
+    'security_algo_params': None,
+    'tolerate_zero_padding': True,
+    'ignore_all_zero_dtc': True,
+    'dtc_snapshot_did_size': 2,
+    'data_identifiers': {
+        'default': '>H',
+        0x7705: FlexRawData,
+    }
+}
+
+# Negative responses after which a multi-DID request is split and retried
+SPLIT_NRCS = (
+    udsoncan.Response.Code.IncorrectMessageLengthOrInvalidFormat,
+    udsoncan.Response.Code.ResponseTooLong,
+)
+
+def pack_did_requests(didlist, didconfig, max_response_length=4095, max_dids=None):
+    """
+    Group DIDs into ReadDataByIdentifier requests whose positive response fits max_response_length
+    DIDs keep their order; a DID whose codec has no fixed length gets a request of its own.
+    :param didlist: DIDs to read, duplicates are read once
+    :param didconfig: udsoncan data_identifiers configuration
+    :param max_response_length: Largest response payload the ECU sends, including the 0x62 SID
+    :param max_dids: Largest number of DIDs per request the ECU accepts
+    :return: List of DID lists, one per request
+    """
+    groups = []
+    current = []
+    size = 1
+    for did in dict.fromkeys(didlist):
+        codec = make_did_codec_from_definition(fetch_codec_definition_from_config(did, didconfig))
+        try:
+            length = 2 + len(codec)
+        except (NotImplementedError, udsoncan.DidCodec.ReadAllRemainingData):
+            length = None
+        if length is None or (current and (size + length > max_response_length
+                                           or (max_dids and len(current) >= max_dids))):
+            if current:
+                groups.append(current)
+            current = []
+            size = 1
+        current.append(did)
+        size += length or 0
+        if length is None:
+            groups.append(current)
+            current = []
+            size = 1
+    if current:
+        groups.append(current)
+    return groups
+
 class CommonClient:
-    def __init__(self, bus_type, node_name):
+    def __init__(self, bus_type, node_name, bus=None, notifier=None):
         """
         Initialize CommonClient
         :param bus_type: CAN bus type, supports 'vector' and 'pcan'
         :param node_name: Node name, used to determine send and receive ID
+        :param bus: Already opened bus to share with other clients, bus_type is then not used
+        :param notifier: Notifier of that bus
         """
         self.bus_type = bus_type
+        self.node_name = node_name
 
-        # Node ID mapping table
-        self.node_id_map = {
-            'IMS': {'RXID': 0x759, 'TXID': 0x749},
-            'SMLS': {'RXID': 0x739, 'TXID': 0x731},
-            'HCML': {'RXID': 0x748, 'TXID': 0x740},
-            'HCMR': {'RXID': 0x749, 'TXID': 0x741},
-            'RCM':  {'RXID': 0x74A, 'TXID': 0x742},
-            'BMS': {'RXID': 0x7EA, 'TXID': 0x7E2},
-            'PWR': {'RXID': 0x7EB, 'TXID': 0x7E3},
-            'OCDC': {'RXID': 0x7ED, 'TXID': 0x7E5},
-            'TMM': {'RXID': 0x7EE, 'TXID': 0x7E6},
-            'VCU': {'RXID': 0x7E9, 'TXID': 0x7E1},
-            'HCU': {'RXID': 0x7EF, 'TXID': 0x7E7},
-        }
+        self.node_id_map = node_id_map
         
         # Set send and receive ID based on node name
         if node_name in self.node_id_map:
@@ -83,13 +151,19 @@ class CommonClient:
         else:
             raise ValueError(f"Unsupported node name: {node_name}")
         
-        # Configure CAN bus parameters
-        self._configure_can_rc()
-        print(f"Bus type configured as: {can.rc['bustype']}")
-        # Initialize CAN bus
-        self.bus = Bus()
-        print("CAN bus initialized")
-        self.notifier = can.Notifier(self.bus, [])
+        self.owns_bus = bus is None
+        if self.owns_bus:
+            # Configure CAN bus parameters
+            self._configure_can_rc()
+            print(f"Bus type configured as: {can.rc['bustype']}")
+            # Initialize CAN bus
+            self.bus = Bus()
+            print("CAN bus initialized")
+            self.notifier = can.Notifier(self.bus, [])
+        else:
+            self.bus = bus
+            self.notifier = notifier
+        add_rx_filters(self.bus, [self.rx_id])
         # Initialize ISOTP layer
         self.tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, 
                                    txid=self.tx_id, 
@@ -101,22 +175,8 @@ class CommonClient:
             params=isotp_params
         )
         
-        self.uds_config = udsoncan.configs.default_client_config.copy()
-        self.uds_config = {
-            'request_timeout': 2,
-            'p2_timeout': 1,
-            'p2_star_timeout': 5,
-            'security_algo': None,
-            'security_algo_params': None,
-            'tolerate_zero_padding': True,
-            'ignore_all_zero_dtc': True,
-            'dtc_snapshot_did_size': 2
-        }
-        
-        self.uds_config['data_identifiers'] = {
-                'default': '>H',
-                0x7705: FlexRawData,
-            }
+        self.uds_config = dict(uds_config)
+        self.uds_config['data_identifiers'] = dict(uds_config['data_identifiers'])
         self.conn = PythonIsoTpConnection(self.stack)
         self.uds_client = Client( self.conn, config=self.uds_config)
         
@@ -153,7 +213,9 @@ class CommonClient:
         """
         self.uds_client.close()
         self.stack.stop()
-        self.bus.shutdown()
+        if self.owns_bus:
+            self.notifier.stop()
+            self.bus.shutdown()
         
     def get_client(self):
         """
@@ -161,6 +223,144 @@ class CommonClient:
         """
         return self.uds_client
 
+    def read_dids(self, didlist, max_response_length=None, max_dids=None):
+        """
+        Read many DIDs with as few ReadDataByIdentifier requests as possible
+        Requests are packed with pack_did_requests and pipelined: the next request is sent as
+        soon as a response arrives, and the response is decoded while the ECU works on the next.
+        A multi-DID request answered with NRC 0x13/0x14 is split in half and retried.
+        :param didlist: DIDs to read, decoded with the codecs of uds_config['data_identifiers']
+        :param max_response_length: Largest response payload of the ECU, defaults to the ISOTP max_frame_size
+        :param max_dids: Largest number of DIDs per request the ECU accepts
+        :return: Dict DID -> decoded value, None for DIDs the ECU did not return
+        """
+        didconfig = self.uds_config['data_identifiers']
+        tolerate_zero_padding = self.uds_config['tolerate_zero_padding']
+        pending = collections.deque(pack_did_requests(didlist, didconfig,
+                                                      max_response_length or isotp_params['max_frame_size'], max_dids))
+        results = {}
+        self.conn.empty_rxqueue()
+        if pending:
+            self.conn.send(services.ReadDataByIdentifier.make_request(pending[0], didconfig).get_payload())
+        while pending:
+            group = pending.popleft()
+            response = self._wait_response(0x22)
+            if not response.positive and response.code in SPLIT_NRCS and len(group) > 1:
+                half = len(group) // 2
+                pending.extendleft([group[half:], group[:half]])
+            if pending:
+                # Keep the ECU busy while this response is decoded
+                self.conn.send(services.ReadDataByIdentifier.make_request(pending[0], didconfig).get_payload())
+            if response.positive:
+                services.ReadDataByIdentifier.interpret_response(response, group, didconfig,
+                                                                 tolerate_zero_padding=tolerate_zero_padding)
+                # Unsupported DIDs are left out of a positive response
+                results.update(dict.fromkeys(group))
+                results.update(response.service_data.values)
+            elif response.code not in SPLIT_NRCS or len(group) == 1:
+                print(f"[UDS] DID {', '.join(f'0x{did:04X}' for did in group)}: negative response 0x{response.code:02X}")
+                results.update(dict.fromkeys(group))
+        return results
+
+    def _wait_response(self, sid):
+        """Wait for the response to service sid, handling NRC 0x78 (response pending) like udsoncan's Client"""
+        deadline = time.perf_counter() + self.uds_config['request_timeout']
+        timeout = self.uds_config['p2_timeout']
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutException(f"No response to service 0x{sid:02X} in time")
+            payload = self.conn.wait_frame(timeout=min(timeout, remaining))
+            if payload is None:
+                raise TimeoutException(f"No response to service 0x{sid:02X} in time")
+            response = udsoncan.Response.from_payload(payload)
+            if payload[0] not in (sid + 0x40, 0x7F) or (payload[0] == 0x7F and payload[1:2] != bytes([sid])):
+                continue    # Late answer to another service
+            if not response.positive and response.code == udsoncan.Response.Code.RequestCorrectlyReceived_ResponsePending:
+                timeout = self.uds_config['p2_star_timeout']
+                deadline = max(deadline, time.perf_counter() + timeout)
+                continue
+            return response
+
+    def download(self, source, address=0, memory_size=None, block_length=None, address_format=32,
+                 memorysize_format=32, check_routine=None, timeout=10, progress=None):
+        """
+        Program an image: per segment RequestDownload (0x34), TransferData (0x36) blocks, RequestTransferExit (0x37)
+        Blocks are memoryview slices of the mapped file (BIN) or of one decoded segment (HEX/S-record),
+        the CRC32 is updated per block. Session and security access are up to the caller.
+        :param source: Image path (.bin/.hex/.s19/...), binary file object or firmware_image.FirmwareImage
+        :param address: Memory address of raw binary images, HEX/S-record carry their own
+        :param memory_size: Bytes to program of a raw binary image, defaults to the file size
+        :param block_length: Upper limit for the TransferData data size, the ECU's maxNumberOfBlockLength always applies
+        :param address_format: Address size in bits for the 0x34 request
+        :param memorysize_format: Memory size field in bits for the 0x34 request
+        :param check_routine: RoutineControl ID started with the CRC32 (4 bytes big endian) over all segments
+        :param timeout: P2/request timeout in seconds while blocks are transferred
+        :param progress: Called with (bytes done, total bytes) after each block
+        :return: Statistics dict with bytes, segments, blocks, block_length, elapsed_s, kb_per_s and crc32
+        """
+        if isinstance(source, FirmwareImage):
+            image = source
+        elif memory_size is not None:
+            image = BinImage(source, address, length=memory_size)
+        else:
+            image = open_image(source, address)
+        saved = {key: self.uds_client.config[key] for key in ('p2_timeout', 'request_timeout')}
+        self.uds_client.set_configs({'p2_timeout': timeout, 'request_timeout': timeout})
+        try:
+            return self._download(image, block_length, address_format, memorysize_format, check_routine, progress)
+        finally:
+            self.uds_client.set_configs(saved)
+            if image is not source:
+                image.close()
+
+    def _download(self, image, block_length, address_format, memorysize_format, check_routine, progress):
+        start = time.perf_counter()
+        total = image.size
+        crc = 0
+        done = 0
+        blocks = 0
+        limit = None
+        for index, (address, length) in enumerate(image.segments):
+            location = udsoncan.MemoryLocation(address, length, address_format=address_format,
+                                               memorysize_format=memorysize_format)
+            response = self.uds_client.request_download(location)
+            # maxNumberOfBlockLength counts the SID and the block sequence counter as well
+            negotiated = response.service_data.max_length - 2
+            limit = min(negotiated, isotp_params['max_frame_size'] - 2)
+            if block_length:
+                limit = min(limit, block_length)
+            print(f"[FLASH] {self.node_name}: {length} bytes to 0x{address:08X}, "
+                  f"ECU block length {negotiated}, using {limit}")
+
+            sequence = 1
+            for block in image.blocks(index, limit):
+                crc = zlib.crc32(block, crc)
+                response = self.uds_client.transfer_data(sequence, block.tobytes())
+                if response.service_data.sequence_number_echo != sequence:
+                    raise ValueError(f"TransferData echoed sequence {response.service_data.sequence_number_echo}, sent {sequence}")
+                done += len(block)
+                blocks += 1
+                sequence = (sequence + 1) & 0xFF
+                if progress:
+                    progress(done, total)
+            self.uds_client.request_transfer_exit()
+
+        if check_routine is not None:
+            self.uds_client.start_routine(check_routine, data=crc.to_bytes(4, 'big'))
+        elapsed = time.perf_counter() - start
+        return {
+            'ecu': self.node_name,
+            'address': image.segments[0][0] if image.segments else None,
+            'bytes': done,
+            'segments': len(image.segments),
+            'blocks': blocks,
+            'block_length': limit,
+            'elapsed_s': round(elapsed, 3),
+            'kb_per_s': round(done / 1024 / elapsed, 1) if elapsed else None,
+            'crc32': f"{crc:08X}",
+        }
+
 
 def main():
     """
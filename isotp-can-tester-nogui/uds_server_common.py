@@ -2,27 +2,56 @@ import can
 import isotp
 import time
 import json
+import socket
 from config import Config
+from latency_histogram import LatencyHistogram
+from rx_filters import add_rx_filters, block_rx
 import threading
 
 class CANBusFactory:
     """CAN Bus Factory class for creating different types of CAN interfaces"""
+
+    # ISOTP transports: 'python' segments in can-isotp, 'kernel' uses Linux CAN_ISOTP sockets,
+    # 'auto' takes the kernel on socketcan when the can-isotp module is loaded
+    ISOTP_TRANSPORTS = ('auto', 'kernel', 'python')
+
+    # Default Vector options, same values the scripts used to put into can.rc
+    VECTOR_DEFAULTS = {
+        'channel': '0',
+        'app_name': 'Python_ISOTP_Client',
+        'fd': False,
+        'bitrate': 500000,
+        'sjw_abr': 16,
+        'tseg1_abr': 63,
+        'tseg2_abr': 16,
+    }
     
     def __init__(self, channel_type, is_fd,**kwargs):
         """
         Initialize CAN Bus Factory
-        :param channel_type: CAN interface type ('pcan'/'vector'/'slcan'/'socketcan')
-        :param kwargs: Interface specific configuration parameters
+        :param channel_type: CAN interface type ('pcan'/'vector'/'slcan'/'socketcan'/'virtual'/'mux')
+        :param kwargs: Interface specific configuration parameters, keys the factory
+                       does not use itself (e.g. data_bitrate, nom_tseg1, sjw_dbr) are
+                       passed to the python-can bus constructor. 'isotp_transport' selects
+                       the layer create_isotp_layer() returns, see ISOTP_TRANSPORTS
         """
         self.channel_type = channel_type
+        self.isotp_transport = kwargs.pop('isotp_transport', 'auto')
+        if self.isotp_transport not in self.ISOTP_TRANSPORTS:
+            raise ValueError(f"Unsupported ISOTP transport: {self.isotp_transport}")
+        if self.isotp_transport == 'kernel' and channel_type != 'socketcan':
+            raise ValueError("Kernel ISOTP transport needs a socketcan interface")
+        self.kernel_isotp = False
         self.config = kwargs
         self.can_bus = None
         self.notifier = None
         self.is_fd = is_fd
         
-    def create_bus(self):
+    def create_bus(self, loop=None, rx_ids=None):
         """
         Create CAN bus instance based on configuration
+        :param loop: asyncio event loop the notifier should deliver messages in
+        :param rx_ids: Only let these IDs through the bus filters, stacks created later add their own
         :return: (can_bus, notifier) tuple
         """
         if self.channel_type == 'pcan':
@@ -33,11 +62,35 @@ class CANBusFactory:
             self._create_slcan_bus()
         elif self.channel_type == 'socketcan':
             self._create_socketcan_bus()
+        elif self.channel_type == 'virtual':
+            self._create_virtual_bus()
+        elif self.channel_type == 'mux':
+            self._create_mux_bus()
         else:
             raise ValueError(f"Unsupported CAN interface type: {self.channel_type}")
-            
-        self.notifier = can.Notifier(self.can_bus, [])
+
+        if rx_ids:
+            add_rx_filters(self.can_bus, rx_ids)
+        self.notifier = can.Notifier(self.can_bus, [], loop=loop)
         return self.can_bus, self.notifier
+
+    def create_isotp_layer(self, txid, rxid, params=None):
+        """
+        ISOTP layer for the created bus, on a kernel socket when the transport selects it
+        :param txid: Transmission ID
+        :param rxid: Reception ID
+        :param params: ISOTP parameters overriding DEFAULT_PARAMS
+        :return: KernelISOTPLayer or ISOTPLayer
+        """
+        if self.kernel_isotp:
+            # The kernel socket receives on its own, keep the frames off the raw bus and notifier
+            block_rx(self.can_bus)
+            return KernelISOTPLayer(self.config.get('channel', 'can0'), txid, rxid, params=params)
+        return ISOTPLayer(self.can_bus, self.notifier, txid, rxid, params=params)
+
+    def _extra_options(self, *used):
+        """Configuration entries not consumed by the factory itself"""
+        return {key: value for key, value in self.config.items() if key not in used}
         
     def _create_pcan_bus(self):
         """Create PCAN bus instance"""
@@ -52,30 +105,26 @@ class CANBusFactory:
         }
         
         handle = self.config.get('handle', 0x51)  # Default to PCAN_USBBUS1
+        if isinstance(handle, str):
+            handle = int(handle, 0)
         if handle not in pcan_channel_map:
             raise ValueError(f"Unsupported PCAN channel handle: 0x{handle:02X}")
             
         self.can_bus = PcanBus(
             channel=pcan_channel_map[handle],
             bitrate=self.config.get('bitrate', 500000),
-            fd=self.config.get('fd', False)
+            fd=self.config.get('fd', False),
+            **self._extra_options('handle', 'bitrate', 'fd')
         )
         
     def _create_vector_bus(self):
         """Create Vector bus instance"""
-        can.rc['interface'] = 'vector'
-        can.rc['bustype'] = 'vector'
-        can.rc['channel'] = '0'
-        can.rc['app_name'] = 'Python_ISOTP_Client'
-        can.rc['fd'] = False  
-        can.rc['bitrate'] = 500000
-        can.rc['sjw_abr'] = 16
-        can.rc['tseg1_abr'] = 63
-        can.rc['tseg2_abr'] = 16
+        options = dict(self.VECTOR_DEFAULTS)
+        options.update(self.config)
     
         try:
-            self.can_bus = can.Bus()
-            print(f"Vector bus initialized successfully in {'CANFD' if self.is_fd else 'CAN'} mode.")
+            self.can_bus = can.Bus(interface='vector', **options)
+            print(f"Vector bus initialized successfully in {'CANFD' if options['fd'] else 'CAN'} mode.")
         except Exception as e:
             print(f"Failed to initialize Vector bus: {e}")
             raise
@@ -86,21 +135,74 @@ class CANBusFactory:
         
         self.can_bus = slcanBus(
             channel=self.config.get('port', 'COM34'),
-            bitrate=self.config.get('bitrate', 500000)
+            bitrate=self.config.get('bitrate', 500000),
+            **self._extra_options('port', 'bitrate', 'fd')
         )
         
     def _create_socketcan_bus(self):
-        """Create SocketCAN bus instance"""
+        """Create SocketCAN bus instance and select the ISOTP transport"""
+        if self.isotp_transport != 'python':
+            self.kernel_isotp = kernel_isotp_available()
+            if not self.kernel_isotp and self.isotp_transport == 'kernel':
+                raise ValueError("Kernel ISOTP transport not available, load it with 'modprobe can-isotp'")
+            print(f"ISOTP transport: {'kernel' if self.kernel_isotp else 'python'}")
         self.can_bus = can.Bus(
             interface='socketcan',
             channel=self.config.get('channel', 'can0'),
             bitrate=self.config.get('bitrate', 500000),
-            fd=self.config.get('fd', False)
+            fd=self.config.get('fd', False),
+            **self._extra_options('channel', 'bitrate', 'fd')
+        )
+
+    def _create_virtual_bus(self):
+        """Create python-can virtual bus instance, for running without hardware"""
+        self.can_bus = can.Bus(
+            interface='virtual',
+            channel=self.config.get('channel', 'vcan0'),
+            **self._extra_options('channel', 'bitrate', 'fd')
+        )
+
+    def _create_mux_bus(self):
+        """Connect to a running bus_mux.py, which owns the adapter and shares it between processes"""
+        from bus_mux import DEFAULT_ADDRESS, MuxBus
+
+        self.can_bus = MuxBus(
+            channel=self.config.get('address', DEFAULT_ADDRESS),
+            **self._extra_options('address', 'bitrate', 'fd')
         )
 
+class _RxTimestamp(can.Listener):
+    """Notifier listener recording when the last frame for an RX ID arrived"""
+    def __init__(self, rxid):
+        self.rxid = rxid
+        self.last_rx_time = None
+
+    def on_message_received(self, msg):
+        if msg.arbitration_id == self.rxid:
+            self.last_rx_time = time.perf_counter()
+
 class ISOTPLayer:
     """ISOTP protocol layer wrapper"""
-    def __init__(self, bus, notifier, txid, rxid, is_fd=False):
+
+    DEFAULT_PARAMS = {
+        'stmin': 0,
+        'blocksize': 0,
+        'override_receiver_stmin': None,
+        'wftmax': 4,
+        'tx_data_length': 8,
+        'tx_data_min_length':8,
+        'tx_padding': 0x00,
+        'rx_flowcontrol_timeout': 1000,
+        'rx_consecutive_frame_timeout': 100,
+        'can_fd': False,
+        'max_frame_size': 4095,
+        'bitrate_switch': False,
+        'rate_limit_enable': False,
+        'listen_mode': False,
+        'blocking_send': False   
+    }
+
+    def __init__(self, bus, notifier, txid, rxid, is_fd=False, params=None, filter_rx=True):
         """
         Initialize ISOTP layer
         :param bus: CAN bus instance
@@ -108,24 +210,12 @@ class ISOTPLayer:
         :param txid: Transmission ID
         :param rxid: Reception ID
         :param is_fd: Whether to use CANFD
+        :param params: ISOTP parameters overriding DEFAULT_PARAMS
+        :param filter_rx: Add rxid to the bus filters so other frames are dropped before the notifier
         """
-        self.params = {
-            'stmin': 0,
-            'blocksize': 0,
-            'override_receiver_stmin': None,
-            'wftmax': 4,
-            'tx_data_length': 8,
-            'tx_data_min_length':8,
-            'tx_padding': 0x00,
-            'rx_flowcontrol_timeout': 1000,
-            'rx_consecutive_frame_timeout': 100,
-            'can_fd': False,
-            'max_frame_size': 4095,
-            'bitrate_switch': False,
-            'rate_limit_enable': False,
-            'listen_mode': False,
-            'blocking_send': False   
-        }
+        self.params = dict(self.DEFAULT_PARAMS)
+        if params:
+            self.params.update(params)
 
         self.tp_addr = isotp.Address(
             isotp.AddressingMode.Normal_11bits,
@@ -139,44 +229,189 @@ class ISOTPLayer:
             address=self.tp_addr,
             params=self.params
         )
+        self.notifier = notifier
+        self.rx_timestamp = _RxTimestamp(rxid)
+        if filter_rx:
+            add_rx_filters(bus, [rxid])
+
+    @property
+    def last_rx_time(self):
+        """perf_counter() time of the last frame received on the RX ID"""
+        return self.rx_timestamp.last_rx_time
 
     def start(self):
         """Start ISOTP layer"""
+        self.notifier.add_listener(self.rx_timestamp)
         self.layer.start()
         print("[ISOTP] Protocol stack started")
 
     def stop(self):
         """Stop ISOTP layer"""
         self.layer.stop()
+        try:
+            self.notifier.remove_listener(self.rx_timestamp)
+        except ValueError:
+            pass
         print("[ISOTP] Protocol stack stopped")
 
     def send(self, payload):
         """Send data"""
         self.layer.send(payload)
 
-    def receive(self, timeout=1):
-        """Receive data"""
-        return self.layer.recv(timeout=timeout)
+    def receive(self, timeout=1, block=False):
+        """
+        Receive data
+        :param timeout: Wait time in seconds, only used when block is True
+        :param block: Wait on the stack RX queue until a frame is complete
+        """
+        return self.layer.recv(block=block, timeout=timeout)
+
+def kernel_isotp_available():
+    """True when Linux CAN_ISOTP sockets can be opened (can-isotp module loaded)"""
+    try:
+        sock = isotp.socket()
+    except (NotImplementedError, OSError):
+        return False
+    sock.close()
+    return True
+
+class KernelISOTPLayer:
+    """ISOTP layer on a Linux kernel CAN_ISOTP socket, same interface as ISOTPLayer"""
+
+    def __init__(self, channel, txid, rxid, params=None):
+        """
+        Initialize kernel ISOTP layer
+        Segmentation, flow control and STmin timing run in the kernel, Python only sees whole payloads.
+        :param channel: SocketCAN interface, e.g. 'vcan0'
+        :param txid: Transmission ID
+        :param rxid: Reception ID
+        :param params: ISOTP parameters overriding ISOTPLayer.DEFAULT_PARAMS
+        """
+        self.params = dict(ISOTPLayer.DEFAULT_PARAMS)
+        if params:
+            self.params.update(params)
+        self.channel = channel
+        self.tp_addr = isotp.Address(
+            isotp.AddressingMode.Normal_11bits,
+            txid=txid,
+            rxid=rxid
+        )
+        self.sock = None
+        self.last_rx_time = None
+
+    def start(self):
+        """Open and bind the socket"""
+        params = self.params
+        flags = isotp.socket.flags
+        optflag = 0
+        tx_stmin = None
+        if params['tx_padding'] is not None:
+            optflag |= flags.TX_PADDING
+        if params['override_receiver_stmin'] is not None:
+            optflag |= flags.FORCE_TXSTMIN
+            tx_stmin = int(params['override_receiver_stmin'] * 1000000000)   # s -> ns
+        if params['listen_mode']:
+            optflag |= flags.LISTEN_MODE
+
+        sock = isotp.socket()
+        sock.set_opts(optflag=optflag, txpad=params['tx_padding'], tx_stmin=tx_stmin)
+        sock.set_fc_opts(bs=params['blocksize'], stmin=params['stmin'], wftmax=params['wftmax'])
+        if params['can_fd']:
+            sock.set_ll_opts(
+                mtu=isotp.socket.LinkLayerProtocol.CAN_FD,
+                tx_dl=params['tx_data_length'],
+                tx_flags=0x01 if params['bitrate_switch'] else 0    # CANFD_BRS
+            )
+        sock.bind(self.channel, self.tp_addr)
+        self.sock = sock
+        print(f"[ISOTP] Kernel protocol stack started on {self.channel}")
+
+    def stop(self):
+        """Close the socket"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        print("[ISOTP] Kernel protocol stack stopped")
+
+    def send(self, payload):
+        """Send data, the kernel queues the whole transfer"""
+        self.sock.send(bytes(payload))
+
+    def receive(self, timeout=1, block=False):
+        """
+        Receive data
+        :param timeout: Wait time in seconds, only used when block is True
+        :param block: Wait in the kernel until a payload is complete
+        """
+        try:
+            if block:
+                self.sock.settimeout(timeout)
+                payload = self.sock.recv()
+            else:
+                payload = self.sock.recv(flags=socket.MSG_DONTWAIT)
+        except (socket.timeout, BlockingIOError):
+            return None
+        self.last_rx_time = time.perf_counter()
+        return payload
+
+    def recv(self, block=False, timeout=None):
+        """receive() with the argument order of can-isotp stacks, for scripts written against them"""
+        return self.receive(timeout=timeout, block=block)
 
 class UDSResponder:
     """UDS Response Handler"""
-    def __init__(self, test_case_file='IMS_response.json'):
+
+    # Built-in pattern rules, added after the test case file so its entries win
+    DEFAULT_RULES = [
+        # RoutineControl check with a 512 byte record
+        {"req": "31 01 D0 02 *", "len": 516, "res": "71 01 D0 02 00"},
+        # RequestDownload of any memory area, maxNumberOfBlockLength 0x0FFA
+        {"req": "34 *", "res": "74 20 0F FA"},
+        # RequestTransferExit
+        {"req": "37 *", "res": "77"},
+        # TransferData: echo the block sequence counter
+        {"req": "36 ?? *", "res": "76 {1}"},
+        # TransferData without sequence counter: incorrect message length
+        {"req": "36", "res": "7F 36 13"},
+    ]
+
+    # Upper bound for a blocking receive, only limits how fast stop_receiving returns
+    RECEIVE_TIMEOUT = 0.1
+
+    def __init__(self, test_case_file='IMS_response.json', verbose=True):
         """
         Initialize UDS responder
         :param test_case_file: Test case file
+        :param verbose: Print every request and response
         """
+        self.verbose = verbose
         self.cfg = Config()
         if not self.cfg.load_case(test_case_file):
             raise FileNotFoundError(f"Failed to load test case file: {test_case_file}")
+        self.cfg.add_cases(self.DEFAULT_RULES)
         self.running = False
         self.receive_thread = None
         self.isotp_layer = None
+        self.latency = LatencyHistogram("UDS response latency")
+        # Optional TraceLogger, gets one event per answered request
+        self.trace = None
         
-    def start_receiving(self, isotp_layer):
-        """Start receiving thread"""
+    def start_receiving(self, isotp_layer, mode='blocking'):
+        """
+        Start receiving thread
+        :param isotp_layer: ISOTPLayer instance
+        :param mode: 'blocking' wakes as soon as the ISOTP stack completes a request,
+                     'poll' is the old receive + sleep(0.01) loop
+        """
+        if mode == 'blocking':
+            target = self._receive_loop
+        elif mode == 'poll':
+            target = self._poll_loop
+        else:
+            raise ValueError(f"Unsupported receive mode: {mode}")
         self.isotp_layer = isotp_layer
         self.running = True
-        self.receive_thread = threading.Thread(target=self._receive_loop)
+        self.receive_thread = threading.Thread(target=target)
         self.receive_thread.daemon = True
         self.receive_thread.start()
         
@@ -187,60 +422,75 @@ class UDSResponder:
             self.receive_thread.join()
             
     def _receive_loop(self):
-        """Receiving loop"""
+        """Receiving loop, blocks on the ISOTP RX queue"""
+        while self.running:
+            try:
+                payload = self.isotp_layer.receive(timeout=self.RECEIVE_TIMEOUT, block=True)
+                if payload:
+                    self._handle_request(payload)
+            except Exception as e:
+                print(f"[UDS] Reception processing error: {e}")
+
+    def _poll_loop(self):
+        """Legacy polling loop"""
         while self.running:
             try:
                 payload = self.isotp_layer.receive(timeout=0.01)
                 if payload:
-                    response = self.process_request(payload)
-                    self.isotp_layer.send(response)
+                    self._handle_request(payload)
             except Exception as e:
                 print(f"[UDS] Reception processing error: {e}")
             time.sleep(0.01)
 
+    def _handle_request(self, payload):
+        """Answer one request and record latency from the last request frame"""
+        wake_time = time.perf_counter()
+        rx_time = getattr(self.isotp_layer, 'last_rx_time', None)
+        if rx_time is None or rx_time > wake_time:
+            rx_time = wake_time
+        response = self.process_request(payload)
+        self.isotp_layer.send(response)
+        elapsed = time.perf_counter() - rx_time
+        self.latency.record(elapsed)
+        if self.trace is not None:
+            self.trace.log_event(f"UDS {bytes(payload[:16]).hex().upper()} ({len(payload)}) -> "
+                                 f"{bytes(response[:16]).hex().upper()} ({len(response)}) {elapsed * 1000:.2f}ms")
+
+    def get_latency_stats(self):
+        """
+        Get response latency statistics
+        :return: dict, see LatencyHistogram.snapshot
+        """
+        return self.latency.snapshot()
+
     def process_request(self, payload):
         """
         Process UDS request and generate response
         :param payload: Request data
         :return: Response data
         """
-        hex_req = payload.hex().upper()
-        current_time = time.time()
-        milliseconds = int((current_time - int(current_time)) * 1000)
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time)) + f'.{milliseconds:03d}'
-        print(f"[UDS] [{timestamp}] Received request: {hex_req}")
+        if self.verbose:
+            self._log(f"Received request: {payload.hex().upper()}")
         
-        if len(payload) == 516 and payload[0] == 0x31:  # Check if first byte is 0x36
-            if payload[1] == 0x01: 
-                if payload[2] == 0xD0 and payload[3] == 0x02:
-                    return bytes([0x71,0x01,0xD0,0x02,0x00])  # Return 0x76 and sequence number
-            else:
-                return self._create_negative_response(0x31, 0x11)  # Return length error if no sequence number
-        
-        # Handle transfer data request
-        if len(payload) > 0 and payload[0] == 0x36:  # Check if first byte is 0x36
-            if len(payload) > 1:
-                seq_number = payload[1]  # Get second byte as sequence number
-                return bytes([0x76, seq_number])  # Return 0x76 and sequence number
-            else:
-                return self._create_negative_response(0x36, 0x13)  # Return length error if no sequence number
-        
-        # Handle other requests
-        response_hex = self.cfg.find_case(hex_req)
-        if response_hex:
-            current_time = time.time()
-            milliseconds = int((current_time - int(current_time)) * 1000)
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time)) + f'.{milliseconds:03d}'
-            print(f"[UDS] [{timestamp}] Sending response: {response_hex}")
-            return bytes.fromhex(response_hex)
+        # Exact cases first, then pattern rules (including DEFAULT_RULES)
+        response = self.cfg.find_response(payload)
+        if response is not None:
+            if self.verbose:
+                self._log(f"Sending response: {response.hex().upper()}")
+            return response
 
         # If no matching response found, return negative response
         nrc_response = self._create_negative_response(payload[0], 0x11)
+        if self.verbose:
+            self._log(f"Sending negative response: {nrc_response.hex().upper()}")
+        return nrc_response
+
+    def _log(self, text):
+        """Print with a millisecond timestamp"""
         current_time = time.time()
         milliseconds = int((current_time - int(current_time)) * 1000)
         timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time)) + f'.{milliseconds:03d}'
-        print(f"[UDS] [{timestamp}] Sending negative response: {nrc_response.hex().upper()}")
-        return nrc_response
+        print(f"[UDS] [{timestamp}] {text}")
 
     def _create_negative_response(self, sid, nrc):
         """Generate negative response"""
@@ -277,6 +527,7 @@ def main():
     finally:
         if 'responder' in locals():
             responder.stop_receiving()
+            print(responder.latency)
         if 'isotp_layer' in locals():
             isotp_layer.stop()
         if 'bus' in locals():
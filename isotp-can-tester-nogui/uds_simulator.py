@@ -0,0 +1,278 @@
+import argparse
+import collections
+import json
+import threading
+import time
+
+import can
+import isotp
+
+from latency_histogram import LatencyHistogram
+from rx_filters import add_rx_filters
+from trace_logger import TraceLogger
+from uds_server_common import CANBusFactory, ISOTPLayer, UDSResponder
+
+class SimulatedNode:
+    """One simulated ECU: thread-less ISOTP state machine plus a UDS responder"""
+    def __init__(self, name, bus, rxid, txid, responder, params):
+        """
+        Initialize node
+        :param name: Node name from the node description file
+        :param bus: Shared CAN bus used for transmission
+        :param rxid: Physical request ID the node listens on
+        :param txid: Response ID
+        :param responder: UDSResponder producing the responses
+        :param params: ISOTP parameters
+        """
+        self.name = name
+        self.bus = bus
+        self.rxid = rxid
+        self.txid = txid
+        self.responder = responder
+        self.inbox = collections.deque()
+        self.last_rx_time = None
+        self.latency = LatencyHistogram(f"{name} response latency")
+        self.layer = isotp.TransportLayerLogic(
+            rxfn=self._rxfn,
+            txfn=self._txfn,
+            address=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=txid, rxid=rxid),
+            params=params
+        )
+
+    def _rxfn(self, timeout):
+        """Non-blocking read from the frames routed to this node"""
+        try:
+            return self.inbox.popleft()
+        except IndexError:
+            return None
+
+    def _txfn(self, msg):
+        self.bus.send(can.Message(
+            arbitration_id=msg.arbitration_id,
+            data=msg.data,
+            is_extended_id=msg.is_extended_id,
+            is_fd=msg.is_fd,
+            bitrate_switch=msg.bitrate_switch
+        ))
+
+    def service(self):
+        """
+        Run the ISOTP state machine and answer completed requests
+        :return: Seconds until the node needs servicing again, None when idle
+        """
+        layer = self.layer
+        layer.process()
+        while layer.available():
+            payload = layer.recv()
+            rx_time = self.last_rx_time or time.perf_counter()
+            layer.send(self.responder.process_request(payload))
+            layer.process()
+            self.latency.record(time.perf_counter() - rx_time)
+
+        if layer.is_tx_transmitting_cf():
+            return layer.next_cf_delay()
+        if self.inbox:
+            return 0
+        if layer.transmitting() or layer.is_rx_active():
+            return MultiNodeSimulator.ACTIVE_POLL  # Waiting for FC/CF, only timeouts need checking
+        return None
+
+class _NodeDispatcher(can.Listener):
+    """Routes received frames to nodes by arbitration ID, runs on the notifier thread"""
+    def __init__(self, simulator):
+        self.nodes = simulator.nodes
+        self.ready = simulator.ready
+        self.wakeup = simulator.wakeup
+        self.ignored = 0
+
+    def on_message_received(self, msg):
+        node = self.nodes.get(msg.arbitration_id)
+        if node is None or msg.is_error_frame or msg.is_remote_frame:
+            self.ignored += 1
+            return
+        node.last_rx_time = time.perf_counter()
+        node.inbox.append(isotp.CanMessage(
+            arbitration_id=msg.arbitration_id,
+            data=msg.data,
+            extended_id=msg.is_extended_id,
+            is_fd=msg.is_fd,
+            bitrate_switch=msg.bitrate_switch
+        ))
+        self.ready.append(node)
+        self.wakeup.set()
+
+class MultiNodeSimulator:
+    """Hosts many simulated ECUs on one bus with a single dispatch and a single engine thread"""
+
+    # Service interval while a node waits for flow control or consecutive frames
+    ACTIVE_POLL = 0.005
+    # Engine wakeup interval when all nodes are idle, only bounds stop() latency
+    IDLE_TIMEOUT = 0.1
+
+    def __init__(self, bus, notifier):
+        """
+        Initialize simulator
+        :param bus: CAN bus instance shared by all nodes
+        :param notifier: Notifier of that bus, its thread does the RX dispatch
+        """
+        self.bus = bus
+        self.notifier = notifier
+        self.nodes = {}                     # rxid -> SimulatedNode
+        self.ready = collections.deque()    # Nodes with new frames, filled by the dispatcher
+        self.wakeup = threading.Event()
+        self.dispatcher = _NodeDispatcher(self)
+        self.running = False
+        self.engine_thread = None
+
+    def add_node(self, name, rxid, txid, responder, params=None):
+        """
+        Add a simulated node
+        :param name: Node name
+        :param rxid: Request ID the node answers
+        :param txid: Response ID
+        :param responder: UDSResponder instance, can be shared between nodes
+        :param params: ISOTP parameters, defaults to ISOTPLayer.DEFAULT_PARAMS
+        :return: SimulatedNode or None if the request ID is already taken
+        """
+        if rxid in self.nodes:
+            print(f"[SIM] Skipping {name}: request ID {rxid:#05X} already used by {self.nodes[rxid].name}")
+            return None
+        node = SimulatedNode(name, self.bus, rxid, txid, responder, params or ISOTPLayer.DEFAULT_PARAMS)
+        self.nodes[rxid] = node
+        add_rx_filters(self.bus, [rxid])
+        return node
+
+    def load_nodes(self, node_file, test_case_file, params=None, verbose=True):
+        """
+        Add every node of a node description file
+        A node entry may carry its own "case_file", otherwise test_case_file is used.
+        :param node_file: Node description JSON (CAN_Nodes list)
+        :param test_case_file: Default test case file
+        :param params: ISOTP parameters
+        :param verbose: Print every request and response
+        """
+        with open(node_file, 'r') as file:
+            data = json.load(file)
+
+        responders = {}
+        for entry in data['CAN_Nodes']:
+            case_file = entry.get('case_file', test_case_file)
+            if case_file not in responders:
+                responders[case_file] = UDSResponder(case_file, verbose=verbose)
+            node = self.add_node(
+                entry['node_id'],
+                int(entry['phyreq_address'], 16),
+                int(entry['resp_address'], 16),
+                responders[case_file],
+                params
+            )
+            if node:
+                print(f"[SIM] {node.name:<6} RXID: {node.rxid:#05X}  TXID: {node.txid:#05X}  cases: {case_file}")
+
+    def start(self):
+        """Start dispatching and serving requests"""
+        self.running = True
+        self.notifier.add_listener(self.dispatcher)
+        self.engine_thread = threading.Thread(target=self._engine_loop, daemon=True)
+        self.engine_thread.start()
+        print(f"[SIM] Serving {len(self.nodes)} nodes")
+
+    def stop(self):
+        """Stop serving requests"""
+        self.running = False
+        self.wakeup.set()
+        try:
+            self.notifier.remove_listener(self.dispatcher)
+        except ValueError:
+            pass
+        if self.engine_thread:
+            self.engine_thread.join()
+            self.engine_thread = None
+
+    def _engine_loop(self):
+        """Single thread running every active node's ISOTP state machine"""
+        active = set()
+        timeout = self.IDLE_TIMEOUT
+        while self.running:
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            while self.ready:
+                active.add(self.ready.popleft())
+
+            timeout = self.IDLE_TIMEOUT
+            for node in list(active):
+                try:
+                    delay = node.service()
+                except Exception as e:
+                    print(f"[SIM] {node.name} processing error: {e}")
+                    delay = None
+                if delay is None:
+                    active.discard(node)
+                elif delay < timeout:
+                    timeout = delay
+
+    def print_stats(self):
+        """Print per-node latency statistics"""
+        for node in self.nodes.values():
+            if node.latency.count:
+                print(node.latency)
+        print(f"[SIM] Frames ignored by dispatcher: {self.dispatcher.ignored}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate all nodes of a node description file on one CAN bus")
+    parser.add_argument('--interface', default='pcan', choices=['pcan', 'vector', 'slcan', 'socketcan'])
+    parser.add_argument('--channel', help="socketcan channel, slcan port or PCAN handle (e.g. 0x51)")
+    parser.add_argument('--bitrate', type=int, default=500000)
+    parser.add_argument('--fd', action='store_true', help="Use CAN-FD with 64 byte ISOTP frames")
+    parser.add_argument('--nodes', default='Node_Description.json')
+    parser.add_argument('--cases', default='IMS_response.json')
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not print every request/response")
+    parser.add_argument('--trace', help="Record all frames, e.g. soak.blf or trace.asc")
+    parser.add_argument('--trace-max-bytes', type=int, default=0, help="Rotate the trace at this size")
+    parser.add_argument('--trace-compress', choices=['gzip', 'zstd'], help="Compress finished trace files")
+    args = parser.parse_args()
+
+    bus_config = {'bitrate': args.bitrate, 'fd': args.fd}
+    if args.channel:
+        if args.interface == 'pcan':
+            bus_config['handle'] = int(args.channel, 0)
+        elif args.interface == 'slcan':
+            bus_config['port'] = args.channel
+        else:
+            bus_config['channel'] = args.channel
+
+    params = dict(ISOTPLayer.DEFAULT_PARAMS)
+    if args.fd:
+        params['can_fd'] = True
+        params['tx_data_length'] = 64
+
+    try:
+        can_factory = CANBusFactory(channel_type=args.interface, is_fd=args.fd, **bus_config)
+        bus, notifier = can_factory.create_bus()
+        if args.trace:
+            trace = TraceLogger(args.trace, max_bytes=args.trace_max_bytes, compress=args.trace_compress)
+            trace.attach(notifier, bus)
+
+        simulator = MultiNodeSimulator(bus, notifier)
+        simulator.load_nodes(args.nodes, args.cases, params=params, verbose=not args.quiet)
+        simulator.start()
+
+        while True:
+            time.sleep(0.1)
+
+    except KeyboardInterrupt:
+        print("[System] User interrupted operation")
+    finally:
+        if 'simulator' in locals():
+            simulator.stop()
+            simulator.print_stats()
+        if 'notifier' in locals():
+            notifier.stop()
+        if 'trace' in locals():
+            trace.stop()
+            print(f"[TRACE] {trace.written} records, {trace.dropped} dropped: {', '.join(trace.files)}")
+        if 'bus' in locals():
+            bus.shutdown()
+
+if __name__ == "__main__":
+    main()